@@ -1,8 +1,14 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.db import transaction
 from django.forms import BaseInlineFormSet
 from backend.models import Shop, Category, User, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, \
-    Contact, ConfirmEmailToken
+    Contact, ConfirmEmailToken, ArchivedOrder, ArchivedOrderItem, OutboxEvent, PriceHistory, OrderTemplate, \
+    OrderTemplateItem, ShopWebhook, WebhookDelivery, SalesRollup
+from backend.importer import parse_parameter_value, record_prices, refresh_parameters
+from backend.order_templates import next_run_at
+from backend.outbox import publish
+from backend.versions import bump_order_version
 
 
 @admin.register(User)
@@ -25,12 +31,17 @@ class CustomUserAdmin(UserAdmin):
 
 @admin.register(Shop)
 class ShopAdmin(admin.ModelAdmin):
-    list_display = ('name', 'url', 'filename', 'state')
+    list_display = ('name', 'url', 'filename', 'state', 'poll_interval', 'next_poll_at')
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        publish('catalog.updated', shop_ids=[obj.id])
 
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name',)
+    list_display = ('id', 'name', 'parent', 'path')
+    readonly_fields = ('path',)
 
 
 @admin.register(Product)
@@ -41,28 +52,91 @@ class ProductAdmin(admin.ModelAdmin):
 @admin.register(ProductInfo)
 class ProductInfoAdmin(admin.ModelAdmin):
     list_display = ('id', 'product', 'shop', 'quantity', 'price', 'price_rrc')
+    readonly_fields = ('parameters',)  # собирается из ProductParameter
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change or {'price', 'price_rrc'} & set(form.changed_data):
+            record_prices(obj.shop_id, {}, {obj.product_id: [obj.price, obj.price_rrc]})
+        shop_ids, product_ids = {obj.shop_id}, {obj.product_id}
+        if change:  # предложение могло быть перенесено в другой магазин или товар
+            shop_ids.add(form.initial.get('shop', obj.shop_id))
+            product_ids.add(form.initial.get('product', obj.product_id))
+        publish('catalog.updated', shop_ids=sorted(shop_ids), product_ids=sorted(product_ids))
 
 
 @admin.register(Parameter)
 class ParameterAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name')
+    list_display = ('id', 'name', 'code')
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'name' in form.changed_data:  # название параметра - ключ в документах параметров
+            product_info_ids = list(obj.product_parameter.values_list('product_info_id', flat=True))
+            publish('catalog.updated', shop_ids=refresh_parameters(product_info_ids))
 
 
 @admin.register(ProductParameter)
 class ProductParameterAdmin(admin.ModelAdmin):
-    list_display = ('id', 'product_info', 'parameter', 'value')
+    list_display = ('id', 'product_info', 'parameter', 'value', 'value_number', 'value_bool')
+
+    def save_model(self, request, obj, form, change):
+        for field, value in parse_parameter_value(obj.value).items():
+            setattr(obj, field, value)
+        super().save_model(request, obj, form, change)
+        product_info_ids = [obj.product_info_id]
+        if change and 'product_info' in form.changed_data:  # параметр перенесен в другое предложение
+            product_info_ids.append(form.initial['product_info'])
+        publish('catalog.updated', shop_ids=refresh_parameters(product_info_ids))
+
+    def delete_queryset(self, request, queryset):
+        product_info_ids = list(queryset.values_list('product_info_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        publish('catalog.updated', shop_ids=refresh_parameters(product_info_ids))
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        publish('catalog.updated', shop_ids=refresh_parameters([obj.product_info_id]))
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'dt', 'state')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        publish('order.updated', user_id=obj.user_id, order_id=obj.id, state=obj.state)
+        transaction.on_commit(lambda: bump_order_version(obj.user_id))
+
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
     list_display = ('id', 'order', 'product_info', 'quantity')
 
 
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'dt', 'state', 'total_sum', 'archived_at')
+
+
+@admin.register(SalesRollup)
+class SalesRollupAdmin(admin.ModelAdmin):
+    list_display = ('shop', 'day', 'product', 'orders', 'units', 'revenue', 'canceled_units', 'delivered_units')
+    list_filter = ('shop',)
+    raw_id_fields = ('shop', 'product')
+
+
+@admin.register(ArchivedOrderItem)
+class ArchivedOrderItemAdmin(admin.ModelAdmin):
+    list_display = ('id', 'order', 'shop', 'product_name', 'quantity', 'price')
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'topic', 'created_at', 'processed_at', 'attempts', 'next_attempt_at')
+    list_filter = ('topic',)
+
+
 @admin.register(Contact)
 class ContactAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'apt', 'building', 'street', 'city', 'house', 'phone')
@@ -70,4 +144,44 @@ class ContactAdmin(admin.ModelAdmin):
 
 @admin.register(ConfirmEmailToken)
 class ConfirmEmailTokenAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'created_at', 'key')
\ No newline at end of file
+    list_display = ('id', 'user', 'created_at', 'key')
+
+
+@admin.register(PriceHistory)
+class PriceHistoryAdmin(admin.ModelAdmin):
+    list_display = ('product', 'shop', 'price', 'price_rrc', 'changed_at')
+    list_filter = ('shop',)
+    raw_id_fields = ('product', 'shop')
+
+
+class OrderTemplateItemInline(admin.TabularInline):
+    model = OrderTemplateItem
+    raw_id_fields = ('product', 'shop')
+    extra = 0
+
+
+@admin.register(OrderTemplate)
+class OrderTemplateAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'user', 'run_time', 'next_run_at', 'last_run_at')
+    inlines = [OrderTemplateItemInline]
+    readonly_fields = ('last_result',)
+
+    def save_model(self, request, obj, form, change):
+        if 'run_time' in form.changed_data:
+            obj.next_run_at = next_run_at(obj.run_time)
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(ShopWebhook)
+class ShopWebhookAdmin(admin.ModelAdmin):
+    list_display = ('id', 'shop', 'url', 'is_active', 'created_at')
+    list_filter = ('is_active',)
+
+
+@admin.register(WebhookDelivery)
+class WebhookDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'webhook', 'state', 'attempts', 'next_attempt_at', 'delivered_at')
+    list_filter = ('state',)
+    raw_id_fields = ('webhook',)
+    exclude = ('body',)
+    readonly_fields = ('last_error',)
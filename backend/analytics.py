@@ -0,0 +1,196 @@
+"""
+Сводка продаж магазинов (SalesRollup): заказанные, отмененные и доставленные единицы товара и их сумма
+по магазину, товару и дню оформления заказа. partner/analytics читает только сводку, без позиций заказов.
+
+Сводка обновляется приращениями. В заказе хранится статус, по которому он учтен в сводке (rollup_state):
+потребитель событий order.new и order.updated приводит вклад заказа к его текущему статусу под блокировкой
+строки заказа, поэтому повторная обработка события и смена статуса туда и обратно не искажают сводку.
+Заказ, отменяемый покупателем, удаляется вместе с позициями, поэтому отмена учитывается в транзакции удаления.
+Сумма позиции считается по цене предложения в момент учета, для архивных заказов - по цене на момент архивации.
+
+Полный пересчет (rebuild) сбрасывает сводку и отметки заказов, затем учитывает заказы частями по id теми же
+функциями, что и потребитель событий: заказ, учтенный частью пересчета, потребитель пропускает, и наоборот.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from backend.models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem, ProductInfo, SalesRollup
+
+COLUMNS = ('orders', 'units', 'revenue', 'canceled_units', 'canceled_revenue', 'delivered_units',
+           'delivered_revenue')
+METRICS = COLUMNS + ('net_units', 'net_revenue')  # net - без отмененных
+UNPLACED_STATES = ('basket', 'in_process')
+# части сводки, в которые входит заказ в учтенном статусе: '' - заказано, иначе префикс колонок
+STATE_METRICS = {'': (), 'new': ('',), 'canceled': ('', 'canceled_'), 'delivered': ('', 'delivered_')}
+
+
+def rollup_state(state):
+    """
+    Статус заказа для сводки: не оформленные заказы не учитываются, все оформленные кроме отмененных
+    и доставленных учитываются как новые
+    """
+    if state in UNPLACED_STATES:
+        return ''
+    return state if state in STATE_METRICS else 'new'
+
+
+def _add(totals, line, metrics, sign):
+    shop_id, product_id, day, quantity, price = line
+    values = totals.setdefault((shop_id, day, product_id), dict.fromkeys(COLUMNS, 0))
+    for prefix in metrics:
+        if not prefix:
+            values['orders'] += sign
+        values[f'{prefix}units'] += sign * quantity
+        values[f'{prefix}revenue'] += sign * quantity * price
+
+
+def _apply(totals):
+    """
+    Прибавление приращений к строкам сводки одним upsert'ом на строку (PostgreSQL и SQLite)
+    \n:param totals: словарь {(id магазина, день, id товара): {колонка: приращение}}
+    """
+    rows = [(shop_id, day, product_id, *(values[column] for column in COLUMNS))
+            for (shop_id, day, product_id), values in sorted(totals.items()) if any(values.values())]
+    if not rows:
+        return
+    quote, table = connection.ops.quote_name, connection.ops.quote_name(SalesRollup._meta.db_table)
+    columns = ('shop_id', 'day', 'product_id') + COLUMNS
+    sql = (f'INSERT INTO {table} ({", ".join(map(quote, columns))}) VALUES ({", ".join(["%s"] * len(columns))}) '
+           f'ON CONFLICT ({", ".join(map(quote, columns[:3]))}) DO UPDATE SET '
+           + ', '.join(f'{quote(column)} = {table}.{quote(column)} + EXCLUDED.{quote(column)}' for column in COLUMNS))
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def _order_lines(order_ids):
+    lines = {}
+    for order_id, dt, shop_id, product_id, quantity, price in OrderItem.objects.filter(
+            order_id__in=order_ids).values_list('order_id', 'order__dt', 'product_info__shop_id',
+                                                'product_info__product_id', 'quantity', 'product_info__price'):
+        lines.setdefault(order_id, []).append((shop_id, product_id, timezone.localdate(dt), quantity, price))
+    return lines
+
+
+def record_orders(order_ids, state=None):
+    """
+    Приведение вклада заказов в сводку к их текущему статусу
+    \n:param order_ids: id заказов
+    \n:param state: статус, учитываемый вместо текущего (отмена заказа перед его удалением)
+    \n:return: количество заказов, вклад которых изменился
+    """
+    with transaction.atomic():
+        changed = {}
+        for order_id, order_state, counted in Order.objects.select_for_update().filter(
+                id__in=order_ids).order_by('id').values_list('id', 'state', 'rollup_state'):
+            target = rollup_state(state or order_state)
+            if target != counted:
+                changed[order_id] = (counted, target)
+        if not changed:
+            return 0
+        totals = {}
+        for order_id, lines in _order_lines(changed).items():
+            counted, target = changed[order_id]
+            for line in lines:
+                _add(totals, line, STATE_METRICS[counted], -1)
+                _add(totals, line, STATE_METRICS[target], 1)
+        _apply(totals)
+        by_state = {}
+        for order_id, (_, target) in changed.items():
+            by_state.setdefault(target, []).append(order_id)
+        for target, ids in by_state.items():
+            Order.objects.filter(id__in=ids).update(rollup_state=target)
+    return len(changed)
+
+
+def record_archived_orders(order_ids):
+    """
+    Учет архивных заказов, еще не попавших в сводку. Позиции, предложение которых удалено
+    при повторном импорте прайса, не учитываются: товар архивной позиции известен только по предложению
+    \n:param order_ids: id архивных заказов
+    \n:return: количество учтенных заказов
+    """
+    with transaction.atomic():
+        orders = dict(ArchivedOrder.objects.select_for_update().filter(id__in=order_ids, rollup_state='').order_by(
+            'id').values_list('id', 'state'))
+        if not orders:
+            return 0
+        items = list(ArchivedOrderItem.objects.filter(order_id__in=orders, shop__isnull=False).values_list(
+            'order_id', 'order__dt', 'shop_id', 'product_info_id', 'quantity', 'price'))
+        products = dict(ProductInfo.objects.filter(id__in={item[3] for item in items}).values_list('id', 'product_id'))
+        totals = {}
+        for order_id, dt, shop_id, product_info_id, quantity, price in items:
+            if product_info_id in products:
+                _add(totals, (shop_id, products[product_info_id], timezone.localdate(dt), quantity, price),
+                     STATE_METRICS[rollup_state(orders[order_id])], 1)
+        _apply(totals)
+        for state in set(orders.values()):
+            ArchivedOrder.objects.filter(id__in=[order_id for order_id, order_state in orders.items()
+                                                 if order_state == state]).update(rollup_state=rollup_state(state))
+    return len(orders)
+
+
+def _pending_chunks(model, chunk_size):
+    """
+    id оформленных заказов, не учтенных в сводке, частями в порядке id
+    """
+    last_id = 0
+    while True:
+        order_ids = list(model.objects.filter(id__gt=last_id, rollup_state='').exclude(
+            state__in=UNPLACED_STATES).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if order_ids:
+            yield order_ids
+        if len(order_ids) < chunk_size:
+            return
+        last_id = order_ids[-1]
+
+
+def rebuild(chunk_size=None):
+    """
+    Полный пересчет сводки: сброс и учет текущих, затем архивных заказов, каждая часть в своей транзакции.
+    Текущие заказы учитываются первыми: заказ, перенесенный в архив после учета, сохраняет отметку, а перенесенный
+    до учета будет учтен по архиву
+    \n:param chunk_size: количество заказов в одной транзакции, по умолчанию ANALYTICS_REBUILD_CHUNK_SIZE
+    \n:return: количество учтенных заказов
+    """
+    chunk_size = chunk_size or settings.ANALYTICS_REBUILD_CHUNK_SIZE
+    with transaction.atomic():
+        SalesRollup.objects.all().delete()
+        Order.objects.exclude(rollup_state='').update(rollup_state='')
+        ArchivedOrder.objects.exclude(rollup_state='').update(rollup_state='')
+    recorded = sum(record_orders(order_ids) for order_ids in _pending_chunks(Order, chunk_size))
+    return recorded + sum(record_archived_orders(order_ids)
+                          for order_ids in _pending_chunks(ArchivedOrder, chunk_size))
+
+
+def _sums():
+    sums = {f'sum_{column}': Sum(column) for column in COLUMNS}
+    sums['sum_net_units'] = Sum('units') - Sum('canceled_units')
+    sums['sum_net_revenue'] = Sum('revenue') - Sum('canceled_revenue')
+    return sums
+
+
+def _metrics(row):
+    return {metric: row[f'sum_{metric}'] or 0 for metric in METRICS}
+
+
+def shop_summary(shop_id, date_from, date_to, top, order_by):
+    """
+    Продажи магазина за период по сводке
+    \n:param shop_id: id магазина
+    \n:param date_from: первый день периода
+    \n:param date_to: последний день периода (включительно)
+    \n:param top: количество товаров в рейтинге
+    \n:param order_by: показатель из METRICS, по которому строится рейтинг товаров
+    \n:return: словарь {"totals": итоги, "days": итоги по дням, "top": лучшие товары}
+    """
+    rollups = SalesRollup.objects.filter(shop_id=shop_id, day__range=(date_from, date_to)).order_by()
+    days = rollups.values('day').annotate(**_sums()).order_by('day')
+    products = rollups.values('product_id', 'product__name').annotate(**_sums()).order_by(
+        f'-sum_{order_by}', 'product_id')[:top]
+    return {
+        'totals': _metrics(rollups.aggregate(**_sums())),
+        'days': [dict(day=row['day'].isoformat(), **_metrics(row)) for row in days],
+        'top': [dict(product=row['product_id'], name=row['product__name'], **_metrics(row)) for row in products],
+    }
@@ -1,11 +1,27 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def create_postgres_indexes(sender, using='default', **kwargs):
+    """
+    Индексы PostgreSQL, которые не описать в Meta модели без django.contrib.postgres:
+    GIN по документу параметров предложения для фильтров parameters @> '{...}'
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE INDEX IF NOT EXISTS backend_productinfo_parameters_gin '
+                       'ON backend_productinfo USING gin (parameters jsonb_path_ops)')
 
 
 class BackendConfig(AppConfig):
     name = 'backend'
 
     def ready(self):
-        import backend.tasks
+        import backend.signals
         """
-        импортируем сигналы
+        импортируем сигналы (задачи Celery импортируются при первом использовании)
         """
+        post_migrate.connect(create_postgres_indexes, sender=self)
@@ -0,0 +1,134 @@
+"""
+Выполнение нескольких запросов к API за один HTTP-запрос (/api/v1/batch).
+
+Подзапросы вызывают представления backend.urls напрямую, минуя middleware. Пользователь, один раз
+аутентифицированный batch-запросом, передается подзапросам так же, как это делает APIRequestFactory
+(_force_auth_user), поэтому токен не проверяется повторно. В режиме atomic все подзапросы выполняются
+в одной транзакции, которая откатывается при первой ошибке, а оставшиеся подзапросы не выполняются.
+Ответы подзапросов с Idempotency-Key в этом режиме сохраняются только после коммита транзакции.
+"""
+import io
+import logging
+from urllib.parse import urlencode
+
+import ujson
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import transaction
+from django.urls import Resolver404, resolve
+
+from backend.idempotency import store_on_commit
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = '/api/v1/'
+FAILED_DEPENDENCY = 424  # статус подзапросов, не выполненных после ошибки в режиме atomic
+# заголовки batch-запроса, которые не должны влиять на подзапросы
+_PARENT_ONLY_META = ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_IDEMPOTENCY_KEY', 'HTTP_IF_NONE_MATCH',
+                     'HTTP_IF_MODIFIED_SINCE', 'HTTP_IF_MATCH', 'HTTP_IF_UNMODIFIED_SINCE')
+
+
+class BatchError(ValueError):
+    """
+    Неверно описанный подзапрос
+    """
+
+
+def _build_request(parent, operation):
+    """
+    Подзапрос на основе окружения batch-запроса
+    \n:param parent: запрос batch
+    \n:param operation: {"method": <str>, "path": <str>, "body": <объект JSON> или "form": {<поле>: <значение>},
+            "headers": {<имя>: <значение>}}
+    \n:return: кортеж (подзапрос, функция представления, аргументы представления)
+    """
+    if not isinstance(operation, dict) or not isinstance(operation.get('path'), str):
+        raise BatchError('Each request must be an object with path')
+    method = str(operation.get('method', 'GET')).upper()
+    path, _, query_string = operation['path'].partition('?')
+    path = API_PREFIX + (path[len(API_PREFIX):] if path.startswith(API_PREFIX) else path.lstrip('/'))
+    try:
+        match = resolve(path)
+    except Resolver404:
+        raise BatchError(f'Unknown path: {operation["path"]}')
+    if match.namespace != 'backend' or match.url_name == 'batch':
+        raise BatchError(f'Path is not allowed in batch: {operation["path"]}')
+
+    if operation.get('form') is not None:  # для представлений, ожидающих строковые значения формы
+        body, content_type = urlencode(operation['form'], doseq=True).encode(), 'application/x-www-form-urlencoded'
+    elif operation.get('body') is not None:
+        body, content_type = ujson.dumps(operation['body'], ensure_ascii=False).encode(), 'application/json'
+    else:
+        body, content_type = b'', 'application/json'
+    meta = {key: value for key, value in parent.META.items() if key not in _PARENT_ONLY_META}
+    meta.update({
+        'REQUEST_METHOD': method, 'PATH_INFO': path, 'SCRIPT_NAME': '', 'QUERY_STRING': query_string,
+        'CONTENT_TYPE': content_type, 'CONTENT_LENGTH': str(len(body)), 'wsgi.input': io.BytesIO(body),
+    })
+    for name, value in (operation.get('headers') or {}).items():
+        meta['HTTP_' + name.upper().replace('-', '_')] = str(value)
+    request = WSGIRequest(meta)
+    if getattr(parent, 'user', None) is not None and parent.user.is_authenticated:
+        request._force_auth_user, request._force_auth_token = parent.user, getattr(parent, 'auth', None)
+    return request, match.func, match.kwargs
+
+
+def _execute(parent, operation):
+    """
+    Выполнение подзапроса
+    \n:return: {"status": <int>, "body": <ответ представления>}
+    """
+    try:
+        request, view, kwargs = _build_request(parent, operation)
+    except BatchError as error:
+        return {'status': 400, 'body': {'Status': False, 'Errors': str(error)}}
+    try:
+        response = view(request, **kwargs)
+    except Exception:  # ошибка одного подзапроса не должна прерывать ответ на остальные
+        logger.exception('Batch request to %s failed', request.path)
+        return {'status': 500, 'body': {'Status': False, 'Errors': 'Internal server error'}}
+    if getattr(response, 'streaming', False):
+        return {'status': 400, 'body': {'Status': False, 'Errors': 'Streaming responses are not supported in batch'}}
+    if hasattr(response, 'render'):
+        response.render()
+    result = {'status': response.status_code}
+    content_type = response.get('Content-Type', '')
+    if response.content and content_type.startswith('application/json'):
+        result['body'] = ujson.loads(response.content)
+    elif response.content:
+        result['body'] = response.content.decode(response.charset or 'utf-8', errors='replace')
+    for header in ('ETag', 'Location'):
+        if response.has_header(header):
+            result.setdefault('headers', {})[header] = response[header]
+    return result
+
+
+def failed(result):
+    """
+    Подзапрос завершился ошибкой: статус 4xx/5xx или {"Status": false} в теле ответа
+    """
+    body = result.get('body')
+    return result['status'] >= 400 or (isinstance(body, dict) and body.get('Status') is False)
+
+
+def execute(parent, operations, atomic=False):
+    """
+    Выполнение подзапросов по порядку
+    \n:param parent: запрос batch
+    \n:param operations: список описаний подзапросов
+    \n:param atomic: выполнять в одной транзакции и прекращать выполнение при первой ошибке
+    \n:return: кортеж (ответы подзапросов, номер первого неудачного подзапроса в режиме atomic или None)
+    """
+    if not atomic:
+        return [_execute(parent, operation) for operation in operations], None
+    results, failed_index = [], None
+    with store_on_commit(), transaction.atomic():
+        for index, operation in enumerate(operations):
+            result = _execute(parent, operation)
+            results.append(result)
+            if failed(result):
+                failed_index = index
+                transaction.set_rollback(True)
+                break
+    results += [{'status': FAILED_DEPENDENCY, 'body': {'Status': False, 'Errors': 'Not executed'}}
+                for _ in operations[len(results):]]
+    return results, failed_index
@@ -0,0 +1,319 @@
+"""
+Снимок каталога в памяти процесса только для чтения: категории, магазины, товары, параметры и предложения.
+
+Снимок загружается воркером при первом обращении и перечитывается, когда меняется счетчик версий каталога
+(backend.versions). Ответ из памяти дается только при совпадении версии снимка с текущей: пока один поток
+перечитывает каталог, остальные запросы идут в базу, как и при недоступном кэше версий. Перечитывание
+не чаще CATALOG_SNAPSHOT_RELOAD_INTERVAL, во время него в памяти находятся оба снимка.
+
+Предложения хранятся колонками array в порядке id (поиск bisect) с индексом по товару и цене,
+повторяющиеся модели и документы параметров хранятся один раз. Включается настройкой CATALOG_SNAPSHOT_ENABLED.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from ujson import dumps as dump_json, loads as load_json
+
+from backend.models import Category, Shop, Product, ProductInfo, Parameter
+from backend.versions import CATALOG_VERSION_KEY, _read
+
+
+class CatalogCategory:
+    __slots__ = ('id', 'name', 'path', 'product_ids')
+
+    def __init__(self, id, name, path):
+        self.id, self.name, self.path, self.product_ids = id, name, path, array('q')
+
+
+class CatalogShop:
+    __slots__ = ('id', 'name', 'state')
+
+    def __init__(self, id, name, state):
+        self.id, self.name, self.state = id, name, state
+
+
+class CatalogProduct:
+    __slots__ = ('id', 'name', 'category_id')
+
+    def __init__(self, id, name, category_id):
+        self.id, self.name, self.category_id = id, name, category_id
+
+
+class CatalogParameter:
+    __slots__ = ('id', 'name', 'code')
+
+    def __init__(self, id, name, code):
+        self.id, self.name, self.code = id, name, code
+
+
+class CatalogSnapshot:
+    """
+    Неизменяемый снимок каталога
+    """
+    __slots__ = ('version', 'categories', 'shops', 'products', 'parameters', 'offer_ids', 'product_ids', 'shop_ids',
+                 'quantities', 'prices', 'prices_rrc', 'model_refs', 'document_refs', 'models', 'documents',
+                 'by_product', 'by_product_keys')
+
+    def __init__(self, version, categories, shops, products, parameters, offers):
+        """
+        Построение снимка из строк таблиц
+        \n:param version: версия каталога, прочитанная до загрузки строк
+        \n:param categories: строки (id, название, путь)
+        \n:param shops: строки (id, название, статус получения заказов)
+        \n:param products: строки (id, название, id категории) в порядке возрастания id
+        \n:param parameters: строки (id, название, код)
+        \n:param offers: строки (id, id товара, id магазина, модель, количество, цена, рекомендуемая цена, параметры)
+        в порядке возрастания id
+        """
+        self.version = version
+        self.categories = {row[0]: CatalogCategory(*row) for row in categories}
+        self.shops = {row[0]: CatalogShop(*row) for row in shops}
+        self.parameters = {row[0]: CatalogParameter(*row) for row in parameters}
+        self.products = {}
+        for product_id, name, category_id in products:
+            self.products[product_id] = CatalogProduct(product_id, name, category_id)
+            if category_id in self.categories:
+                self.categories[category_id].product_ids.append(product_id)
+
+        self.offer_ids, self.product_ids, self.shop_ids = array('q'), array('q'), array('q')
+        self.quantities, self.prices, self.prices_rrc = array('i'), array('i'), array('i')
+        self.model_refs, self.document_refs = array('i'), array('i')
+        self.models, self.documents = [], []
+        model_refs, document_refs = {}, {}
+        for offer_id, product_id, shop_id, model, quantity, price, price_rrc, document in offers:
+            if product_id not in self.products or shop_id not in self.shops:
+                continue  # создано после чтения товаров или магазинов, попадет в следующий снимок
+            document = dump_json(document or {}, ensure_ascii=False)
+            if model not in model_refs:
+                model_refs[model] = len(self.models)
+                self.models.append(model)
+            if document not in document_refs:
+                document_refs[document] = len(self.documents)
+                self.documents.append(document)
+            self.offer_ids.append(offer_id)
+            self.product_ids.append(product_id)
+            self.shop_ids.append(shop_id)
+            self.quantities.append(quantity)
+            self.prices.append(price)
+            self.prices_rrc.append(price_rrc)
+            self.model_refs.append(model_refs[model])
+            self.document_refs.append(document_refs[document])
+
+        # предложения товара подряд, от дешевых к дорогим; при равной цене - по id, как в backend.offers
+        product_ids, prices = self.product_ids, self.prices
+        self.by_product = array('i', sorted(range(len(product_ids)),
+                                            key=lambda index: (product_ids[index] << 32) | prices[index]))
+        self.by_product_keys = array('q', (product_ids[index] for index in self.by_product))
+
+    def __len__(self):
+        return len(self.offer_ids)
+
+    def offer_index(self, offer_id):
+        """
+        Позиция предложения в колонках
+        \n:return: индекс или None, если предложения нет в снимке
+        """
+        index = bisect_left(self.offer_ids, offer_id)
+        if index < len(self.offer_ids) and self.offer_ids[index] == offer_id:
+            return index
+        return None
+
+    def has_offer(self, offer_id):
+        return self.offer_index(offer_id) is not None
+
+    def parameter_ids(self, codes):
+        """
+        id параметров по кодам для фильтров products?<код>=<значение>
+        \n:return: словарь {код: id} для известных кодов
+        """
+        return {parameter.code: parameter.id for parameter in self.parameters.values() if parameter.code in codes}
+
+    def product_offers(self, product_id):
+        """
+        Позиции предложений товара от дешевых к дорогим
+        """
+        start = bisect_left(self.by_product_keys, product_id)
+        return self.by_product[start:bisect_right(self.by_product_keys, product_id, start)]
+
+    def offer(self, index):
+        """
+        Предложение в формате ProductInfoSerializer
+        """
+        product = self.products[self.product_ids[index]]
+        category = self.categories.get(product.category_id)
+        return {
+            'id': self.offer_ids[index],
+            'model': self.models[self.model_refs[index]],
+            'product': {'id': product.id, 'name': product.name, 'category': category.name if category else None},
+            'shop': self.shop_ids[index],
+            'quantity': self.quantities[index],
+            'price': self.prices[index],
+            'price_rrc': self.prices_rrc[index],
+            'product_parameters': [{'parameter': name, 'value': value} for name, value in load_json(
+                self.documents[self.document_refs[index]]).items()],
+        }
+
+    def subtree(self, category_id):
+        """
+        Категория и все вложенные в нее категории
+        """
+        category = self.categories.get(category_id)
+        if category is None or not category.path:
+            return [category] if category else []
+        return [item for item in self.categories.values() if item.path.startswith(category.path)]
+
+    def find_offers(self, shop_id=None, category_id=None):
+        """
+        Предложения магазинов, принимающих заказы, в порядке id
+        \n:param shop_id: только предложения магазина
+        \n:param category_id: только товары категории и вложенных в нее категорий
+        \n:return: список предложений в формате ProductInfoSerializer
+        """
+        active = {shop.id for shop in self.shops.values() if shop.state and shop_id in (None, shop.id)}
+        if category_id is not None:
+            indexes = sorted(index for category in self.subtree(category_id) for product_id in category.product_ids
+                             for index in self.product_offers(product_id))
+        else:
+            indexes = range(len(self.offer_ids))
+        shop_ids = self.shop_ids
+        return [self.offer(index) for index in indexes if shop_ids[index] in active]
+
+    def best_offer(self, product_id):
+        """
+        Самое дешевое предложение товара в наличии и следующее за ним в формате BestOfferSerializer
+        \n:return: словарь или None, если товара нет в наличии
+        """
+        in_stock = [index for index in self.product_offers(product_id)
+                    if self.quantities[index] > 0 and self.shops[self.shop_ids[index]].state]
+        if not in_stock:
+            return None
+        best, runner_up = in_stock[0], in_stock[1] if len(in_stock) > 1 else None
+        return {
+            'product': product_id,
+            'product_info': self.offer_ids[best],
+            'shop': self.shop_ids[best],
+            'price': self.prices[best],
+            'quantity': self.quantities[best],
+            'runner_up_product_info': self.offer_ids[runner_up] if runner_up is not None else None,
+            'runner_up_shop': self.shop_ids[runner_up] if runner_up is not None else None,
+            'runner_up_price': self.prices[runner_up] if runner_up is not None else None,
+            'offers': len(in_stock),
+        }
+
+    def best_offers(self, product_ids):
+        """
+        Лучшие предложения товаров в порядке id товара, товары не в наличии пропускаются
+        """
+        offers = (self.best_offer(product_id) for product_id in sorted(set(product_ids)))
+        return [offer for offer in offers if offer is not None]
+
+    def category_best_offers(self, category_id):
+        return self.best_offers(product_id for category in self.subtree(category_id)
+                                for product_id in category.product_ids)
+
+
+def _rows(queryset, fields, chunk_size):
+    """
+    Строки таблицы в порядке id частями по первичному ключу, без серверного курсора (pgbouncer)
+    """
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id').values_list(*fields)[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1][0]
+
+
+def load_snapshot(version, chunk_size=None):
+    """
+    Загрузка снимка каталога из базы
+    \n:param version: текущая версия каталога
+    \n:param chunk_size: количество строк товаров и предложений, читаемых одним запросом
+    """
+    chunk_size = chunk_size or settings.CATALOG_SNAPSHOT_CHUNK_SIZE
+    return CatalogSnapshot(
+        version,
+        Category.objects.order_by().values_list('id', 'name', 'path'),
+        Shop.objects.order_by().values_list('id', 'name', 'state'),
+        _rows(Product.objects.all(), ('id', 'name', 'category_id'), chunk_size),
+        Parameter.objects.order_by().values_list('id', 'name', 'code'),
+        _rows(ProductInfo.objects.all(), ('id', 'product_id', 'shop_id', 'model', 'quantity', 'price', 'price_rrc',
+                                          'parameters'), chunk_size),
+    )
+
+
+class VersionedValue:
+    """
+    Значение процесса, построенное по каталогу и перестраиваемое одним потоком при изменении версии каталога
+    """
+
+    def __init__(self, load, interval_setting, stale=False):
+        """
+        \n:param load: функция построения значения, принимает текущую версию каталога
+        \n:param interval_setting: имя настройки с минимальным интервалом между перестроениями, секунд
+        \n:param stale: отдавать прежнее значение, пока новое строится, перестраивалось недавно или кэш версий
+        недоступен; без прежнего значения запрос ждет построения
+        """
+        self.load, self.interval_setting, self.stale = load, interval_setting, stale
+        self.current = (None, None)  # (версия, значение)
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        """
+        \n:return: значение для текущей версии каталога или None (см. stale) - запрос выполняется к базе
+        """
+        versions = _read(CATALOG_VERSION_KEY)
+        if versions is None and not self.stale:
+            return None
+        version = versions[0] if versions else None  # без кэша версий значение перестраивается по интервалу
+        current_version, value = self.current
+        if value is not None and version is not None and current_version == version:
+            return value
+        fallback = value if self.stale else None
+        if value is not None and self._recent():
+            return fallback
+        if not self.lock.acquire(blocking=self.stale and value is None):
+            return fallback
+        try:
+            current_version, value = self.current
+            if value is None or version is None or current_version != version:
+                if value is not None and self._recent():
+                    return fallback  # перестроено другим потоком, пока этот ждал блокировку
+                value = self.load(version)
+                self.current, self.loaded_at = (version, value), time.monotonic()
+            return value
+        finally:
+            self.lock.release()
+
+    def _recent(self):
+        return time.monotonic() - self.loaded_at < getattr(settings, self.interval_setting)
+
+    def reset(self):
+        with self.lock:
+            self.current, self.loaded_at = (None, None), None
+
+
+_snapshot = VersionedValue(load_snapshot, 'CATALOG_SNAPSHOT_RELOAD_INTERVAL')
+
+
+def get_snapshot():
+    """
+    Снимок каталога, совпадающий с текущей версией каталога, при необходимости перечитывается в этом потоке
+    \n:return: CatalogSnapshot или None - снимок отключен, кэш версий недоступен, снимок устарел и перечитывается
+    другим потоком или перечитывался недавно; в этом случае запрос выполняется к базе
+    """
+    if not settings.CATALOG_SNAPSHOT_ENABLED:
+        return None
+    return _snapshot.get()
+
+
+def reset_snapshot():
+    """
+    Сброс снимка процесса (тесты, освобождение памяти)
+    """
+    _snapshot.reset()
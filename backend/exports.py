@@ -0,0 +1,140 @@
+"""
+Выгрузка позиций заказов магазина за период в CSV или NDJSON для складских систем поставщиков.
+
+Строки читаются пачками по EXPORT_CHUNK_SIZE по возрастанию id позиции (keyset-пагинация), а не одним
+запросом: в production серверные курсоры отключены (pgbouncer), и .iterator() по всему периоду загрузил бы
+все строки в память процесса. Каждая строка содержит item_id, поэтому прерванную выгрузку можно продолжить
+с параметром after=<последний полученный item_id>.
+"""
+import csv
+import io
+import os
+
+import ujson
+from django.conf import settings
+
+from backend.models import OrderItem
+
+EXPORT_FORMATS = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+EXPORT_COLUMNS = ('item_id', 'order_id', 'order_dt', 'state', 'product_id', 'product', 'model',
+                  'quantity', 'price', 'sum', 'city', 'street', 'house', 'structure', 'building', 'apt', 'phone')
+_SOURCE_FIELDS = ('id', 'order_id', 'order__dt', 'order__state', 'product_info__product_id',
+                  'product_info__product__name', 'product_info__model', 'quantity', 'product_info__price',
+                  'order__contact__city', 'order__contact__street', 'order__contact__house',
+                  'order__contact__structure', 'order__contact__building', 'order__contact__apt',
+                  'order__contact__phone')
+_BUFFER_SIZE = 64 * 1024  # строки отдаются клиенту кусками такого размера
+
+
+def export_rows(shop_id, date_from, date_to, after=None, chunk_size=None):
+    """
+    Позиции заказов магазина в виде кортежей в порядке EXPORT_COLUMNS
+    \n:param shop_id: id магазина
+    \n:param date_from: начало периода (включительно) по времени заказа
+    \n:param date_to: конец периода (не включительно)
+    \n:param after: id позиции, после которой продолжается выгрузка
+    \n:param chunk_size: количество строк в одном запросе, по умолчанию EXPORT_CHUNK_SIZE
+    """
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    items = OrderItem.objects.filter(product_info__shop_id=shop_id, order__dt__gte=date_from,
+                                     order__dt__lt=date_to).exclude(order__state='basket').order_by('id')
+    last_id = after or 0
+    while True:
+        chunk = list(items.filter(id__gt=last_id).values_list(*_SOURCE_FIELDS)[:chunk_size])
+        for row in chunk:
+            item_id, order_id, dt, state, product_id, name, model, quantity, price, *contact = row
+            yield (item_id, order_id, dt.isoformat(), state, product_id, name, model, quantity, price, quantity * price,
+                   *contact)
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1][0]
+
+
+def _buffered(lines):
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= _BUFFER_SIZE:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def csv_lines(rows, header=True):
+    stream = io.StringIO()
+    writer = csv.writer(stream, lineterminator='\n')
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow(row)
+        yield stream.getvalue()
+        stream.seek(0)
+        stream.truncate()
+    yield stream.getvalue()
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield ujson.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + '\n'
+
+
+def render(rows, export_format, header=True):
+    """
+    Строки выгрузки в выбранном формате кусками по ~64 КБ
+    \n:param export_format: csv или ndjson
+    \n:param header: выводить ли заголовок CSV (не нужен при продолжении выгрузки в существующий файл)
+    """
+    lines = csv_lines(rows, header) if export_format == 'csv' else ndjson_lines(rows)
+    return _buffered(line for line in lines if line)
+
+
+def last_item_id(path, export_format):
+    """
+    id последней полностью записанной позиции в файле выгрузки, неполная последняя строка обрезается
+    \n:return: id позиции или None, если в файле нет ни одной строки данных
+    """
+    with open(path, 'rb+') as stream:
+        stream.seek(0, os.SEEK_END)
+        end = stream.tell()
+        stream.seek(max(0, end - _BUFFER_SIZE))
+        tail = stream.read()
+        complete = tail.rfind(b'\n') + 1
+        stream.truncate(end - len(tail) + complete)
+    lines = tail[:complete].splitlines()
+    if not lines:
+        return None
+    last = lines[-1].decode()
+    if export_format == 'csv':
+        value = next(csv.reader([last]))[0]
+        return int(value) if value.isdigit() else None
+    return ujson.loads(last)['item_id']
+
+
+def export_to_file(shop_id, date_from, date_to, export_format):
+    """
+    Выгрузка в файл EXPORT_DIR. Файл пишется как <имя>.part и переименовывается после завершения,
+    поэтому повторный запуск после сбоя продолжает выгрузку с последней записанной позиции
+    \n:return: путь к файлу и количество записанных в этом запуске строк
+    """
+    os.makedirs(settings.EXPORT_DIR, exist_ok=True)
+    path = os.path.join(settings.EXPORT_DIR, f'orders-{shop_id}-{date_from:%Y%m%d%H%M}-{date_to:%Y%m%d%H%M}'
+                                             f'.{export_format}')
+    partial = path + '.part'
+    after = last_item_id(partial, export_format) if os.path.exists(partial) else None
+    header = not os.path.exists(partial) or os.path.getsize(partial) == 0
+    written = 0
+
+    def counted(rows):
+        nonlocal written
+        for row in rows:
+            written += 1
+            yield row
+
+    with open(partial, 'a', encoding='utf-8', newline='') as stream:
+        for chunk in render(counted(export_rows(shop_id, date_from, date_to, after=after)), export_format,
+                            header=header):
+            stream.write(chunk)
+    os.replace(partial, path)
+    return path, written
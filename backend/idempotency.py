@@ -0,0 +1,135 @@
+"""
+Поддержка заголовка Idempotency-Key для небезопасных запросов.
+
+Первый ответ на запрос с ключом сохраняется в кэше (Redis) на IDEMPOTENCY_KEY_TTL секунд
+и возвращается при повторе. Пока первый запрос выполняется, повторы с тем же ключом получают 409.
+Не отрендеренный ответ (Response DRF) сохраняется после рендеринга, блокировка снимается там же.
+Внутри store_on_commit (atomic batch) ответ сохраняется только после коммита транзакции.
+"""
+import hashlib
+import json
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import JsonResponse, HttpResponse
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+_deferred = threading.local()  # блокировки ключей, ответы которых ждут коммита (см. store_on_commit)
+
+
+def _fingerprint(request):
+    data = json.dumps(request.data, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _cache_key(request, key):
+    source = f'{request.user.id}:{request.method}:{request.path}:{key}'
+    return 'idempotency:' + hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def _cacheable(response):
+    """
+    Ответ сохраняется для повтора, если он не зависит от временных сбоев: ошибки 4xx (проверка запроса)
+    сохраняются, а ответы 5xx и ответы 2xx с {"Status": false}, которыми представления сообщают
+    о перехваченных исключениях, нет - повтор с тем же ключом выполнит запрос заново
+    """
+    if response.streaming or response.status_code >= 500:
+        return False
+    if response.status_code >= 400 or not response.get('Content-Type', '').startswith('application/json'):
+        return True
+    try:
+        body = json.loads(response.content)
+    except ValueError:
+        return True
+    return not (isinstance(body, dict) and body.get('Status') in (False, 'False'))
+
+
+def _replay(stored):
+    response = HttpResponse(stored['content'], status=stored['status'], content_type=stored['content_type'])
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+@contextmanager
+def store_on_commit():
+    """
+    Ответы запросов с Idempotency-Key, выполненных внутри блока, сохраняются только после коммита транзакции,
+    чтобы повтор не получил успешный ответ на откаченные изменения. Блокировки ключей откаченных запросов
+    снимаются при выходе из блока
+    """
+    _deferred.locks = locks = []
+    try:
+        yield
+    finally:
+        _deferred.locks = None
+        if locks:
+            cache.delete_many(locks)
+
+
+def idempotent(func):
+    """
+    Декоратор метода представления, включающий обработку заголовка Idempotency-Key
+    """
+    @wraps(func)
+    def inner(self, request, *args, **kwargs):
+        key = request.META.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return func(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return JsonResponse({'Status': False, 'Errors': 'Idempotency-Key is too long'}, status=400)
+
+        cache_key = _cache_key(request, key)
+        lock_key = f'{cache_key}:lock'
+        fingerprint = _fingerprint(request)
+        try:
+            stored = cache.get(cache_key)
+            if stored is None:
+                locked = cache.add(lock_key, 1, timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+        except Exception:  # без кэша запрос выполняется как обычно
+            return func(self, request, *args, **kwargs)
+
+        if stored is not None:
+            if stored['fingerprint'] != fingerprint:
+                return JsonResponse({'Status': False, 'Errors': 'Idempotency-Key was used with another request'},
+                                    status=422)
+            return _replay(stored)
+        if not locked:
+            return JsonResponse({'Status': False, 'Errors': 'A request with this Idempotency-Key is in progress'},
+                                status=409)
+
+        def save(entry):
+            try:
+                if entry is not None:
+                    cache.set(cache_key, entry, timeout=settings.IDEMPOTENCY_KEY_TTL)
+            finally:
+                cache.delete(lock_key)
+
+        def store(response):
+            entry = None
+            if _cacheable(response):
+                entry = {'fingerprint': fingerprint, 'status': response.status_code,
+                         'content_type': response.get('Content-Type'), 'content': response.content}
+            locks = getattr(_deferred, 'locks', None)
+            if locks is None:
+                save(entry)
+            else:
+                locks.append(lock_key)
+                transaction.on_commit(lambda: save(entry))
+
+        try:
+            response = func(self, request, *args, **kwargs)
+        except BaseException:
+            cache.delete(lock_key)
+            raise
+        if getattr(response, 'is_rendered', True):
+            store(response)
+        else:  # Response DRF рендерится после выхода из метода представления
+            response.add_post_render_callback(store)
+        return response
+
+    return inner
@@ -0,0 +1,342 @@
+"""
+Импорт прайса поставщика из yaml.
+
+Импорты одного магазина выполняются последовательно (блокировка магазина на время транзакции, для нового
+магазина - блокировка его названия до создания), импорты разных магазинов - параллельно. Общие категории,
+товары и параметры создаются через bulk_create(ignore_conflicts=True), поэтому параллельные импорты
+не конфликтуют. Строки вставляются в порядке ключа уникальности: импорты с пересекающимися каталогами
+берут блокировки индекса в одном порядке и не взаимоблокируются.
+"""
+import hashlib
+import math
+import os
+import re
+from datetime import timedelta
+from decimal import Decimal
+
+import yaml
+from django.conf import settings
+from django.core.validators import URLValidator
+from django.db import connection, transaction
+from django.utils import timezone
+from yaml import load as load_yaml, Loader
+
+from backend.models import Shop, Category, CategoryShop, Product, ProductInfo, Parameter, ProductParameter, \
+    PriceHistory
+from backend.outbox import publish
+from backend.webhooks import check_url
+
+SHOP_LOCK_NAMESPACE = 4216  # первый ключ pg_advisory_xact_lock, второй - id магазина
+SHOP_NAME_LOCK_NAMESPACE = 4217  # то же для еще не созданного магазина, второй ключ - hashtext(название)
+NUMBER_WITH_UNIT = re.compile(r'^\s*(-?\d{1,14}(?:[.,]\d{1,6})?)\s*(%|[^\W\d_]+(?:[./][^\W\d_]+)*)?\s*$')
+MAX_PARAMETER_NUMBER = 10 ** 14  # ProductParameter.value_number: 20 знаков, из них 6 после запятой
+BOOLEAN_VALUES = {'да': True, 'нет': False, 'есть': True, 'yes': True, 'no': False, 'true': True, 'false': False}
+
+
+def feed_path(filename):
+    """
+    Путь к файлу прайса: читаются только файлы внутри FEED_UPLOAD_DIR, а не произвольные файлы сервера
+    \n:param filename: относительный или абсолютный путь к yaml файлу
+    \n:return: абсолютный путь к файлу
+    """
+    root, path = os.path.realpath(settings.FEED_UPLOAD_DIR), os.path.realpath(filename)
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(f'Feed file must be inside {settings.FEED_UPLOAD_DIR}')
+    return path
+
+
+def fetch_feed(url, headers=None):
+    """
+    Запрос прайса по ссылке. Ссылка должна разрешаться в публичные адреса (см. backend.webhooks.check_url),
+    перенаправления не выполняются: адрес перенаправления не проверен
+    \n:param url: ссылка на yaml файл
+    \n:param headers: заголовки запроса
+    \n:return: ответ сервера поставщика (200 или 304)
+    """
+    URLValidator()(url)
+    error = check_url(url, allow_private=settings.FEED_ALLOW_PRIVATE_HOSTS)
+    if error:
+        raise ValueError(error)
+    from requests import get  # requests нужен только воркеру импорта, не веб-процессу
+    response = get(url, headers=headers, timeout=settings.FEED_FETCH_TIMEOUT, allow_redirects=False)
+    if response.is_redirect:
+        raise ValueError(f'Feed URL redirects to {response.headers.get("Location")}')
+    return response
+
+
+def load_feed(filename=None, url=None):
+    """
+    Чтение прайса поставщика
+    \n:param filename: относительный или абсолютный путь к yaml файлу внутри FEED_UPLOAD_DIR
+    \n:param url: ссылка на yaml файл
+    \n:return: словарь с данными прайса
+    """
+    if filename:  # извлечение информации из файла
+        with open(feed_path(filename), 'r', encoding='utf-8') as stream:
+            return yaml.safe_load(stream)
+    if url:  # извлечение информации с url
+        response = fetch_feed(url)
+        response.raise_for_status()
+        return load_yaml(response.content, Loader=Loader)
+    raise ValueError('The source of information is incorrectly specified')
+
+
+def lock_shop(shop_id):
+    """
+    Блокировка магазина до конца текущей транзакции
+    \n:param shop_id: id магазина
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [SHOP_LOCK_NAMESPACE, shop_id])
+    else:
+        list(Shop.objects.select_for_update().filter(id=shop_id).values_list('id', flat=True))
+
+
+def lock_shop_name(name):
+    """
+    Блокировка создания магазина с названием до конца текущей транзакции: первые параллельные импорты
+    нового магазина не соревнуются за его создание. SQLite и так выполняет пишущие транзакции по одной
+    \n:param name: название магазина
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, hashtext(%s))', [SHOP_NAME_LOCK_NAMESPACE, name])
+
+
+def parse_parameter_value(value):
+    """
+    Определение типа значения параметра из прайса: число (с необязательной единицей измерения), да/нет или строка
+    \n:param value: значение из yaml
+    \n:return: поля value, value_number и value_bool для ProductParameter
+    """
+    fields = {'value': str(value), 'value_number': None, 'value_bool': None}
+    if isinstance(value, bool):
+        fields['value_bool'] = value
+    elif isinstance(value, (int, float)) and math.isfinite(value) and abs(value) < MAX_PARAMETER_NUMBER:
+        fields['value_number'] = Decimal(str(round(value, 6)))
+    elif isinstance(value, str):
+        if value.strip().lower() in BOOLEAN_VALUES:
+            fields['value_bool'] = BOOLEAN_VALUES[value.strip().lower()]
+        elif match := NUMBER_WITH_UNIT.match(value):
+            fields['value_number'] = Decimal(match.group(1).replace(',', '.'))
+    return fields
+
+
+def record_prices(shop_id, old_prices, new_prices):
+    """
+    Запись в историю цен только изменившихся цен предложений магазина
+    \n:param shop_id: id магазина
+    \n:param old_prices: словарь {id товара: [цена, рекомендуемая цена]} до изменения
+    \n:param new_prices: словарь {id товара: [цена, рекомендуемая цена]} после изменения
+    """
+    changed_at = timezone.now()
+    PriceHistory.objects.bulk_create([
+        PriceHistory(product_id=product_id, shop_id=shop_id, price=price, price_rrc=price_rrc, changed_at=changed_at)
+        for product_id, (price, price_rrc) in new_prices.items()
+        if old_prices.get(product_id) != [price, price_rrc]], batch_size=2000)
+
+
+def move_categories(parents):
+    """
+    Перенос категорий в родительские категории, указанные в прайсе (categories: [{id, name, parent}]).
+    Категории без parent в прайсе остаются на месте, parent: null переносит категорию в корень
+    \n:param parents: словарь {id категории: id родительской категории или None}
+    """
+    for category in Category.objects.select_for_update().filter(id__in=parents).order_by('id'):
+        if category.parent_id != parents[category.id]:
+            category.parent_id = parents[category.id]
+            category.save(update_fields=['parent'])
+
+
+def import_shop(user_id, data, filename=None, url=None, feed_etag='', feed_last_modified='', feed_hash=''):
+    """
+    Загрузка прайса магазина в базу данных. Предложения обновляются по товару, предложения товаров,
+    которых нет в прайсе, удаляются, а если они есть в заказах - остаются с нулевым остатком
+    \n:param user_id: id пользователя-поставщика
+    \n:param data: словарь с данными прайса (см. load_feed)
+    \n:param filename: путь к файлу, сохраняется в магазине
+    \n:param url: ссылка на файл, сохраняется в магазине
+    \n:param feed_etag: ETag загруженного прайса (см. poll_shop)
+    \n:param feed_last_modified: Last-Modified загруженного прайса
+    \n:param feed_hash: хэш содержимого загруженного прайса
+    \n:return: магазин
+    """
+    with transaction.atomic():  # каталог магазина обновляется целиком или не обновляется вовсе
+        lock_shop_name(data['shop'])
+        shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=user_id)
+        lock_shop(shop.id)
+        Shop.objects.filter(id=shop.id).update(filename=filename, url=url, feed_etag=feed_etag,
+                                               feed_last_modified=feed_last_modified, feed_hash=feed_hash)
+
+        categories = sorted(data['categories'], key=lambda category: category['id'])
+        Category.objects.bulk_create([Category(id=category['id'], name=category['name'], path=f'/{category["id"]}/')
+                                      for category in categories], ignore_conflicts=True)
+        move_categories({category['id']: category['parent'] for category in data['categories']
+                         if 'parent' in category})
+        CategoryShop.objects.bulk_create([CategoryShop(category_id=category['id'], shop_id=shop.id)
+                                          for category in categories], ignore_conflicts=True)
+        Product.objects.bulk_create([Product(id=item['id'], name=item['name'], category_id=item['category'])
+                                     for item in sorted(data['goods'], key=lambda item: item['id'])],
+                                    ignore_conflicts=True)
+        parameter_names = {name for item in data['goods'] for name in item['parameters']}
+        Parameter.objects.bulk_create([Parameter(name=name, code=settings.PARAMETER_CODES.get(name))
+                                       for name in sorted(parameter_names)], ignore_conflicts=True)
+        parameter_ids = dict(Parameter.objects.filter(name__in=parameter_names).values_list('name', 'id'))
+
+        goods = {item['id']: item for item in data['goods']}  # повтор товара в прайсе заменяет прежнюю позицию
+        old_prices = {product_id: prices for product_id, *prices in ProductInfo.objects.filter(
+            shop_id=shop.id).values_list('product_id', 'price', 'price_rrc')}
+        ProductInfo.objects.bulk_create([
+            ProductInfo(product_id=item['id'], model=item['model'], price=item['price'], price_rrc=item['price_rrc'],
+                        quantity=item['quantity'], shop_id=shop.id,
+                        parameters={name: str(value) for name, value in item['parameters'].items()})
+            for _, item in sorted(goods.items())], update_conflicts=True, unique_fields=['product', 'shop'],
+            update_fields=['model', 'price', 'price_rrc', 'quantity', 'parameters'])
+        product_info_ids, stale_ids = {}, []
+        for product_id, product_info_id in ProductInfo.objects.filter(shop_id=shop.id).values_list('product_id', 'id'):
+            if product_id in goods:
+                product_info_ids[product_id] = product_info_id
+            else:
+                stale_ids.append(product_info_id)
+        if stale_ids:  # предложения, попавшие в заказы, не удаляются вместе с позициями заказов, а обнуляются
+            ProductInfo.objects.filter(id__in=stale_ids, ordered_items__isnull=True).delete()
+            ProductInfo.objects.filter(id__in=stale_ids).update(quantity=0)
+        ProductParameter.objects.filter(product_info__shop_id=shop.id).exclude(product_info_id__in=stale_ids).delete()
+        ProductParameter.objects.bulk_create([
+            ProductParameter(product_info_id=product_info_ids[product_id], parameter_id=parameter_ids[name],
+                             **parse_parameter_value(value))
+            for product_id, item in goods.items()
+            for name, value in item['parameters'].items()])
+        record_prices(shop.id, old_prices, {product_id: [item['price'], item['price_rrc']]
+                                            for product_id, item in goods.items()})
+        publish('catalog.updated', shop_ids=[shop.id])
+    return shop
+
+
+def build_parameters(product_info_ids):
+    """
+    Документы параметров предложений по данным ProductParameter
+    \n:param product_info_ids: id предложений
+    \n:return: словарь {id предложения: {"название параметра": "значение"}}
+    """
+    documents = {product_info_id: {} for product_info_id in product_info_ids}
+    for product_info_id, name, value in ProductParameter.objects.filter(
+            product_info_id__in=product_info_ids).values_list('product_info_id', 'parameter__name', 'value'):
+        documents[product_info_id][name] = value
+    return documents
+
+
+def refresh_parameters(product_info_ids):
+    """
+    Пересборка документов параметров предложений после изменения ProductParameter или Parameter
+    \n:param product_info_ids: id предложений
+    \n:return: id магазинов, предложения которых изменились
+    """
+    product_infos = [ProductInfo(id=product_info_id, parameters=document)
+                     for product_info_id, document in build_parameters(product_info_ids).items()]
+    ProductInfo.objects.bulk_update(product_infos, ['parameters'], batch_size=500)
+    return list(ProductInfo.objects.filter(id__in=product_info_ids).values_list('shop_id', flat=True).distinct())
+
+
+def poll_shop(shop):
+    """
+    Проверка прайса магазина по сохраненной ссылке или пути к файлу и импорт, если прайс изменился.
+    Ссылка запрашивается с If-None-Match/If-Modified-Since, неизменившееся содержимое (по хэшу) не разбирается.
+    Ссылка и путь к файлу проверяются перед каждым чтением (см. fetch_feed и feed_path)
+    \n:param shop: магазин
+    \n:return: True, если прайс был загружен
+    """
+    now = timezone.now()
+    Shop.objects.filter(id=shop.id).update(next_poll_at=now + timedelta(minutes=shop.poll_interval or 60))
+    feed_etag, feed_last_modified = shop.feed_etag, shop.feed_last_modified
+    if shop.url:
+        headers = {}
+        if shop.feed_etag:
+            headers['If-None-Match'] = shop.feed_etag
+        if shop.feed_last_modified:
+            headers['If-Modified-Since'] = shop.feed_last_modified
+        response = fetch_feed(shop.url, headers=headers)
+        if response.status_code == 304:
+            return False
+        response.raise_for_status()
+        content = response.content
+        feed_etag = response.headers.get('ETag', '')
+        feed_last_modified = response.headers.get('Last-Modified', '')
+    else:
+        with open(feed_path(shop.filename), 'rb') as stream:
+            content = stream.read()
+
+    feed_hash = hashlib.sha256(content).hexdigest()
+    if feed_hash == shop.feed_hash:
+        Shop.objects.filter(id=shop.id).update(feed_etag=feed_etag, feed_last_modified=feed_last_modified)
+        return False
+    import_shop(shop.user_id, yaml.safe_load(content), filename=shop.filename, url=shop.url, feed_etag=feed_etag,
+                feed_last_modified=feed_last_modified, feed_hash=feed_hash)
+    return True
+
+
+STOCK_FIELDS = ('quantity', 'price', 'price_rrc')
+
+
+def update_stock_rows(rows, fields):
+    """
+    Обновление предложений одним запросом UPDATE ... FROM (VALUES ...), поля без изменений передаются как NULL
+    и сохраняют прежнее значение. На остальных СУБД используется bulk_update
+    \n:param rows: список кортежей (id предложения, {поле: значение})
+    \n:param fields: обновляемые поля
+    """
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        product_infos = list(ProductInfo.objects.filter(id__in=[pk for pk, _ in rows]).only('id', *fields))
+        values = dict(rows)
+        for product_info in product_infos:
+            for field, value in values[product_info.id].items():
+                setattr(product_info, field, value)
+        ProductInfo.objects.bulk_update(product_infos, fields)
+        return
+    table = connection.ops.quote_name(ProductInfo._meta.db_table)
+    assignments = ', '.join(f'{connection.ops.quote_name(field)} = COALESCE(v.column{index}, {table}.'
+                            f'{connection.ops.quote_name(field)})' for index, field in enumerate(fields, start=2))
+    placeholder = '(' + ', '.join(['CAST(%s AS integer)'] * (len(fields) + 1)) + ')'
+    params = [value for pk, values in rows for value in (pk, *(values.get(field) for field in fields))]
+    with connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {table} SET {assignments} FROM (VALUES {", ".join([placeholder] * len(rows))}) AS v '
+                       f'WHERE {table}.id = v.column1', params)
+
+
+def apply_stock_updates(shop_id, updates, chunk_size=1000):
+    """
+    Частичное обновление остатков и цен магазина без повторной загрузки прайса.
+    Изменения применяются пачками: один запрос на чтение id предложений и один UPDATE на пачку
+    \n:param shop_id: id магазина
+    \n:param updates: словарь {id товара: {"quantity"|"price"|"price_rrc": <int>}}
+    \n:param chunk_size: количество товаров в пачке
+    \n:return: количество обновленных предложений и список id товаров, которых нет в магазине
+    """
+    max_params = connection.features.max_query_params
+    if max_params:
+        chunk_size = min(chunk_size, max_params // (len(STOCK_FIELDS) + 1))
+    updated, missing = 0, []
+    product_ids = list(updates)
+    with transaction.atomic():
+        lock_shop(shop_id)  # не пересекается с полной загрузкой прайса того же магазина
+        for start in range(0, len(product_ids), chunk_size):
+            chunk = product_ids[start:start + chunk_size]
+            rows, found, old_prices, new_prices = [], set(), {}, {}
+            for pk, product_id, price, price_rrc in ProductInfo.objects.filter(
+                    shop_id=shop_id, product_id__in=chunk).values_list('id', 'product_id', 'price', 'price_rrc'):
+                values = updates[product_id]
+                rows.append((pk, values))
+                found.add(product_id)
+                if 'price' in values or 'price_rrc' in values:
+                    old_prices[product_id] = [price, price_rrc]
+                    new_prices[product_id] = [values.get('price', price), values.get('price_rrc', price_rrc)]
+            missing.extend(product_id for product_id in chunk if product_id not in found)
+            if rows:
+                fields = [field for field in STOCK_FIELDS if any(field in values for _, values in rows)]
+                update_stock_rows(rows, fields)
+                record_prices(shop_id, old_prices, new_prices)
+                updated += len(rows)
+        if updated:
+            publish('catalog.updated', shop_ids=[shop_id], product_ids=list(set(product_ids) - set(missing)))
+    return updated, missing
@@ -0,0 +1,93 @@
+"""
+Накладные по заказам: письмо покупателю (текст, HTML и CSV-файл с позициями) и сводка
+новых заказов для администратора.
+
+Заказы загружаются пачками по INVOICE_BATCH_SIZE: один запрос заказов с покупателями и контактами
+и один запрос позиций с товарами и магазинами на пачку, суммы считаются в Python. Шаблоны компилируются
+один раз на пачку, письма отправляются через одно соединение с почтовым сервером.
+"""
+import csv
+import io
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import Prefetch
+from django.template.loader import get_template
+
+from backend.models import Order, OrderItem
+
+CSV_HEADER = ('order', 'product', 'model', 'shop', 'quantity', 'price', 'sum')
+
+
+def load_orders(order_ids, batch_size=None):
+    """
+    Заказы с позициями, товарами, магазинами и контактами, по два запроса на пачку
+    \n:param order_ids: id заказов, корзины пропускаются
+    \n:return: генератор заказов с атрибутами lines (позиции) и total_sum (общая сумма)
+    """
+    order_ids, batch_size = sorted(set(order_ids)), batch_size or settings.INVOICE_BATCH_SIZE
+    items = OrderItem.objects.select_related('product_info__product', 'product_info__shop').order_by('id')
+    for start in range(0, len(order_ids), batch_size):
+        for order in Order.objects.filter(id__in=order_ids[start:start + batch_size]).exclude(
+                state='basket').select_related('contact', 'user').prefetch_related(
+                Prefetch('ordered_items', queryset=items)).order_by('id'):
+            order.lines = [{
+                'product': item.product_info.product.name, 'model': item.product_info.model,
+                'shop': item.product_info.shop.name, 'quantity': item.quantity, 'price': item.product_info.price,
+                'sum': item.quantity * item.product_info.price,
+            } for item in order.ordered_items.all()]
+            order.total_sum = sum(line['sum'] for line in order.lines)
+            yield order
+
+
+def invoice_csv(orders):
+    """
+    Позиции заказов в CSV, BOM в начале нужен, чтобы Excel открывал файл в utf-8
+    """
+    stream = io.StringIO()
+    writer = csv.writer(stream)
+    writer.writerow(CSV_HEADER)
+    for order in orders:
+        writer.writerows((order.id, *(line[field] for field in CSV_HEADER[1:])) for line in order.lines)
+    return '\ufeff' + stream.getvalue()
+
+
+def customer_messages(orders):
+    """
+    Письма покупателям с накладными
+    \n:param orders: заказы из load_orders
+    """
+    text, html = get_template('invoices/invoice.txt'), get_template('invoices/invoice.html')
+    messages = []
+    for order in orders:
+        context = {'order': order}
+        message = EmailMultiAlternatives('Обновление статуса заказа', text.render(context),
+                                         settings.EMAIL_HOST_USER, [order.user.email])
+        message.attach_alternative(html.render(context), 'text/html')
+        message.attach(f'invoice-{order.id}.csv', invoice_csv([order]), 'text/csv')
+        messages.append(message)
+    return messages
+
+
+def digest_message(orders):
+    """
+    Сводка накладных для администратора одним письмом с общим CSV-файлом
+    \n:param orders: заказы из load_orders
+    """
+    orders = list(orders)
+    context = {'orders': orders, 'total_sum': sum(order.total_sum for order in orders)}
+    message = EmailMultiAlternatives(f'Новые заказы: {len(orders)}', get_template('invoices/digest.txt').render(
+        context), settings.EMAIL_HOST_USER, settings.INVOICE_ADMIN_EMAILS)
+    message.attach_alternative(get_template('invoices/digest.html').render(context), 'text/html')
+    message.attach('invoices.csv', invoice_csv(orders), 'text/csv')
+    return message
+
+
+def send_messages(messages):
+    """
+    Отправка писем через одно соединение с почтовым сервером
+    \n:return: количество отправленных писем
+    """
+    if not messages:
+        return 0
+    return get_connection().send_messages(messages) or 0
@@ -0,0 +1,79 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import yaml
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from backend.models import Shop, User
+from backend.tasks import import_shop_feed, import_shop_feeds
+
+
+def _run_feed(feed):
+    try:
+        return feed, import_shop_feed(**feed), None
+    except Exception as error:
+        return feed, None, str(error)
+
+
+class Command(BaseCommand):
+    help = 'Параллельный импорт прайсов нескольких поставщиков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('manifest', nargs='?',
+                            help='yaml/json файл со списком прайсов: [{"user": <email или id>, "file"|"url": ...}]')
+        parser.add_argument('--shops', action='store_true',
+                            help='повторно загрузить прайсы всех магазинов с сохраненным файлом или ссылкой')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='количество процессов, 0 - импорт в текущем процессе')
+        parser.add_argument('--celery', action='store_true', help='распределить импорт по воркерам Celery')
+
+    def load_manifest(self, path):
+        with open(path, 'r', encoding='utf-8') as stream:
+            entries = json.load(stream) if path.endswith('.json') else yaml.safe_load(stream)
+        feeds = []
+        for entry in entries:
+            user = str(entry.get('user', entry.get('user_id', '')))
+            user_id = int(user) if user.isdigit() else User.objects.filter(email=user).values_list(
+                'id', flat=True).first()
+            if not user_id or not (entry.get('file') or entry.get('url')):
+                raise CommandError(f'Неверно указан прайс: {entry}')
+            feeds.append({'user_id': user_id, 'file': entry.get('file'), 'url': entry.get('url')})
+        return feeds
+
+    def handle(self, *args, **options):
+        feeds = self.load_manifest(options['manifest']) if options['manifest'] else []
+        if options['shops']:
+            feeds += [{'user_id': user_id, 'file': filename, 'url': url}
+                      for user_id, filename, url in Shop.objects.filter(user__isnull=False).exclude(
+                          filename__isnull=True, url__isnull=True).values_list('user_id', 'filename', 'url')]
+        if not feeds:
+            raise CommandError('Не указаны прайсы для импорта')
+
+        if options['celery']:
+            task_ids = import_shop_feeds.delay(feeds).get()
+            self.stdout.write(f'Поставлено задач импорта: {len(task_ids)}')
+            return
+
+        if options['workers'] == 0:
+            failed = self.report(map(_run_feed, feeds))
+        else:
+            connections.close_all()  # дочерние процессы открывают собственные соединения с базой
+            with ProcessPoolExecutor(max_workers=options['workers'], mp_context=get_context('fork')) as executor:
+                failed = self.report(future.result() for future in as_completed(
+                    [executor.submit(_run_feed, feed) for feed in feeds]))
+        if failed:
+            raise CommandError(f'Не удалось загрузить прайсов: {failed}')
+
+    def report(self, results):
+        failed = 0
+        for feed, result, error in results:
+            source = feed['file'] or feed['url']
+            if error:
+                failed += 1
+                self.stderr.write(f'{source}: {error}')
+            else:
+                self.stdout.write(f'{source}: магазин {result["shop_id"]}, товаров {result["goods"]}')
+        return failed
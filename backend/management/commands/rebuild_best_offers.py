@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from backend.models import Product
+from backend.offers import refresh_best_offers
+
+
+class Command(BaseCommand):
+    help = 'Полный пересчет лучших предложений по всем товарам (BestOffer)'
+
+    def handle(self, *args, **options):
+        found = refresh_best_offers(Product.objects.order_by('id').values_list('id', flat=True).iterator())
+        self.stdout.write(f'Товаров с предложениями в наличии: {found}')
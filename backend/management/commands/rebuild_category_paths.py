@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from backend.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Пересчет путей всех категорий (Category.path) по родительским категориям'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            categories = {category.id: category for category in
+                          Category.objects.select_for_update().only('id', 'parent_id', 'path')}
+            children = {}
+            for category in categories.values():
+                children.setdefault(category.parent_id, []).append(category)
+            paths, stack = {}, [(category, '/') for category in children.get(None, ())]
+            while stack:
+                category, parent_path = stack.pop()
+                paths[category.id] = f'{parent_path}{category.id}/'
+                stack.extend((child, paths[category.id]) for child in children.get(category.id, ()))
+            if len(paths) != len(categories):
+                raise CommandError(f'Категории с циклической вложенностью: {sorted(set(categories) - set(paths))}')
+            changed = [category for category in categories.values() if category.path != paths[category.id]]
+            for category in changed:
+                category.path = paths[category.id]
+            Category.objects.bulk_update(changed, ['path'], batch_size=1000)
+        self.stdout.write(f'Обновлено путей категорий: {len(changed)}')
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.importer import build_parameters, refresh_parameters
+from backend.models import ProductInfo
+from backend.outbox import publish
+
+
+class Command(BaseCommand):
+    help = 'Проверка и пересборка документов параметров предложений (ProductInfo.parameters) по ProductParameter'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='только проверить, код возврата 1 при наличии расхождений')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size, last_id, stale = options['batch_size'], 0, []
+        while True:
+            batch = dict(ProductInfo.objects.filter(id__gt=last_id).order_by('id').values_list(
+                'id', 'parameters')[:batch_size])
+            if not batch:
+                break
+            last_id = max(batch)
+            stale += [product_info_id for product_info_id, document in build_parameters(list(batch)).items()
+                      if document != batch[product_info_id]]
+
+        if options['check']:
+            if stale:
+                raise CommandError(f'Документы параметров расходятся с ProductParameter: {len(stale)}, '
+                                   f'например id {stale[:10]}')
+            self.stdout.write('Расхождений нет')
+            return
+        shop_ids = set()
+        for start in range(0, len(stale), batch_size):
+            shop_ids.update(refresh_parameters(stale[start:start + batch_size]))
+        if shop_ids:
+            publish('catalog.updated', shop_ids=sorted(shop_ids))
+        self.stdout.write(f'Пересобрано документов: {len(stale)}')
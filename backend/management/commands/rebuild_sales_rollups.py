@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from backend.tasks import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = 'Полный пересчет сводки продаж магазинов (SalesRollup) по текущим и архивным заказам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, help='количество заказов в одной транзакции')
+        parser.add_argument('--celery', action='store_true', help='выполнить пересчет на воркере Celery')
+
+    def handle(self, *args, **options):
+        if options['celery']:
+            result = rebuild_sales_rollups.delay(options['chunk_size'])
+            self.stdout.write(f'Поставлена задача пересчета: {result.id}')
+            return
+        recorded = rebuild_sales_rollups(options['chunk_size'])
+        self.stdout.write(f'Учтено заказов: {recorded}')
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from backend.importer import parse_parameter_value
+from backend.models import ProductParameter
+
+
+class Command(BaseCommand):
+    help = 'Заполнение числовых и логических значений параметров, загруженных до их появления'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size, last_id, updated = options['batch_size'], 0, 0
+        while True:
+            batch = list(ProductParameter.objects.filter(id__gt=last_id, value_number__isnull=True,
+                                                         value_bool__isnull=True).order_by('id').only(
+                'id', 'value')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            changed = []
+            for product_parameter in batch:
+                fields = parse_parameter_value(product_parameter.value)
+                if fields['value_number'] is not None or fields['value_bool'] is not None:
+                    product_parameter.value_number, product_parameter.value_bool = (fields['value_number'],
+                                                                                   fields['value_bool'])
+                    changed.append(product_parameter)
+            updated += ProductParameter.objects.bulk_update(changed, ['value_number', 'value_bool'])
+        self.stdout.write(f'Обновлено значений: {updated}')
@@ -0,0 +1,51 @@
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+re_accepts_gzip = re.compile(r'\bgzip\b')
+re_accepts_brotli = re.compile(r'\bbr\b')
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Сжатие ответов brotli (если установлен пакет brotli) или gzip.
+    Сжимаются только ответы больше RESPONSE_COMPRESSION_MIN_SIZE байт.
+    """
+
+    def process_response(self, request, response):
+        min_size = settings.RESPONSE_COMPRESSION_MIN_SIZE
+        if response.streaming or len(response.content) < min_size:
+            return response
+        if response.has_header('Content-Encoding'):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is not None and re_accepts_brotli.search(accept_encoding):
+            encoding = 'br'
+            compressed_content = brotli.compress(response.content, quality=settings.RESPONSE_COMPRESSION_BROTLI_QUALITY)
+        elif re_accepts_gzip.search(accept_encoding):
+            encoding = 'gzip'
+            compressed_content = compress_string(response.content)
+        else:
+            return response
+
+        if len(compressed_content) >= len(response.content):
+            return response
+        response.content = compressed_content
+        response.headers['Content-Length'] = str(len(response.content))
+
+        etag = response.get('ETag')  # сжатый ответ получает слабый ETag (RFC 7232)
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
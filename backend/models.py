@@ -2,6 +2,8 @@ from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.db import models
+from django.db.models.functions import Concat, Substr
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django_rest_passwordreset.tokens import get_token_generator
 
@@ -103,6 +105,13 @@ class Shop(models.Model):
     filename = models.CharField(verbose_name='путь к файлу', max_length=200, null=True, blank=True)  # путь к файлу с данными о товаре от поставщика
     state = models.BooleanField(default=True, verbose_name='Статус получения заказов')
     user = models.OneToOneField(User, verbose_name='пользователь', blank=True, null=True, on_delete=models.CASCADE)
+    poll_interval = models.PositiveIntegerField(verbose_name='Интервал проверки прайса (мин)', default=0,
+                                                help_text='0 - не проверять прайс по расписанию')
+    next_poll_at = models.DateTimeField(verbose_name='Следующая проверка прайса', null=True, blank=True,
+                                        db_index=True)
+    feed_etag = models.CharField(verbose_name='ETag прайса', max_length=200, blank=True)
+    feed_last_modified = models.CharField(verbose_name='Last-Modified прайса', max_length=50, blank=True)
+    feed_hash = models.CharField(verbose_name='Хэш содержимого прайса', max_length=64, blank=True)
 
     class Meta:
         verbose_name = 'Магазин'
@@ -119,6 +128,11 @@ class Category(models.Model):
     """
     name = models.CharField(max_length=50, verbose_name='Название')
     shops = models.ManyToManyField(Shop, verbose_name='Магазины', blank=True, through='CategoryShop')
+    parent = models.ForeignKey('self', verbose_name='Родительская категория', related_name='children', null=True,
+                               blank=True, on_delete=models.CASCADE)
+    # поддерево категории отбирается одним условием path LIKE '/1/224/%' по индексу
+    path = models.CharField(max_length=255, verbose_name='Путь', db_index=True, editable=False, default='',
+                            help_text='id категорий от корня, например /1/224/')
 
     class Meta:
         verbose_name = 'Категория'
@@ -128,6 +142,24 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """
+        Сохранение категории с пересчетом пути категории и всех вложенных в нее категорий
+        """
+        old_path = self.id and Category.objects.filter(id=self.id).values_list('path', flat=True).first() or ''
+        parent_path = '/'
+        if self.parent_id:
+            parent_path = Category.objects.values_list('path', flat=True).get(id=self.parent_id)
+        if old_path and parent_path.startswith(old_path):
+            raise ValueError(f'Category {self.id} cannot be moved into itself or its subcategory')
+        super().save(*args, **kwargs)
+        self.path = f'{parent_path}{self.id}/'
+        if self.path != old_path:
+            Category.objects.filter(id=self.id).update(path=self.path)
+            if old_path:
+                Category.objects.filter(path__startswith=old_path).exclude(id=self.id).update(
+                    path=Concat(models.Value(self.path), Substr('path', len(old_path) + 1)))
+
 
 class CategoryShop(models.Model):
     """
@@ -136,6 +168,11 @@ class CategoryShop(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='category_shop')
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='category_shop')
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'shop'], name='unique_category_shop'),
+        ]
+
 
 class Product(models.Model):
     """
@@ -166,12 +203,14 @@ class ProductInfo(models.Model):
     quantity = models.PositiveIntegerField(verbose_name='Колличество')
     price = models.PositiveIntegerField(verbose_name='Цена')
     price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
+    parameters = models.JSONField(verbose_name='Параметры', default=dict, blank=True,
+                                  help_text='копия ProductParameter вида {"название": "значение"} для чтения каталога')
 
     class Meta:
         verbose_name = 'Информация о продукте'
         verbose_name_plural = "Иформационный список о продуктах"
         constraints = [
-            models.UniqueConstraint(fields=['product', 'shop', 'id'], name='unique_product_info'),
+            models.UniqueConstraint(fields=['product', 'shop'], name='unique_product_info'),
         ]
 
     def __str__(self):
@@ -182,7 +221,9 @@ class Parameter(models.Model):
     """
     Модель с названиями параметров товаров
     """
-    name = models.CharField(max_length=50, verbose_name='Название')
+    name = models.CharField(max_length=50, verbose_name='Название', unique=True)
+    code = models.SlugField(max_length=50, verbose_name='Код для фильтра', unique=True, null=True, blank=True,
+                            help_text='например memory для фильтра products?memory>=256')
 
     class Meta:
         verbose_name = 'Имя параметра'
@@ -204,6 +245,9 @@ class ProductParameter(models.Model):
                                   related_name='product_parameter',
                                   on_delete=models.CASCADE)
     value = models.CharField(verbose_name='Значение', max_length=100)
+    value_number = models.DecimalField(verbose_name='Числовое значение', max_digits=20, decimal_places=6,
+                                       null=True, blank=True)
+    value_bool = models.BooleanField(verbose_name='Логическое значение', null=True, blank=True)
 
     class Meta:
         verbose_name = 'Параметр'
@@ -211,11 +255,71 @@ class ProductParameter(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product_info', 'parameter'], name='unique_product_parameter'),
         ]
+        indexes = [  # фильтры каталога по значению параметра (см. ProductInfoView)
+            models.Index(fields=['parameter', 'value_number'], name='product_parameter_number_idx'),
+            models.Index(fields=['parameter', 'value_bool'], name='product_parameter_bool_idx'),
+            models.Index(fields=['parameter', 'value'], name='product_parameter_value_idx'),
+        ]
 
     def __str__(self):
         return self.parameter.name
 
 
+class PriceHistory(models.Model):
+    """
+    Модель с историей изменения цен предложения: запись добавляется только при изменении цены
+    """
+    id = models.BigAutoField(primary_key=True)
+    product = models.ForeignKey(Product, verbose_name='Продукт', related_name='price_history',
+                                on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='price_history', on_delete=models.CASCADE)
+    price = models.PositiveIntegerField(verbose_name='Цена')
+    price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
+    changed_at = models.DateTimeField(verbose_name='Время изменения', default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Изменение цены'
+        verbose_name_plural = 'История цен'
+        ordering = ('changed_at',)
+        indexes = [
+            models.Index(fields=['product', 'changed_at'], name='price_history_product_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} {self.shop_id}: {self.price}'
+
+
+class BestOffer(models.Model):
+    """
+    Модель с лучшим предложением по товару среди всех поставщиков: самое дешевое в наличии и следующее за ним.
+    Пересчитывается потребителем событий каталога и заказов (см. backend.offers)
+    """
+    product = models.OneToOneField(Product, verbose_name='Продукт', related_name='best_offer', primary_key=True,
+                                   on_delete=models.CASCADE)
+    # предложения товаров, исключенных из прайса, удаляются при импорте, поэтому ссылки хранятся без внешнего ключа
+    # и обновляются потребителем события catalog.updated
+    product_info = models.ForeignKey(ProductInfo, verbose_name='Лучшее предложение', related_name='+',
+                                     on_delete=models.DO_NOTHING, db_constraint=False)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='+', on_delete=models.CASCADE)
+    price = models.PositiveIntegerField(verbose_name='Цена')
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    runner_up_product_info = models.ForeignKey(ProductInfo, verbose_name='Второе предложение', related_name='+',
+                                               null=True, blank=True, on_delete=models.DO_NOTHING,
+                                               db_constraint=False)
+    runner_up_shop = models.ForeignKey(Shop, verbose_name='Магазин второго предложения', related_name='+',
+                                       null=True, blank=True, on_delete=models.SET_NULL)
+    runner_up_price = models.PositiveIntegerField(verbose_name='Цена второго предложения', null=True, blank=True)
+    offers = models.PositiveIntegerField(verbose_name='Количество предложений в наличии')
+    updated_at = models.DateTimeField(verbose_name='Время пересчета', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Лучшее предложение'
+        verbose_name_plural = 'Лучшие предложения'
+
+    def __str__(self):
+        return f'{self.product_id}: {self.price}'
+
+
 class Order(models.Model):
     """
     Модель с информацией о заказе
@@ -224,11 +328,21 @@ class Order(models.Model):
     dt = models.DateTimeField(auto_now_add=True, verbose_name='время создания заказа')
     state = models.CharField(max_length=35, verbose_name='Статус заказа', choices=ORDER_CHOICES, default="in_process")
     contact = models.ForeignKey('Contact', verbose_name='Контакт', blank=True, null=True, on_delete=models.CASCADE)
+    invoiced_at = models.DateTimeField(verbose_name='Время отправки накладной администратору', null=True,
+                                       blank=True)
+    # статус, по которому заказ учтен в сводке продаж SalesRollup (см. backend.analytics)
+    rollup_state = models.CharField(max_length=10, verbose_name='Статус в сводке продаж', blank=True, default='')
 
     class Meta:
         verbose_name = "Заказ"
         ordering = ("-dt",)
         verbose_name_plural = "Список заказов"
+        indexes = [
+            models.Index(fields=['state', 'dt'], name='order_state_dt_idx'),  # выборка заказов для архивации
+            # заказы, еще не попавшие в сводку накладных для администратора
+            models.Index(fields=['id'], condition=models.Q(invoiced_at__isnull=True) & ~models.Q(state='basket'),
+                         name='order_invoice_pending_idx'),
+        ]
 
     def __str__(self):
         return str(self.dt)
@@ -252,6 +366,208 @@ class OrderItem(models.Model):
         ]
 
 
+class OrderTemplate(models.Model):
+    """
+    Модель с шаблоном регулярного заказа покупателя
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Пользователь',
+                             related_name='order_templates')
+    name = models.CharField(max_length=100, verbose_name='Название')
+    contact = models.ForeignKey('Contact', verbose_name='Контакт', blank=True, null=True, on_delete=models.SET_NULL)
+    run_time = models.TimeField(verbose_name='Время ежедневного заказа', null=True, blank=True,
+                                help_text='пусто - заказ только вручную')
+    next_run_at = models.DateTimeField(verbose_name='Следующий заказ', null=True, blank=True)
+    last_run_at = models.DateTimeField(verbose_name='Последний заказ', null=True, blank=True)
+    last_result = models.JSONField(verbose_name='Результат последнего заказа', default=dict, blank=True)
+
+    class Meta:
+        verbose_name = 'Шаблон заказа'
+        verbose_name_plural = 'Шаблоны заказов'
+        ordering = ('id',)
+        indexes = [
+            models.Index(fields=['next_run_at'], condition=models.Q(next_run_at__isnull=False),
+                         name='order_template_due_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class OrderTemplateItem(models.Model):
+    """
+    Модель с позицией шаблона заказа: товар и магазин вместо предложения, так как предложение
+    удаляется при загрузке прайса без этого товара
+    """
+    template = models.ForeignKey(OrderTemplate, on_delete=models.CASCADE, verbose_name='Шаблон',
+                                 related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='Продукт', related_name='+')
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, verbose_name='Магазин', related_name='+')
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Позиция шаблона заказа'
+        verbose_name_plural = 'Позиции шаблонов заказов'
+        constraints = [
+            models.UniqueConstraint(fields=['template', 'product', 'shop'], name='unique_order_template_item'),
+        ]
+
+
+class ArchivedOrder(models.Model):
+    """
+    Модель с архивной копией доставленного или отмененного заказа
+    """
+    id = models.BigIntegerField(primary_key=True, verbose_name='id исходного заказа')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Пользователь',
+                             related_name='archived_orders')
+    dt = models.DateTimeField(verbose_name='время создания заказа')
+    state = models.CharField(max_length=35, verbose_name='Статус заказа', choices=ORDER_CHOICES)
+    contact = models.CharField(max_length=255, verbose_name='Контакт', blank=True)
+    total_sum = models.PositiveIntegerField(verbose_name='Сумма заказа', help_text='по ценам на момент архивации')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='время архивации')
+    rollup_state = models.CharField(max_length=10, verbose_name='Статус в сводке продаж', blank=True, default='')
+
+    class Meta:
+        verbose_name = "Архивный заказ"
+        ordering = ("-dt",)
+        verbose_name_plural = "Архив заказов"
+        indexes = [
+            models.Index(fields=['user', '-dt'], name='archived_order_user_dt_idx'),
+        ]
+
+    def __str__(self):
+        return str(self.dt)
+
+
+class ArchivedOrderItem(models.Model):
+    """
+    Модель с позицией архивного заказа (копия данных о товаре на момент архивации). OrderItem не хранит цену,
+    поэтому price - цена предложения на момент архивации, а не на момент оформления заказа
+    """
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, verbose_name="Заказ",
+                              related_name="ordered_items")
+    product_info_id = models.BigIntegerField(verbose_name='id информации о продукте')
+    shop = models.ForeignKey(Shop, on_delete=models.SET_NULL, verbose_name='Магазин', null=True, blank=True,
+                             related_name='archived_order_items')
+    product_name = models.CharField(max_length=100, verbose_name='Название')
+    model = models.CharField(max_length=80, verbose_name='Модель', blank=True)
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    price = models.PositiveIntegerField(verbose_name='Цена', help_text='цена предложения на момент архивации')
+
+    class Meta:
+        verbose_name = "Позиция архивного заказа"
+        verbose_name_plural = "Список позиций архивных заказов"
+        indexes = [
+            models.Index(fields=['shop', 'order'], name='archived_item_shop_order_idx'),
+        ]
+
+
+class SalesRollup(models.Model):
+    """
+    Модель с дневной сводкой продаж товара магазина по дате оформления заказов.
+    Обновляется приращениями при оформлении, отмене и доставке заказов (см. backend.analytics)
+    """
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='sales_rollups', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, verbose_name='Продукт', related_name='+', on_delete=models.CASCADE)
+    day = models.DateField(verbose_name='День оформления заказов')
+    orders = models.IntegerField(default=0, verbose_name='Количество заказов')
+    units = models.IntegerField(default=0, verbose_name='Заказано единиц')
+    revenue = models.BigIntegerField(default=0, verbose_name='Сумма заказов')
+    canceled_units = models.IntegerField(default=0, verbose_name='Отменено единиц')
+    canceled_revenue = models.BigIntegerField(default=0, verbose_name='Сумма отмен')
+    delivered_units = models.IntegerField(default=0, verbose_name='Доставлено единиц')
+    delivered_revenue = models.BigIntegerField(default=0, verbose_name='Сумма доставленных')
+
+    class Meta:
+        verbose_name = 'Сводка продаж'
+        verbose_name_plural = 'Сводки продаж'
+        constraints = [
+            # индекс уникальности используется и для выборки сводки магазина за период
+            models.UniqueConstraint(fields=['shop', 'day', 'product'], name='unique_sales_rollup'),
+        ]
+
+    def __str__(self):
+        return f'{self.shop_id} {self.day}: {self.product_id}'
+
+
+class OutboxEvent(models.Model):
+    """
+    Модель события, записываемого в одной транзакции с изменением данных (transactional outbox)
+    """
+    topic = models.CharField(max_length=50, verbose_name='Тема')
+    payload = models.JSONField(default=dict, verbose_name='Данные события')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='время создания')
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name='время обработки')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Количество неудачных попыток')
+    next_attempt_at = models.DateTimeField(null=True, blank=True, verbose_name='время следующей попытки')
+    # потребители, уже обработавшие событие: при повторе после ошибки они не вызываются
+    done_consumers = models.JSONField(default=list, blank=True, verbose_name='Обработавшие потребители')
+
+    class Meta:
+        verbose_name = 'Событие'
+        verbose_name_plural = 'Очередь событий'
+        ordering = ('id',)
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.topic} #{self.id}'
+
+
+class ShopWebhook(models.Model):
+    """
+    Модель с подпиской магазина на уведомления о новых заказах
+    """
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='webhooks', on_delete=models.CASCADE)
+    url = models.URLField(verbose_name='Адрес для уведомлений')
+    secret = models.CharField(verbose_name='Ключ подписи', max_length=64)
+    is_active = models.BooleanField(verbose_name='Активна', default=True)
+    created_at = models.DateTimeField(verbose_name='Время создания', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Подписка магазина'
+        verbose_name_plural = 'Подписки магазинов'
+        ordering = ('id',)
+
+    def __str__(self):
+        return self.url
+
+
+class WebhookDelivery(models.Model):
+    """
+    Модель с пачкой новых заказов для отправки на адрес подписки магазина
+    """
+    STATE_CHOICES = (
+        ('pending', 'Ожидает отправки'),
+        ('sending', 'Отправляется'),
+        ('delivered', 'Доставлено'),
+        ('failed', 'Не доставлено'),
+    )
+    webhook = models.ForeignKey(ShopWebhook, verbose_name='Подписка', related_name='deliveries',
+                                on_delete=models.CASCADE)
+    order_ids = models.JSONField(verbose_name='Заказы', default=list)
+    body = models.BinaryField(verbose_name='Тело запроса', null=True, blank=True,
+                              help_text='собирается при первой отправке и не меняется при повторах')
+    state = models.CharField(verbose_name='Статус', max_length=15, choices=STATE_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(verbose_name='Количество попыток', default=0)
+    created_at = models.DateTimeField(verbose_name='Время создания', auto_now_add=True)
+    next_attempt_at = models.DateTimeField(verbose_name='Следующая попытка')
+    delivered_at = models.DateTimeField(verbose_name='Время доставки', null=True, blank=True)
+    last_error = models.TextField(verbose_name='Последняя ошибка', blank=True)
+
+    class Meta:
+        verbose_name = 'Отправка уведомления'
+        verbose_name_plural = 'Отправки уведомлений'
+        ordering = ('id',)
+        indexes = [
+            models.Index(fields=['next_attempt_at'], condition=models.Q(state__in=['pending', 'sending']),
+                         name='webhook_delivery_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.webhook_id} #{self.id}'
+
+
 class Contact(models.Model):
     """
     Модель с информацией о контактных данных пользователей
@@ -0,0 +1,63 @@
+"""
+Индекс лучших предложений (BestOffer): для каждого товара - самое дешевое предложение в наличии
+среди магазинов, принимающих заказы, и следующее за ним.
+
+Индекс пересчитывается только для затронутых товаров: по product_ids события, а если их нет
+(импорт прайса, изменение статуса магазина) - для всех товаров магазинов из shop_ids.
+"""
+from itertools import groupby
+
+from backend.models import BestOffer, ProductInfo
+
+BEST_OFFER_FIELDS = ['product_info', 'shop', 'price', 'quantity', 'runner_up_product_info', 'runner_up_shop',
+                     'runner_up_price', 'offers']
+
+
+def affected_products(events):
+    """
+    Товары, лучшие предложения которых могли измениться
+    \n:param events: payload'ы событий с product_ids и/или shop_ids
+    \n:return: множество id товаров
+    """
+    product_ids, shop_ids = set(), set()
+    for event in events:
+        if event.get('product_ids') is not None:
+            product_ids.update(event['product_ids'])
+        else:
+            shop_ids.update(event.get('shop_ids', ()))
+    if shop_ids:
+        product_ids.update(ProductInfo.objects.filter(shop_id__in=shop_ids).values_list('product_id', flat=True))
+        # товары, которых больше нет в прайсе магазина, но лучшее предложение по которым было у него
+        product_ids.update(BestOffer.objects.filter(shop_id__in=shop_ids).values_list('product_id', flat=True))
+        product_ids.update(BestOffer.objects.filter(runner_up_shop_id__in=shop_ids).values_list(
+            'product_id', flat=True))
+    return product_ids
+
+
+def refresh_best_offers(product_ids, batch_size=2000):
+    """
+    Пересчет лучших предложений товаров
+    \n:param product_ids: id товаров
+    \n:param batch_size: количество товаров, пересчитываемых одним запросом
+    \n:return: количество товаров с предложениями в наличии
+    """
+    product_ids, found = list(product_ids), 0
+    for start in range(0, len(product_ids), batch_size):
+        chunk = product_ids[start:start + batch_size]
+        offers = ProductInfo.objects.filter(product_id__in=chunk, quantity__gt=0, shop__state=True).order_by(
+            'product_id', 'price', 'id').values_list('product_id', 'id', 'shop_id', 'price', 'quantity')
+        best_offers = []
+        for product_id, product_offers in groupby(offers, key=lambda offer: offer[0]):
+            product_offers = list(product_offers)
+            (_, product_info_id, shop_id, price, quantity), runner_up = product_offers[0], product_offers[1:2]
+            best_offers.append(BestOffer(
+                product_id=product_id, product_info_id=product_info_id, shop_id=shop_id, price=price,
+                quantity=quantity, runner_up_product_info_id=runner_up[0][1] if runner_up else None,
+                runner_up_shop_id=runner_up[0][2] if runner_up else None,
+                runner_up_price=runner_up[0][3] if runner_up else None, offers=len(product_offers)))
+        BestOffer.objects.filter(product_id__in=chunk).exclude(
+            product_id__in=[best_offer.product_id for best_offer in best_offers]).delete()
+        BestOffer.objects.bulk_create(best_offers, update_conflicts=True, unique_fields=['product'],
+                                      update_fields=BEST_OFFER_FIELDS + ['updated_at'])
+        found += len(best_offers)
+    return found
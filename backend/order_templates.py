@@ -0,0 +1,158 @@
+"""
+Шаблоны регулярных заказов и повтор заказов.
+
+Позиции копируются одним запросом INSERT ... SELECT, без построчного создания через OrderItemSerializer.
+Запланированные шаблоны выполняются пачками: одна транзакция на пачку шаблонов, остатки блокируются
+и списываются одним запросом, по позициям, которых не хватило, составляется отчет.
+"""
+from datetime import datetime, timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from backend.importer import update_stock_rows
+from backend.models import Order, OrderItem, OrderTemplate, OrderTemplateItem, ProductInfo
+from backend.outbox import publish
+from backend.versions import bump_catalog_version, bump_order_version
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def next_run_at(run_time, after=None):
+    """
+    Время следующего ежедневного заказа
+    \n:param run_time: время заказа (datetime.time) или None для шаблонов без расписания
+    \n:param after: момент, после которого ищется время заказа, по умолчанию сейчас
+    """
+    if run_time is None:
+        return None
+    after = after or timezone.now()
+    moment = timezone.make_aware(datetime.combine(timezone.localtime(after).date(), run_time))
+    return moment if moment > after else moment + timedelta(days=1)
+
+
+def copy_order_to_basket(order_id, basket_id):
+    """
+    Добавление в корзину всех позиций прошлого заказа, количество совпадающих позиций суммируется
+    \n:return: количество добавленных или измененных позиций
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {_table(OrderItem)} (order_id, product_info_id, quantity) '
+                       f'SELECT %s, product_info_id, quantity FROM {_table(OrderItem)} WHERE order_id = %s '
+                       f'ON CONFLICT (order_id, product_info_id) '
+                       f'DO UPDATE SET quantity = {_table(OrderItem)}.quantity + excluded.quantity',
+                       [basket_id, order_id])
+        return cursor.rowcount
+
+
+def copy_template_to_basket(template_id, basket_id):
+    """
+    Добавление в корзину позиций шаблона по текущим предложениям магазинов
+    \n:return: количество добавленных или измененных позиций
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {_table(OrderItem)} (order_id, product_info_id, quantity) '
+                       f'SELECT %s, MIN(product_info.id), item.quantity FROM {_table(OrderTemplateItem)} item '
+                       f'JOIN {_table(ProductInfo)} product_info '
+                       f'ON product_info.product_id = item.product_id AND product_info.shop_id = item.shop_id '
+                       f'WHERE item.template_id = %s GROUP BY item.id, item.quantity '
+                       f'ON CONFLICT (order_id, product_info_id) '
+                       f'DO UPDATE SET quantity = {_table(OrderItem)}.quantity + excluded.quantity',
+                       [basket_id, template_id])
+        return cursor.rowcount
+
+
+def copy_order_to_template(order_id, template_id):
+    """
+    Заполнение шаблона позициями заказа
+    \n:return: количество позиций шаблона
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {_table(OrderTemplateItem)} (template_id, product_id, shop_id, quantity) '
+                       f'SELECT %s, product_info.product_id, product_info.shop_id, SUM(item.quantity) '
+                       f'FROM {_table(OrderItem)} item JOIN {_table(ProductInfo)} product_info '
+                       f'ON product_info.id = item.product_info_id WHERE item.order_id = %s '
+                       f'GROUP BY product_info.product_id, product_info.shop_id '
+                       f'ON CONFLICT (template_id, product_id, shop_id) DO UPDATE SET quantity = excluded.quantity',
+                       [template_id, order_id])
+        return cursor.rowcount
+
+
+def _place_orders(templates, now):
+    """
+    Оформление заказов по пачке шаблонов в текущей транзакции
+    \n:return: результаты по шаблонам
+    """
+    items = list(OrderTemplateItem.objects.filter(template__in=templates).order_by('template_id', 'id').values_list(
+        'template_id', 'product_id', 'shop_id', 'quantity'))
+    offers = {}
+    for product_info_id, product_id, shop_id, quantity in ProductInfo.objects.select_for_update(of=('self',)).filter(
+            product_id__in={item[1] for item in items}, shop_id__in={item[2] for item in items},
+            shop__state=True).order_by('id').values_list('id', 'product_id', 'shop_id', 'quantity'):
+        offers.setdefault((product_id, shop_id), [product_info_id, quantity])
+
+    lines, results = {}, {}
+    for template in templates:
+        results[template.id] = {'template_id': template.id, 'user_id': template.user_id, 'order_id': None,
+                                'items': 0, 'shortages': []}
+        if template.contact_id is None:
+            results[template.id]['error'] = 'Contact is not specified'
+    for template_id, product_id, shop_id, quantity in items:
+        result = results[template_id]
+        if 'error' in result:
+            continue
+        offer = offers.get((product_id, shop_id))
+        available = offer[1] if offer else 0
+        if available < quantity:
+            result['shortages'].append({'product': product_id, 'shop': shop_id, 'requested': quantity,
+                                        'available': available})
+        if available:
+            offer[1] -= min(quantity, available)
+            lines.setdefault(template_id, []).append((offer[0], product_id, shop_id, min(quantity, available)))
+
+    ordered = [template for template in templates if template.id in lines]
+    orders = Order.objects.bulk_create([Order(user_id=template.user_id, contact_id=template.contact_id, state='new')
+                                        for template in ordered])
+    OrderItem.objects.bulk_create([OrderItem(order_id=order.id, product_info_id=product_info_id, quantity=quantity)
+                                   for template, order in zip(ordered, orders)
+                                   for product_info_id, _, _, quantity in lines[template.id]])
+    touched = {offer[0]: offer[1] for template_lines in lines.values()
+               for offer in (offers[(line[1], line[2])] for line in template_lines)}
+    if touched:
+        update_stock_rows([(product_info_id, {'quantity': quantity}) for product_info_id, quantity in touched.items()],
+                          ['quantity'])
+    for template, order in zip(ordered, orders):
+        results[template.id].update(order_id=order.id, items=len(lines[template.id]))
+        publish('order.new', user_id=template.user_id, order_id=order.id,
+                shop_ids=sorted({line[2] for line in lines[template.id]}),
+                product_ids=sorted({line[1] for line in lines[template.id]}))
+    if orders:  # версии сбрасываются сразу после коммита, не дожидаясь relay_outbox
+        user_ids = [order.user_id for order in orders]
+        shop_ids = {line[2] for template_lines in lines.values() for line in template_lines}
+        transaction.on_commit(lambda: bump_order_version(*user_ids))
+        transaction.on_commit(lambda: bump_catalog_version(*shop_ids))
+
+    for template in templates:
+        template.last_run_at, template.next_run_at = now, next_run_at(template.run_time, after=now)
+        template.last_result = {key: value for key, value in results[template.id].items()
+                                if key not in ('template_id', 'user_id')}
+    OrderTemplate.objects.bulk_update(templates, ['last_run_at', 'next_run_at', 'last_result'])
+    return list(results.values())
+
+
+def run_due_templates(batch_size=100):
+    """
+    Оформление заказов по всем шаблонам, время которых подошло
+    \n:param batch_size: количество шаблонов в одной транзакции
+    \n:return: результаты по шаблонам: id заказа, количество позиций и нехватка остатков
+    """
+    now, results = timezone.now(), []
+    while True:
+        with transaction.atomic():
+            templates = list(OrderTemplate.objects.select_for_update(skip_locked=True).filter(
+                next_run_at__lte=now).order_by('next_run_at', 'id')[:batch_size])
+            if not templates:
+                return results
+            results += _place_orders(templates, now)
@@ -0,0 +1,111 @@
+"""
+Transactional outbox: события пишутся в таблицу OutboxEvent в той же транзакции, что и изменения
+заказов и каталога, а задача relay_outbox после фиксации транзакции пачками передает их потребителям.
+
+Потребитель получает список payload'ов одной темы и выполняется в своей точке сохранения. Успешно
+обработавшие событие потребители запоминаются в событии, при ошибке повторно вызываются только остальные;
+они должны быть идемпотентными (доставка "хотя бы один раз"). Повтор откладывается с экспоненциально
+растущей задержкой, после OUTBOX_MAX_ATTEMPTS неудачных попыток событие больше не выбирается и пишется в лог.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from backend.models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+_consumers = defaultdict(list)
+
+
+def consumer_name(func):
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def consumer(*topics):
+    """
+    Декоратор регистрации потребителя событий
+    \n:param topics: темы событий, которые обрабатывает потребитель
+    """
+    def decorator(func):
+        for topic in topics:
+            _consumers[topic].append(func)
+        return func
+
+    return decorator
+
+
+def _schedule_relay():
+    from backend.tasks import relay_outbox
+    try:
+        relay_outbox.delay()
+    except Exception:  # брокер недоступен: события заберет периодический запуск relay_outbox
+        pass
+
+
+def publish(topic, **payload):
+    """
+    Запись события в outbox в текущей транзакции
+    \n:param topic: тема события, например order.new
+    \n:param payload: данные события (должны сериализоваться в JSON)
+    """
+    OutboxEvent.objects.create(topic=topic, payload=payload)
+    transaction.on_commit(_schedule_relay)
+
+
+def retry_delay(attempts):
+    """
+    Задержка перед следующей попыткой обработки события, секунд
+    """
+    return min(settings.OUTBOX_RETRY_BASE_DELAY * 2 ** (attempts - 1), settings.OUTBOX_RETRY_MAX_DELAY)
+
+
+def relay(batch_size=None):
+    """
+    Передача пачки необработанных событий, время повтора которых подошло, потребителям
+    \n:param batch_size: количество событий в пачке, по умолчанию OUTBOX_BATCH_SIZE
+    \n:return: количество полностью обработанных событий
+    """
+    import backend.tasks  # noqa: F401 потребители регистрируются при импорте модуля задач
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(OutboxEvent.objects.select_for_update(skip_locked=True).filter(
+            Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now),
+            processed_at__isnull=True, attempts__lt=settings.OUTBOX_MAX_ATTEMPTS).order_by('id')[:batch_size])
+        by_topic = defaultdict(list)
+        for event in events:
+            by_topic[event.topic].append(event)
+
+        failed = set()
+        for topic, topic_events in by_topic.items():
+            for handler in _consumers[topic]:
+                name = consumer_name(handler)
+                pending = [event for event in topic_events if name not in event.done_consumers]
+                if not pending:
+                    continue
+                try:
+                    with transaction.atomic():
+                        handler([event.payload for event in pending])
+                except Exception:
+                    logger.exception('Outbox consumer %s failed on %s events', name, topic)
+                    failed.update(event.id for event in pending)
+                else:
+                    for event in pending:
+                        event.done_consumers.append(name)
+
+        processed = [event.id for event in events if event.id not in failed]
+        OutboxEvent.objects.filter(id__in=processed).update(processed_at=now)
+        retried = [event for event in events if event.id in failed]
+        for event in retried:
+            event.attempts += 1
+            event.next_attempt_at = now + timedelta(seconds=retry_delay(event.attempts))
+            if event.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                logger.error('Outbox event %s (%s) dropped after %s attempts', event.id, event.topic, event.attempts)
+        OutboxEvent.objects.bulk_update(retried, ['attempts', 'next_attempt_at', 'done_consumers'])
+    return len(processed)
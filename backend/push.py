@@ -0,0 +1,130 @@
+"""
+Публикация изменений для клиентов, подписанных на поток /api/v1/stream (Server-Sent Events).
+
+Потребители событий outbox после фиксации транзакции публикуют в Redis pub/sub готовые кадры SSE:
+смену статусов заказов в канал orders:<id покупателя> и остатки товаров в канал products:<id товара>.
+Остатки публикуются только по товарам, на которые сейчас кто-то подписан (PUBSUB CHANNELS),
+поэтому импорт большого прайса без наблюдателей не создает лишней нагрузки.
+"""
+import json
+import secrets
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Min, Sum
+
+from backend.models import ProductInfo
+
+ORDER_CHANNEL = 'orders:{}'
+PRODUCT_CHANNEL = 'products:{}'
+STREAM_TICKET_KEY = 'stream:ticket:{}'
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.PUSH_REDIS_URL, socket_timeout=settings.PUSH_REDIS_TIMEOUT,
+                                        socket_connect_timeout=settings.PUSH_REDIS_TIMEOUT,
+                                        decode_responses=True)
+    return _client
+
+
+def issue_ticket(user_id):
+    """
+    Одноразовый билет подключения к потоку для EventSource, который не передает заголовок Authorization
+    \n:param user_id: id пользователя
+    \n:return: билет, действующий PUSH_TICKET_TTL секунд
+    """
+    ticket = secrets.token_urlsafe(24)
+    cache.set(STREAM_TICKET_KEY.format(ticket), user_id, timeout=settings.PUSH_TICKET_TTL)
+    return ticket
+
+
+def redeem_ticket(ticket):
+    """
+    Погашение билета: из двух одновременных подключений с одним билетом принимается одно
+    \n:return: id пользователя или None, если билета нет, он истек или уже использован
+    """
+    key = STREAM_TICKET_KEY.format(ticket)
+    user_id = cache.get(key)
+    if user_id is None or not cache.delete(key):
+        return None
+    return user_id
+
+
+def frame(event, data):
+    """
+    Кадр Server-Sent Events
+    \n:param event: тип события (order, stock)
+    \n:param data: данные события
+    """
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'.encode()
+
+
+def publish(messages):
+    """
+    Публикация кадров одним обращением к Redis; недоступность Redis не должна ломать обработку событий
+    \n:param messages: список пар (канал, кадр)
+    """
+    if not messages:
+        return
+    try:
+        pipeline = get_client().pipeline(transaction=False)
+        for channel, message in messages:
+            pipeline.publish(channel, message)
+        pipeline.execute()
+    except redis.RedisError:
+        pass
+
+
+def order_messages(topic, events):
+    """
+    Кадры смены статусов заказов
+    \n:param topic: тема событий (order.new, order.updated, order.canceled)
+    \n:param events: payload'ы событий
+    """
+    default_state = {'order.new': 'new', 'order.canceled': 'canceled'}.get(topic)
+    return [(ORDER_CHANNEL.format(event['user_id']),
+             frame('order', {'id': event['order_id'], 'state': event.get('state', default_state)}))
+            for event in events]
+
+
+def watched_products():
+    """
+    Товары, на остатки которых подписан хотя бы один клиент
+    """
+    try:
+        channels = get_client().pubsub_channels(PRODUCT_CHANNEL.format('*'))
+    except redis.RedisError:
+        return set()
+    prefix = len(PRODUCT_CHANNEL.format(''))
+    return {int(channel[prefix:]) for channel in channels if channel[prefix:].isdigit()}
+
+
+def stock_messages(events, watched):
+    """
+    Кадры с остатками наблюдаемых товаров, затронутых событиями, одним запросом к базе
+    \n:param events: payload'ы событий с product_ids и/или shop_ids
+    \n:param watched: id наблюдаемых товаров
+    """
+    product_ids, shop_ids = set(), set()
+    for event in events:
+        if event.get('product_ids') is not None:
+            product_ids.update(watched.intersection(event['product_ids']))
+        else:
+            shop_ids.update(event.get('shop_ids', ()))
+    if shop_ids:
+        product_ids.update(ProductInfo.objects.filter(shop_id__in=shop_ids, product_id__in=watched).values_list(
+            'product_id', flat=True))
+    if not product_ids:
+        return []
+    stock = {row['product_id']: row for row in ProductInfo.objects.filter(
+        product_id__in=product_ids, shop__state=True, quantity__gt=0).values('product_id').annotate(
+        quantity=Sum('quantity'), price=Min('price'), offers=Count('id')).order_by()}
+    empty = {'quantity': 0, 'price': None, 'offers': 0}
+    return [(PRODUCT_CHANNEL.format(product_id),
+             frame('stock', {'product': product_id, **{key: stock.get(product_id, empty)[key] for key in empty}}))
+            for product_id in sorted(product_ids)]
@@ -1,5 +1,62 @@
 # app.renderers.py
-from rest_framework.renderers import JSONRenderer
+import ujson
+from rest_framework.utils import encoders
+from rest_framework.renderers import JSONRenderer, BaseRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 
 class UTF8CharsetJSONRenderer(JSONRenderer):
-    charset = 'utf-8'
\ No newline at end of file
+    charset = 'utf-8'
+
+
+def _default(obj):
+    # типы, которые не умеют кодировать быстрые энкодеры (Decimal, ленивые строки, UUID и т.д.)
+    return encoders.JSONEncoder().default(obj)
+
+
+class FastJSONRenderer(UTF8CharsetJSONRenderer):
+    """
+    JSON-рендерер на orjson (или ujson, если orjson не установлен).
+    Для форматированного вывода (?indent, Browsable API) используется стандартный энкодер.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            if orjson is not None:
+                ret = orjson.dumps(data, default=_default)
+            else:
+                ret = ujson.dumps(data, ensure_ascii=False, escape_forward_slashes=False,
+                                  default=_default).encode()
+        except (TypeError, ValueError, OverflowError):
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:  # как и JSONRenderer, экранируем U+2028 и U+2029
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Рендерер в формат MessagePack (Accept: application/msgpack или ?format=msgpack)
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_default, use_bin_type=True)
@@ -1,9 +1,80 @@
 from rest_framework import serializers, validators
 
-from backend.models import User, Category, Shop, ProductInfo, Product, ProductParameter, OrderItem, Order, Contact
+from backend.models import User, Category, Shop, ProductInfo, Product, ProductParameter, OrderItem, Order, Contact, \
+    ArchivedOrder, ArchivedOrderItem, BestOffer, OrderTemplate, OrderTemplateItem, ShopWebhook, \
+    WebhookDelivery
+from backend.webhooks import check_url
 
+EXPANDED = 'expanded'  # поле выводится целиком, связанные объекты - вложенными объектами
+INCLUDED = 'included'  # поле выводится, связанные объекты - только id
 
-class ContactSerializer(serializers.ModelSerializer):
+
+def parse_fields(value):
+    """
+    Дерево полей из параметра запроса: "id,ordered_items.quantity" -> {"id": {}, "ordered_items": {"quantity": {}}}
+    """
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+def field_state(selection, path):
+    """
+    Как будет выведено поле при выбранных полях
+    \n:param selection: {"fields": <дерево или None>, "expand": <дерево или None>}
+    \n:param path: путь поля через точку, например ordered_items.product_info
+    \n:return: EXPANDED, INCLUDED или None, если поле не выводится
+    """
+    fields, expand = selection['fields'], selection['expand']
+    if fields is None and expand is None:
+        return EXPANDED
+    names = path.split('.')
+    for depth, name in enumerate(names):
+        if fields and name not in fields:
+            return None
+        subfields = (fields or {}).get(name) or None
+        expanded = name in (expand or {}) or subfields is not None
+        if depth == len(names) - 1:
+            return EXPANDED if expanded else INCLUDED
+        if not expanded:
+            return None
+        fields, expand = subfields, (expand or {}).get(name, {})
+
+
+class DynamicFieldsMixin:
+    """
+    Выбор полей (fields) и раскрытие вложенных объектов (expand) по деревьям из parse_fields.
+    Без обоих аргументов выводятся все поля и все вложенные объекты. Если указан хотя бы один,
+    вложенный сериализатор без выбранных подполей и не указанный в expand выводится как id
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None and expand is None:
+            return
+        expand = expand or {}
+        for name in list(self.fields):
+            if fields and name not in fields:
+                self.fields.pop(name)
+                continue
+            field = self.fields[name]
+            many = isinstance(field, serializers.ListSerializer)
+            nested = field.child if many else field
+            if not isinstance(nested, DynamicFieldsMixin):
+                continue
+            subfields = (fields or {}).get(name) or None
+            if subfields is not None or name in expand:
+                self.fields[name] = type(nested)(many=many, read_only=True, fields=subfields,
+                                                 expand=expand.get(name, {}))
+            else:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(many=many, read_only=True)
+
+
+class ContactSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Contact
         fields = ('id', 'city', 'street', 'building', 'apt', 'user', 'phone', 'house', 'structure')
@@ -17,7 +88,7 @@ class ContactSerializer(serializers.ModelSerializer):
         ]  # проверка на уникальность контактных данных
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     contacts = ContactSerializer(read_only=True, many=True)
 
     class Meta:
@@ -29,7 +100,7 @@ class UserSerializer(serializers.ModelSerializer):
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
-        fields = ('id', 'name')
+        fields = ('id', 'name', 'parent')
         read_only_fields = ('id',)
 
 
@@ -40,7 +111,7 @@ class ShopSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     category = serializers.StringRelatedField()
 
     class Meta:
@@ -56,17 +127,49 @@ class ProductParameterSerializer(serializers.ModelSerializer):
         fields = ('parameter', 'value',)
 
 
-class ProductInfoSerializer(serializers.ModelSerializer):
+class ProductInfoSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
-    product_parameters = ProductParameterSerializer(read_only=True, many=True)
+    product_parameters = serializers.SerializerMethodField()
 
     class Meta:
         model = ProductInfo
         fields = ('id', 'model', 'product', 'shop', 'quantity', 'price', 'price_rrc', 'product_parameters',)
         read_only_fields = ('id',)
 
+    def get_product_parameters(self, obj) -> list:
+        # параметры берутся из документа ProductInfo.parameters без обращения к ProductParameter
+        return [{'parameter': name, 'value': value} for name, value in obj.parameters.items()]
+
+
+class BestOfferSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BestOffer
+        fields = ('product', 'product_info', 'shop', 'price', 'quantity', 'runner_up_product_info', 'runner_up_shop',
+                  'runner_up_price', 'offers',)
+        read_only_fields = fields
+
+
+class CatalogOfferField(serializers.PrimaryKeyRelatedField):
+    """
+    Предложение, наличие которого проверяется по снимку каталога из context['catalog'] без запроса к базе
+    """
+
+    def to_internal_value(self, data):
+        catalog = self.context.get('catalog')
+        if catalog is None or isinstance(data, bool):
+            return super().to_internal_value(data)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if not catalog.has_offer(pk):
+            self.fail('does_not_exist', pk_value=data)
+        return ProductInfo(pk=pk)
+
+
+class OrderItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    product_info = CatalogOfferField(queryset=ProductInfo.objects.all(), required=False, label='Инфо о продукте')
 
-class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = ('id', 'product_info', 'quantity', 'order',)
@@ -80,7 +183,7 @@ class OrderItemCreateSerializer(OrderItemSerializer):
     product_info = ProductInfoSerializer(read_only=True)
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     ordered_items = OrderItemCreateSerializer(read_only=True, many=True)
 
     total_sum = serializers.IntegerField()
@@ -90,3 +193,80 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = ('id', 'ordered_items', 'state', 'dt', 'total_sum', 'contact',)
         read_only_fields = ('id',)
+
+
+class ArchivedOrderItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedOrderItem
+        fields = ('id', 'product_info_id', 'shop', 'product_name', 'model', 'quantity', 'price',)
+        read_only_fields = fields
+
+
+class ArchivedOrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    ordered_items = ArchivedOrderItemSerializer(read_only=True, many=True)
+
+    class Meta:
+        model = ArchivedOrder
+        fields = ('id', 'ordered_items', 'state', 'dt', 'total_sum', 'contact', 'archived_at',)
+        read_only_fields = fields
+
+
+class OrderTemplateItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderTemplateItem
+        fields = ('product', 'shop', 'quantity',)
+
+
+class OrderTemplateSerializer(serializers.ModelSerializer):
+    items = OrderTemplateItemSerializer(many=True, required=False)
+    order = serializers.IntegerField(write_only=True, required=False, help_text='id заказа, позиции которого '
+                                                                               'копируются в шаблон')
+
+    class Meta:
+        model = OrderTemplate
+        fields = ('id', 'name', 'contact', 'run_time', 'next_run_at', 'last_run_at', 'last_result', 'items', 'order',)
+        read_only_fields = ('id', 'next_run_at', 'last_run_at', 'last_result',)
+
+    def validate_items(self, items):
+        """
+        Позиции одного товара одного магазина объединяются с суммой количеств
+        """
+        merged = {}
+        for item in items:
+            key = (item['product'].id, item['shop'].id)
+            if key in merged:
+                merged[key]['quantity'] += item['quantity']
+            else:
+                merged[key] = dict(item)
+        return list(merged.values())
+
+    def validate(self, attrs):
+        user = self.context['request'].user
+        if attrs.get('contact') and attrs['contact'].user_id != user.id:
+            raise serializers.ValidationError({'contact': 'Contact not found'})
+        if 'order' in attrs and not Order.objects.filter(id=attrs['order'], user_id=user.id).exists():
+            raise serializers.ValidationError({'order': 'Order not found'})
+        if not attrs.get('items') and 'order' not in attrs:
+            raise serializers.ValidationError('Specify items or order')
+        return attrs
+
+
+class ShopWebhookSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ShopWebhook
+        fields = ('id', 'url', 'secret', 'is_active', 'created_at',)
+        read_only_fields = ('id', 'secret', 'created_at',)
+
+    def validate_url(self, value):
+        error = check_url(value)
+        if error:
+            raise serializers.ValidationError(error)
+        return value
+
+
+class WebhookDeliverySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WebhookDelivery
+        fields = ('id', 'order_ids', 'state', 'attempts', 'created_at', 'next_attempt_at', 'delivered_at',
+                  'last_error',)
+        read_only_fields = fields
@@ -0,0 +1,15 @@
+"""
+Обработчики сигналов. Задачи импортируются внутри обработчиков, чтобы старт веб-процесса
+не загружал Celery и модули задач.
+"""
+from django.dispatch import receiver
+from django_rest_passwordreset.signals import reset_password_token_created
+
+
+@receiver(reset_password_token_created)
+def password_reset_token_created(sender, reset_password_token, **kwargs):
+    """
+    Отправляем письмо с токеном для сброса пароля
+    """
+    from backend.tasks import password_reset_token_created_message
+    password_reset_token_created_message(reset_password_token, **kwargs)
@@ -0,0 +1,262 @@
+"""
+Поток Server-Sent Events /api/v1/stream для покупателей и витрин.
+
+Параметры запроса:
+    ticket   - одноразовый билет из POST /api/v1/stream/ticket (или заголовок Authorization: Token <key>),
+               подписывает на статусы заказов пользователя; токен в строке запроса не принимается,
+               чтобы он не попадал в журналы доступа;
+    products - id товаров через запятую, подписывает на изменения их остатков и цен.
+
+Все клиенты процесса обслуживаются одним соединением с Redis (Hub): на канал Redis процесс подписывается,
+когда появляется первый слушатель, и отписывается, когда уходит последний. Кадры публикуются уже
+сформированными (backend.push), поэтому рассылка сводится к копированию ссылки на bytes в очереди
+клиентов, а неактивный клиент стоит одну ожидающую корутину и пустую очередь. При ошибке чтения соединение
+с Redis пересоздается и подписка восстанавливается на каналы, у которых есть слушатели.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+import redis.asyncio as redis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from redis.exceptions import RedisError
+
+from backend.push import ORDER_CHANNEL, PRODUCT_CHANNEL, redeem_ticket
+
+logger = logging.getLogger(__name__)
+
+STREAM_PATH = '/api/v1/stream'
+DISCONNECT = object()
+
+
+class Subscriber:
+    """
+    Клиент потока: очередь кадров и признак переполнения (клиент не успевает читать)
+    """
+    __slots__ = ('queue', 'overflow')
+
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=settings.PUSH_QUEUE_SIZE)
+        self.overflow = False
+
+
+class Hub:
+    """
+    Общая для процесса подписка на каналы Redis и рассылка полученных кадров локальным клиентам
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.listeners = defaultdict(set)
+        self.pubsub = None
+        self.reader = None
+        self._lock = None
+
+    @property
+    def lock(self):
+        if self._lock is None:  # создается в цикле событий сервера, а не при импорте модуля
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def connect(self):
+        return redis.Redis.from_url(self.url).pubsub()
+
+    async def subscribe(self, channels, subscriber):
+        """
+        Подписка клиента на каналы; при ошибке Redis исключение передается вызывающему, клиент не регистрируется
+        """
+        async with self.lock:
+            if self.pubsub is None:
+                self.pubsub = self.connect()
+            new_channels = [channel for channel in channels if not self.listeners.get(channel)]
+            if new_channels:
+                await self.pubsub.subscribe(*new_channels)
+            for channel in channels:  # только после подписки в Redis, иначе канал считался бы подписанным
+                self.listeners[channel].add(subscriber)
+            if self.reader is None or self.reader.done():
+                self.reader = asyncio.create_task(self.read())
+
+    async def unsubscribe(self, channels, subscriber):
+        async with self.lock:
+            unused = []
+            for channel in channels:
+                self.listeners[channel].discard(subscriber)
+                if not self.listeners[channel]:
+                    del self.listeners[channel]
+                    unused.append(channel)
+            if unused:
+                try:
+                    await self.pubsub.unsubscribe(*unused)
+                except RedisError:  # при переподключении подписка восстановится только на оставшиеся каналы
+                    pass
+
+    def dispatch(self, channel, data):
+        for subscriber in self.listeners.get(channel, ()):
+            try:
+                subscriber.queue.put_nowait(data)
+            except asyncio.QueueFull:
+                subscriber.overflow = True
+
+    async def read(self):
+        try:
+            while True:
+                try:
+                    message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as error:  # RedisError, OSError, RuntimeError из pubsub без соединения
+                    logger.warning('Stream hub lost connection to Redis: %s', error)
+                    await asyncio.sleep(1)
+                    await self.reconnect()
+                    continue
+                if message and message['type'] == 'message':
+                    self.dispatch(message['channel'].decode(), message['data'])
+        finally:
+            if self.reader is asyncio.current_task():  # следующая подписка запустит чтение заново
+                self.reader = None
+
+    async def reconnect(self):
+        """
+        Новое соединение с Redis и подписка на каналы, у которых есть слушатели
+        """
+        async with self.lock:
+            previous, self.pubsub = self.pubsub, self.connect()
+            if previous is not None:
+                try:
+                    await previous.close()
+                except Exception:
+                    pass
+            channels = [channel for channel, listeners in self.listeners.items() if listeners]
+            if channels:
+                try:
+                    await self.pubsub.subscribe(*channels)
+                except (RedisError, OSError) as error:  # следующее чтение завершится ошибкой и повторит попытку
+                    logger.warning('Stream hub failed to resubscribe: %s', error)
+
+    async def close(self):
+        if self.reader is not None:
+            self.reader.cancel()
+            self.reader = None
+        if self.pubsub is not None:
+            await self.pubsub.close()
+            self.pubsub = None
+
+
+def _token_user_id(key):
+    from rest_framework.authtoken.models import Token
+    try:
+        return Token.objects.filter(key=key).values_list('user_id', flat=True).first()
+    finally:
+        connection.close()  # поток sync_to_async не закрывает соединения сам
+
+
+def _parse_request(scope):
+    """
+    Ключ токена из заголовка, билет и id товаров из запроса
+    \n:return: кортеж (ключ токена или None, билет или None, список id товаров)
+    """
+    query = parse_qs(scope.get('query_string', b'').decode())
+    key = None
+    for name, value in scope.get('headers', ()):
+        if name == b'authorization' and value.startswith(b'Token '):
+            key = value[len(b'Token '):].decode()
+    products = [product for value in query.get('products', ()) for product in value.split(',') if product]
+    return key, query.get('ticket', [None])[0], [int(product) for product in products]
+
+
+async def _respond(send, status, message):
+    body = f'{{"Status":false,"Errors":"{message}"}}'.encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class StreamApplication:
+    """
+    ASGI-приложение: /api/v1/stream обслуживается здесь, остальные запросы передаются Django
+    """
+
+    def __init__(self, application, hub=None):
+        self.application = application
+        self.hub = hub or Hub(settings.PUSH_REDIS_URL)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and scope['path'].rstrip('/') == STREAM_PATH:
+            return await self.stream(scope, receive, send)
+        return await self.application(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.hub.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def stream(self, scope, receive, send):
+        try:
+            key, ticket, products = _parse_request(scope)
+        except ValueError:
+            return await _respond(send, 400, 'Invalid products')
+        if len(products) > settings.PUSH_MAX_PRODUCTS:
+            return await _respond(send, 400, f'Too many products, max {settings.PUSH_MAX_PRODUCTS}')
+        channels = [PRODUCT_CHANNEL.format(product) for product in dict.fromkeys(products)]
+        if key is not None:
+            user_id = await sync_to_async(_token_user_id)(key)
+            if user_id is None:
+                return await _respond(send, 401, 'Invalid token')
+            channels.append(ORDER_CHANNEL.format(user_id))
+        elif ticket is not None:
+            user_id = await sync_to_async(redeem_ticket)(ticket)
+            if user_id is None:
+                return await _respond(send, 401, 'Invalid ticket')
+            channels.append(ORDER_CHANNEL.format(user_id))
+        if not channels:
+            return await _respond(send, 400, 'All necessary arguments are not specified')
+
+        subscriber = Subscriber()
+        try:
+            await self.hub.subscribe(channels, subscriber)
+        except (RedisError, OSError) as error:
+            logger.warning('Stream hub failed to subscribe: %s', error)
+            return await _respond(send, 503, 'Stream is unavailable')
+        watcher = asyncio.create_task(self.wait_disconnect(receive, subscriber))
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),  # nginx не должен буферизовать поток
+            ]})
+            await send({'type': 'http.response.body', 'body': b': connected\n\n', 'more_body': True})
+            while True:
+                try:
+                    data = await asyncio.wait_for(subscriber.queue.get(), settings.PUSH_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    data = b': ping\n\n'
+                if data is DISCONNECT:
+                    break
+                if subscriber.overflow:  # клиент пропустил события и должен перечитать состояние
+                    await send({'type': 'http.response.body', 'body': b'event: reset\ndata: {}\n\n'})
+                    break
+                await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+        finally:
+            watcher.cancel()
+            await self.hub.unsubscribe(channels, subscriber)
+
+    @staticmethod
+    async def wait_disconnect(receive, subscriber):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        while True:
+            try:
+                subscriber.queue.put_nowait(DISCONNECT)
+                return
+            except asyncio.QueueFull:
+                subscriber.queue.get_nowait()
@@ -0,0 +1,205 @@
+"""
+Подсказки названий товаров при вводе (products/suggest) по префиксному индексу в памяти процесса.
+
+Индекс строится из названий товаров, моделей предложений и сегментов модели (apple/iphone/xr -> apple, iphone, xr)
+и перестраивается после импорта прайса или изменения остатков, когда меняется счетчик версий каталога. Пока новый
+индекс строится, подсказки отдаются из прежнего. Если включен снимок каталога (backend.catalog), индекс строится
+из него без запросов к базе.
+
+Товары в индексе упорядочены по количеству предложений в наличии и названию, позиция товара - его место в выдаче.
+Для префиксов, с которых начинается не меньше SUGGEST_CACHED_PREFIX_ENTRIES терминов, лучшие позиции вычисляются
+при построении, остальные диапазоны терминов достаточно малы, чтобы отсортировать их при запросе.
+"""
+import heapq
+import re
+from array import array
+from bisect import bisect_left
+from itertools import islice
+
+from django.conf import settings
+
+from backend.catalog import VersionedValue, get_snapshot, _rows
+from backend.models import Category, Product, ProductInfo, Shop
+
+WORD = re.compile(r'\w+')
+MAX_CHAR = '\U0010ffff'  # больше любого символа: prefix + MAX_CHAR - граница диапазона терминов с префиксом
+
+
+def normalize(text):
+    return text.lower().replace('ё', 'е')
+
+
+def product_terms(name, models):
+    """
+    Термины товара: слова названия, модели целиком, их сегменты через "/" и слова моделей
+    """
+    terms = set(WORD.findall(normalize(name)))
+    for model in models:
+        model = normalize(model).strip()
+        terms.add(model)
+        terms.update(segment.strip() for segment in model.split('/'))
+        terms.update(WORD.findall(model))
+    terms.discard('')
+    return terms
+
+
+class SuggestIndex:
+    """
+    Отсортированный список терминов с позициями товаров
+    """
+    __slots__ = ('product_ids', 'names', 'category_ids', 'offers', 'texts', 'terms', 'term_positions', 'top',
+                 'category_positions', 'category_paths')
+
+    def __init__(self, products, offers, active_shop_ids, categories=()):
+        """
+        \n:param products: строки (id, название, id категории)
+        \n:param offers: строки (id товара, id магазина, модель, количество)
+        \n:param active_shop_ids: id магазинов, принимающих заказы
+        \n:param categories: строки (id категории, путь) для отбора по поддереву категорий
+        """
+        self.category_paths = dict(categories)
+        in_stock, models = {}, {}
+        for product_id, shop_id, model, quantity in offers:
+            if model:
+                models.setdefault(product_id, set()).add(model)
+            if quantity > 0 and shop_id in active_shop_ids:
+                in_stock[product_id] = in_stock.get(product_id, 0) + 1
+        products = sorted(products, key=lambda row: (-in_stock.get(row[0], 0), normalize(row[1]), row[0]))
+
+        self.product_ids, self.category_ids, self.offers = array('q'), array('q'), array('i')
+        self.names, self.texts, self.category_positions = [], [], {}
+        entries = []
+        for position, (product_id, name, category_id) in enumerate(products):
+            terms = product_terms(name, models.get(product_id, ()))
+            self.product_ids.append(product_id)
+            self.category_ids.append(category_id)
+            self.offers.append(in_stock.get(product_id, 0))
+            self.names.append(name)
+            self.category_positions.setdefault(category_id, array('i')).append(position)
+            self.texts.append(' ' + ' '.join(terms))  # " <слово>" в тексте - есть термин с таким префиксом
+            entries.extend((term, position) for term in terms)
+        entries.sort()
+        self.terms = [term for term, _ in entries]
+        self.term_positions = array('i', (position for _, position in entries))
+
+        self.top = {}
+        self._cache_top(0, len(self.terms), 1)
+
+    def _cache_top(self, start, stop, length):
+        """
+        Лучшие позиции префиксов длины length и длиннее в диапазоне терминов, с которых начинается много терминов
+        """
+        terms, index = self.terms, start
+        while index < stop:
+            prefix = terms[index][:length]
+            if len(prefix) < length:  # термин короче префикса, следующие термины длиннее
+                index += 1
+                continue
+            end = bisect_left(terms, prefix + MAX_CHAR, index, stop)
+            if end - index >= settings.SUGGEST_CACHED_PREFIX_ENTRIES:
+                self.top[prefix] = array('i', heapq.nsmallest(settings.SUGGEST_CACHED_TOP,
+                                                              set(self.term_positions[index:end])))
+                self._cache_top(index, end, length + 1)
+            index = end
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def positions(self, prefix, use_top=True):
+        """
+        Позиции товаров с термином, начинающимся с префикса, в порядке выдачи
+        \n:param use_top: брать вычисленные при построении лучшие позиции частого префикса
+        \n:return: (позиции, полный ли список)
+        """
+        cached = self.top.get(prefix) if use_top else None
+        if cached is not None:
+            return cached, len(cached) < settings.SUGGEST_CACHED_TOP
+        return sorted(set(self.term_positions[slice(*self.term_range(prefix))])), True
+
+    def term_range(self, prefix):
+        start = bisect_left(self.terms, prefix)
+        return start, bisect_left(self.terms, prefix + MAX_CHAR, start)
+
+    def term_count(self, prefix):
+        start, stop = self.term_range(prefix)
+        return stop - start
+
+    def subtree(self, category_id):
+        """
+        id категории и всех вложенных в нее категорий
+        """
+        path = self.category_paths.get(category_id)
+        if not path:
+            return {category_id}
+        return {item for item, item_path in self.category_paths.items() if item_path.startswith(path)}
+
+    def suggest(self, query, limit, category_id=None, in_stock=False):
+        """
+        Товары, в названии или модели которых есть слова, начинающиеся с каждого слова запроса
+        \n:param query: строка запроса
+        \n:param limit: максимальное количество подсказок
+        \n:param category_id: только товары категории и вложенных в нее категорий
+        \n:param in_stock: только товары с предложениями в наличии
+        \n:return: список {"id", "name", "category", "offers"}
+        """
+        words = set(normalize(query).split())
+        if not words:
+            return []
+        # кандидаты - по слову с самым узким диапазоном терминов, остальные слова проверяются по тексту товара
+        first = min(words, key=self.term_count)
+        others = [' ' + word for word in words if word != first]
+        categories = self.subtree(category_id) if category_id is not None else None
+
+        def matches(position):
+            return (categories is None or self.category_ids[position] in categories) and (
+                not in_stock or self.offers[position] > 0) and all(word in self.texts[position] for word in others)
+
+        positions, complete = self.positions(first)
+        found = list(islice(filter(matches, positions), limit))
+        if len(found) < limit and not complete:  # среди лучших по префиксу не хватило подходящих
+            if categories is not None:  # товары категорий в порядке выдачи с проверкой префикса по тексту
+                first_word = ' ' + first
+                positions = (position for position in heapq.merge(*(
+                    self.category_positions.get(category, ()) for category in categories))
+                             if first_word in self.texts[position])
+            else:
+                positions, _ = self.positions(first, use_top=False)
+            found = list(islice(filter(matches, positions), limit))
+        return [{'id': self.product_ids[position], 'name': self.names[position],
+                 'category': self.category_ids[position], 'offers': self.offers[position]} for position in found]
+
+
+def load_index(version=None):
+    """
+    Построение индекса по снимку каталога, если он включен и актуален, иначе по базе
+    """
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return SuggestIndex(
+            ((product.id, product.name, product.category_id) for product in snapshot.products.values()),
+            zip(snapshot.product_ids, snapshot.shop_ids, (snapshot.models[ref] for ref in snapshot.model_refs),
+                snapshot.quantities),
+            {shop.id for shop in snapshot.shops.values() if shop.state},
+            ((category.id, category.path) for category in snapshot.categories.values()))
+    chunk_size = settings.CATALOG_SNAPSHOT_CHUNK_SIZE
+    return SuggestIndex(
+        _rows(Product.objects.all(), ('id', 'name', 'category_id'), chunk_size),
+        (row[1:] for row in _rows(ProductInfo.objects.all(), ('id', 'product_id', 'shop_id', 'model', 'quantity'),
+                                  chunk_size)),
+        set(Shop.objects.filter(state=True).values_list('id', flat=True)),
+        Category.objects.values_list('id', 'path'))
+
+
+_index = VersionedValue(load_index, 'SUGGEST_REBUILD_INTERVAL', stale=True)
+
+
+def get_index():
+    """
+    Индекс подсказок процесса; первый запрос ждет построения, при изменении каталога до окончания
+    перестроения отдается прежний индекс
+    """
+    return _index.get()
+
+
+def reset_index():
+    _index.reset()
@@ -1,17 +1,27 @@
-import json
+from datetime import timedelta
 
-from django.core.mail import send_mail
-from django.db.models import Sum, F
-from django.dispatch import receiver
-from django_rest_passwordreset.signals import reset_password_token_created
+from django.conf import settings
+from django.core.mail import send_mail, send_mass_mail
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from celery import group
 from shopping_service.celery import app
 from shopping_service.settings import EMAIL_HOST_USER
-from backend.models import Order, User, ConfirmEmailToken, ProductInfo
+from backend.models import Order, User, ConfirmEmailToken, OrderItem, ArchivedOrder, ArchivedOrderItem, \
+    Shop, WebhookDelivery
+from backend import analytics, invoices, outbox, push
+from backend.exports import export_to_file
+from backend.importer import load_feed, import_shop, poll_shop
+from backend.offers import affected_products, refresh_best_offers
+from backend.order_templates import run_due_templates
+from backend.versions import bump_catalog_version, bump_order_version
+from backend.webhooks import deliver, enqueue_orders, schedule
 
 from_email = EMAIL_HOST_USER
 
 
-@receiver(reset_password_token_created)
 @app.task()
 def password_reset_token_created_message(reset_password_token, **kwargs):
     """
@@ -40,27 +50,13 @@ def new_user_register_send_message(user_id, **kwargs):
 @app.task()
 def new_order_send_message(user_id, order_id, **kwargs):
     """
-    Отправляем письмо с подтверждением заказа
-    :param user_id: id пользователя
-    :param order_id: id заказа
-    :return: отправляет письмо с данными о заказе и контактными данными покупателя
-    """
-    try:
-        order = Order.objects.filter(
-            user_id=user_id, id=order_id).exclude(state='basket').select_related('contact').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
-        user = User.objects.get(id=user_id)
-        content = []
-        for item in order:
-            data = [f'Your order # {item.id} has been processed\nState: {item.state},\nTotal sum: {item.total_sum}'
-                    f'\nRecipient name: {item.contact.user}'
-                    f'\nAddress: {item.contact.city}, {item.contact.street}, {item.contact.house}'
-                    f'\nPhone: {item.contact.phone}']
-            content.append(*data)
-        subject, recipient_list = f"Обновление статуса заказа", [user.email, ]
-        send_mail(subject, *content, from_email, recipient_list)
-    except BaseException as error:
-        raise error
+    Отправляем письмо с накладной по заказу
+    \n:param user_id: id пользователя
+    \n:param order_id: id заказа
+    \n:return: количество отправленных писем
+    """
+    orders = [order for order in invoices.load_orders([order_id]) if order.user_id == user_id]
+    return invoices.send_messages(invoices.customer_messages(orders))
 
 
 @app.task()
@@ -75,3 +71,318 @@ def canceled_order_send_mail(user_id, order_id, **kwargs):
     data = f"Your order # {str(order_id)}  has been cancelled."
     subject, recipient_list = f"Обновление статуса заказа", [user.email, ]
     send_mail(subject, data, from_email, recipient_list)
+
+
+@app.task()
+def archive_orders(days=None, batch_size=500):
+    """
+    Перенос доставленных и отмененных заказов старше days дней в архивные таблицы.
+    Цены позиций и сумма заказа берутся из предложений на момент архивации: OrderItem цену не хранит
+    \n:param days: возраст заказа в днях, по умолчанию ORDER_ARCHIVE_AFTER_DAYS
+    \n:param batch_size: количество заказов, переносимых в одной транзакции
+    \n:return: количество перенесенных заказов
+    """
+    days = settings.ORDER_ARCHIVE_AFTER_DAYS if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    archived = 0
+    while True:
+        with transaction.atomic():
+            order_ids = list(Order.objects.select_for_update(skip_locked=True).filter(
+                state__in=('delivered', 'canceled'), dt__lt=cutoff).values_list('id', flat=True)[:batch_size])
+            if not order_ids:
+                return archived
+            orders = list(Order.objects.filter(id__in=order_ids).select_related('contact'))
+            items = OrderItem.objects.filter(order_id__in=order_ids).select_related('product_info__product')
+            totals = {}
+            archived_items = []
+            for item in items:
+                totals[item.order_id] = totals.get(item.order_id, 0) + item.quantity * item.product_info.price
+                archived_items.append(ArchivedOrderItem(order_id=item.order_id,
+                                                        product_info_id=item.product_info_id,
+                                                        shop_id=item.product_info.shop_id,
+                                                        product_name=item.product_info.product.name,
+                                                        model=item.product_info.model,
+                                                        quantity=item.quantity,
+                                                        price=item.product_info.price))
+            ArchivedOrder.objects.bulk_create([
+                ArchivedOrder(id=order.id, user_id=order.user_id, dt=order.dt, state=order.state,
+                              contact=f'{order.contact}, {order.contact.phone}' if order.contact else '',
+                              total_sum=totals.get(order.id, 0), rollup_state=order.rollup_state)
+                for order in orders])
+            ArchivedOrderItem.objects.bulk_create(archived_items)
+            Order.objects.filter(id__in=order_ids).delete()
+            archived += len(order_ids)
+        # заказы пропали из списков покупателей: ETag списка заказов должен измениться после фиксации части
+        bump_order_version(*(order.user_id for order in orders))
+
+
+@app.task()
+def send_invoice_digest():
+    """
+    Отправка администратору сводки накладных по заказам, оформленным после предыдущей сводки.
+    Заказы блокируются до отправки письма, поэтому параллельный запуск не отправит их повторно
+    \n:return: количество заказов в сводке
+    """
+    if not settings.INVOICE_ADMIN_EMAILS:
+        return 0
+    with transaction.atomic():
+        order_ids = list(Order.objects.select_for_update(skip_locked=True).filter(invoiced_at__isnull=True).exclude(
+            state='basket').order_by('id').values_list('id', flat=True)[:settings.INVOICE_DIGEST_MAX_ORDERS])
+        if order_ids:
+            invoices.send_messages([invoices.digest_message(invoices.load_orders(order_ids))])
+            Order.objects.filter(id__in=order_ids).update(invoiced_at=timezone.now())
+    return len(order_ids)
+
+
+@app.task()
+def relay_outbox():
+    """
+    Передача накопленных событий outbox потребителям пачками
+    \n:return: количество обработанных событий
+    """
+    processed = 0
+    while True:
+        count = outbox.relay()
+        if not count:
+            return processed
+        processed += count
+
+
+@app.task()
+def purge_outbox():
+    """
+    Удаление обработанных событий старше OUTBOX_RETENTION_DAYS дней
+    """
+    cutoff = timezone.now() - timedelta(days=settings.OUTBOX_RETENTION_DAYS)
+    return outbox.OutboxEvent.objects.filter(processed_at__lt=cutoff).delete()[0]
+
+
+@outbox.consumer('catalog.updated')
+def invalidate_catalog_versions(events):
+    """
+    Сброс версий каталога после импорта или изменения статуса магазина
+    """
+    bump_catalog_version(*(shop_id for event in events for shop_id in event['shop_ids']))
+
+
+@outbox.consumer('catalog.updated', 'order.new', 'order.canceled')
+def refresh_best_offer_index(events):
+    """
+    Пересчет лучших предложений товаров, цены или остатки которых изменились.
+    Версии каталога сбрасываются после фиксации пересчета, чтобы products/best не закэшировался со старыми данными
+    """
+    refresh_best_offers(affected_products(events))
+    shop_ids = [shop_id for event in events for shop_id in event.get('shop_ids', ())]
+    if shop_ids:
+        transaction.on_commit(lambda: bump_catalog_version(*shop_ids))
+
+
+@outbox.consumer('order.new')
+def send_new_order_messages(events):
+    """
+    Отправка накладных по новым заказам одной пачкой через одно соединение с почтовым сервером
+    """
+    orders = invoices.load_orders([event['order_id'] for event in events])
+    invoices.send_messages(invoices.customer_messages([order for order in orders if order.contact_id]))
+
+
+@outbox.consumer('order.canceled')
+def send_canceled_order_messages(events):
+    """
+    Отправка уведомлений об отмене заказов одной пачкой
+    """
+    emails = dict(User.objects.filter(id__in={event['user_id'] for event in events}).values_list('id', 'email'))
+    send_mass_mail([("Обновление статуса заказа", f"Your order # {event['order_id']}  has been cancelled.",
+                     from_email, [emails[event['user_id']]]) for event in events if event['user_id'] in emails])
+
+
+def _push_after_commit(messages):
+    if messages:
+        transaction.on_commit(lambda: push.publish(messages))
+
+
+@outbox.consumer('order.new')
+def push_new_orders(events):
+    """
+    Публикация статусов новых заказов подписанным покупателям
+    """
+    _push_after_commit(push.order_messages('order.new', events))
+
+
+@outbox.consumer('order.updated')
+def push_order_updates(events):
+    """
+    Публикация смены статусов заказов подписанным покупателям
+    """
+    _push_after_commit(push.order_messages('order.updated', events))
+
+
+@outbox.consumer('order.canceled')
+def push_canceled_orders(events):
+    """
+    Публикация отмены заказов подписанным покупателям
+    """
+    _push_after_commit(push.order_messages('order.canceled', events))
+
+
+@outbox.consumer('catalog.updated', 'order.new', 'order.canceled')
+def push_stock_changes(events):
+    """
+    Публикация остатков товаров, на которые подписаны клиенты
+    """
+    watched = push.watched_products()
+    if watched:
+        _push_after_commit(push.stock_messages(events, watched))
+
+
+@outbox.consumer('order.new')
+def enqueue_order_webhooks(events):
+    """
+    Добавление новых заказов в пачки уведомлений магазинов, отправка новых пачек планируется
+    на конец окна WEBHOOK_BATCH_WINDOW после фиксации транзакции
+    """
+    delivery_ids = [delivery.id for delivery in enqueue_orders(events)]
+    if delivery_ids:
+        transaction.on_commit(lambda: [schedule(delivery_id, settings.WEBHOOK_BATCH_WINDOW)
+                                       for delivery_id in delivery_ids])
+
+
+@outbox.consumer('order.new', 'order.updated')
+def record_order_sales(events):
+    """
+    Учет оформленных заказов и смены их статусов в сводке продаж магазинов
+    """
+    analytics.record_orders({event['order_id'] for event in events})
+
+
+@app.task()
+def rebuild_sales_rollups(chunk_size=None):
+    """
+    Полный пересчет сводки продаж магазинов по текущим и архивным заказам частями
+    \n:param chunk_size: количество заказов в одной транзакции, по умолчанию ANALYTICS_REBUILD_CHUNK_SIZE
+    \n:return: количество учтенных заказов
+    """
+    return analytics.rebuild(chunk_size)
+
+
+@app.task()
+def deliver_webhook(delivery_id):
+    """
+    Отправка пачки уведомлений о новых заказах на адрес подписки магазина, при ошибке повтор
+    планируется с экспоненциально растущей задержкой
+    \n:param delivery_id: id пачки
+    """
+    countdown = deliver(delivery_id)
+    if countdown is not None:
+        schedule(delivery_id, countdown)
+
+
+@app.task()
+def deliver_due_webhooks():
+    """
+    Постановка задач отправки пачек, время отправки которых прошло, а задача не была поставлена
+    или потеряна воркером
+    \n:return: id поставленных пачек
+    """
+    overdue = timezone.now() - timedelta(seconds=settings.WEBHOOK_TIMEOUT * 2)
+    delivery_ids = list(WebhookDelivery.objects.filter(state__in=['pending', 'sending'], next_attempt_at__lte=overdue)
+                        .order_by('next_attempt_at').values_list('id', flat=True)[:settings.WEBHOOK_SWEEP_BATCH_SIZE])
+    for delivery_id in delivery_ids:
+        schedule(delivery_id, 0)
+    return delivery_ids
+
+
+@app.task()
+def import_shop_feed(user_id, file=None, url=None):
+    """
+    Импорт прайса одного поставщика
+    \n:param user_id: id пользователя-поставщика
+    \n:param file: путь к yaml файлу
+    \n:param url: ссылка на yaml файл
+    \n:return: id магазина и количество загруженных товаров
+    """
+    data = load_feed(filename=file, url=url)
+    shop = import_shop(user_id, data, filename=file, url=url)
+    return {'shop_id': shop.id, 'goods': len(data['goods'])}
+
+
+@app.task()
+def import_shop_feeds(feeds):
+    """
+    Параллельный импорт прайсов: каждый прайс обрабатывается отдельной задачей на свободном воркере,
+    импорты одного магазина выполняются по очереди
+    \n:param feeds: список словарей формата {"user_id": <int>, "file": <str>} или {"user_id": <int>, "url": <str>}
+    \n:return: id поставленных задач
+    """
+    result = group(import_shop_feed.s(**feed) for feed in feeds).apply_async()
+    return [child.id for child in result.children]
+
+
+@app.task()
+def poll_shop_feed(shop_id):
+    """
+    Проверка прайса магазина и импорт, если прайс изменился
+    \n:param shop_id: id магазина
+    \n:return: True, если прайс был загружен
+    """
+    shop = Shop.objects.filter(id=shop_id, user__isnull=False).first()
+    if shop is None:
+        return False
+    return poll_shop(shop)
+
+
+@app.task()
+def poll_shop_feeds():
+    """
+    Постановка задач проверки прайсов магазинов, у которых подошел срок проверки.
+    Срок проверки сдвигается до постановки задач, поэтому магазин не проверяется дважды,
+    если задача еще не выполнена к следующему запуску
+    \n:return: id магазинов, поставленных на проверку
+    """
+    now = timezone.now()
+    due = Shop.objects.filter(Q(next_poll_at__isnull=True) | Q(next_poll_at__lte=now),
+                              user__isnull=False, poll_interval__gt=0).exclude(filename__isnull=True, url__isnull=True)
+    shop_ids = list(due.values_list('id', flat=True)[:settings.FEED_POLL_BATCH_SIZE])
+    Shop.objects.filter(id__in=shop_ids).update(
+        next_poll_at=now + timedelta(seconds=settings.FEED_FETCH_TIMEOUT * 10))
+    for shop_id in shop_ids:
+        poll_shop_feed.delay(shop_id)
+    return shop_ids
+
+
+@app.task()
+def export_shop_orders(shop_id, date_from, date_to, export_format='csv'):
+    """
+    Выгрузка позиций заказов магазина за период в файл EXPORT_DIR; повторный запуск с теми же параметрами
+    после сбоя продолжает незавершенную выгрузку
+    \n:param shop_id: id магазина
+    \n:param date_from: начало периода в ISO формате (включительно)
+    \n:param date_to: конец периода в ISO формате (не включительно)
+    \n:param export_format: csv или ndjson
+    \n:return: путь к файлу и количество строк, записанных этим запуском
+    """
+    path, rows = export_to_file(shop_id, parse_datetime(date_from), parse_datetime(date_to), export_format)
+    return {'path': path, 'rows': rows}
+
+
+def _shortage_text(result):
+    lines = [f'product {shortage["product"]}, shop {shortage["shop"]}: requested {shortage["requested"]}, '
+             f'available {shortage["available"]}' for shortage in result['shortages']]
+    header = f'Order # {result["order_id"]} has been placed from template # {result["template_id"]}' \
+        if result['order_id'] else f'Order from template # {result["template_id"]} has not been placed'
+    return header + '\nNot enough stock:\n' + '\n'.join(lines)
+
+
+@app.task()
+def run_order_templates():
+    """
+    Оформление заказов по шаблонам, время которых подошло, и отправка покупателям отчетов о нехватке остатков
+    \n:return: количество обработанных шаблонов, оформленных заказов и шаблонов с нехваткой остатков
+    """
+    results = run_due_templates(batch_size=settings.ORDER_TEMPLATE_BATCH_SIZE)
+    shortages = [result for result in results if result['shortages']]
+    emails = dict(User.objects.filter(id__in={result['user_id'] for result in shortages}).values_list('id', 'email'))
+    send_mass_mail([('Нехватка товаров по шаблону заказа', _shortage_text(result), from_email,
+                     [emails[result['user_id']]]) for result in shortages])
+    return {'templates': len(results), 'orders': sum(1 for result in results if result['order_id']),
+            'shortages': len(shortages)}
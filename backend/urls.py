@@ -4,19 +4,31 @@ from django_rest_passwordreset.views import reset_password_request_token, reset_
 from backend.views import PartnerUpdate, RegisterAccount, LoginAccount, CategoryView, ShopView, \
     BasketViewSet, \
     AccountDetailsViewSet, ConfirmAccount, \
-    ProductInfoView, ContactView, OrderViewSet, PartnerStateViewSet, PartnerOrdersViewSet
+    ProductInfoView, ContactView, OrderViewSet, PartnerStateViewSet, PartnerOrdersViewSet, ArchivedOrderViewSet, \
+    PartnerArchivedOrdersViewSet, PartnerStock, ProductPriceHistoryView, \
+    BestOfferView, ProductSuggestView, OrderTemplateViewSet, PartnerWebhookViewSet, PartnerOrderExport, BatchView, \
+    PartnerAnalytics, StreamTicketView
 
 r = DefaultRouter()
 r.register('basket', BasketViewSet)
+r.register('order/archive', ArchivedOrderViewSet, basename='order-archive')
+r.register('order/templates', OrderTemplateViewSet, basename='order-templates')
 r.register('order', OrderViewSet)
 r.register('partner/state', PartnerStateViewSet)
+r.register('partner/orders/archive', PartnerArchivedOrdersViewSet, basename='partner-orders-archive')
 r.register('partner/orders', PartnerOrdersViewSet)
+r.register('partner/webhooks', PartnerWebhookViewSet, basename='partner-webhooks')
 r.register('user/details', AccountDetailsViewSet)
 
 app_name = 'backend'
 urlpatterns = [
+    path('batch', BatchView.as_view(), name='batch'),
+    path('stream/ticket', StreamTicketView.as_view(), name='stream-ticket'),
     re_path(r'^user/contact', ContactView.as_view(), name='contact'),
     re_path(r'^partner/update', PartnerUpdate.as_view(), name='partner-update'),
+    path('partner/stock', PartnerStock.as_view(), name='partner-stock'),
+    path('partner/orders/export', PartnerOrderExport.as_view(), name='partner-orders-export'),
+    path('partner/analytics', PartnerAnalytics.as_view(), name='partner-analytics'),
     path('user/register', RegisterAccount.as_view(), name='user-register'),
     path('user/register/confirm', ConfirmAccount.as_view(), name='user-register-confirm'),
     re_path(r'^user/login', LoginAccount.as_view(), name='user-login'),
@@ -24,5 +36,8 @@ urlpatterns = [
     re_path(r'^user/password_reset/confirm', reset_password_confirm, name='password-reset-confirm'),
     re_path(r'^categories', CategoryView.as_view(), name='categories'),
     re_path(r'^shops', ShopView.as_view(), name='shops'),
+    path('products/best', BestOfferView.as_view(), name='products-best'),
+    path('products/suggest', ProductSuggestView.as_view(), name='products-suggest'),
+    path('products/<int:product_id>/prices', ProductPriceHistoryView.as_view(), name='product-prices'),
     re_path(r'^products', ProductInfoView.as_view(), name='products'),
 ] + r.urls
@@ -0,0 +1,128 @@
+"""
+Счетчики версий каталога и заказов для условных GET-запросов (ETag / Last-Modified).
+
+Счетчики хранятся в кэше (Redis) и увеличиваются при импорте прайса, смене статуса магазина,
+оформлении и отмене заказа. Ответ 304 Not Modified отдается до выполнения запроса к базе
+и сериализации.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+CATALOG_VERSION_KEY = 'version:catalog'
+SHOP_VERSION_KEY = 'version:shop:{}'
+ORDER_VERSION_KEY = 'version:order:{}'
+
+
+def _modified_key(key):
+    return f'{key}:modified'
+
+
+def _seed():
+    # начальное значение счетчика зависит от времени, чтобы после очистки кэша версии не повторялись
+    return int(time.time() * 1000)
+
+
+def _bump(*keys):
+    """
+    Увеличивает счетчики версий и запоминает время изменения
+    \n:param keys: ключи счетчиков
+    """
+    try:
+        now = time.time()
+        for key in keys:
+            if not cache.add(key, _seed(), timeout=None):
+                cache.incr(key)
+            cache.set(_modified_key(key), now, timeout=None)
+    except Exception:  # недоступность кэша не должна ломать запись данных, условные запросы просто отключатся
+        pass
+
+
+def _read(*keys):
+    """
+    Читает счетчики версий одним запросом к кэшу
+    \n:param keys: ключи счетчиков
+    \n:return: кортеж (строка версий, время последнего изменения) или None, если кэш недоступен
+    """
+    try:
+        all_keys = [*keys, *map(_modified_key, keys)]
+        values = cache.get_many(all_keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            now = time.time()
+            for key in missing:
+                cache.add(key, _seed(), timeout=None)
+                cache.add(_modified_key(key), now, timeout=None)
+            values = cache.get_many(all_keys)
+    except Exception:
+        return None
+    versions = ':'.join(str(values.get(key)) for key in keys)
+    modified = max((values.get(_modified_key(key)) or 0 for key in keys), default=0)
+    return versions, modified
+
+
+def bump_catalog_version(*shop_ids):
+    """
+    Отмечает изменение каталога магазинов (импорт, изменение остатков или статуса магазина)
+    \n:param shop_ids: id магазинов, данные которых изменились
+    """
+    _bump(CATALOG_VERSION_KEY, *(SHOP_VERSION_KEY.format(shop_id) for shop_id in set(shop_ids)))
+
+
+def bump_order_version(*user_ids):
+    """
+    Отмечает изменение списка заказов пользователей (оформление или отмена заказа)
+    \n:param user_ids: id пользователей
+    """
+    _bump(*(ORDER_VERSION_KEY.format(user_id) for user_id in set(user_ids)))
+
+
+def catalog_version_keys(request):
+    shop_id = request.query_params.get('shop_id')
+    if shop_id and shop_id.isdigit() and not request.query_params.get('product_id'):
+        return SHOP_VERSION_KEY.format(shop_id),
+    return CATALOG_VERSION_KEY,
+
+
+def order_version_keys(request):
+    return ORDER_VERSION_KEY.format(request.user.id),
+
+
+def _get_versions(request, keys_func):
+    cached = getattr(request, '_resource_versions', None)
+    if cached is None:
+        cached = _read(*keys_func(request)) or ()
+        request._resource_versions = cached
+    return cached or None
+
+
+def versioned(keys_func, name='get', window_func=None):
+    """
+    Декоратор класса представления, добавляющий ETag и Last-Modified на основе счетчиков версий
+    \n:param keys_func: функция, возвращающая ключи счетчиков для запроса
+    \n:param name: имя метода представления
+    \n:param window_func: функция, возвращающая момент начала текущего скользящего периода ответа или None;
+            ответ меняется со сменой периода, поэтому момент входит в ETag и ограничивает Last-Modified снизу
+    """
+    def etag(request, *args, **kwargs):
+        versions = _get_versions(request, keys_func)
+        if versions is None:
+            return None
+        window = window_func(request) if window_func else None
+        source = '|'.join((request.path, versions[0], str(request.user.id), request.META.get('QUERY_STRING', ''),
+                           request.META.get('HTTP_ACCEPT', ''), window.isoformat() if window else ''))
+        return hashlib.md5(source.encode('utf-8')).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        versions = _get_versions(request, keys_func)
+        if not versions or not versions[1]:
+            return None
+        modified = datetime.fromtimestamp(versions[1], tz=dt_timezone.utc)
+        window = window_func(request) if window_func else None
+        return max(modified, window) if window else modified
+
+    return method_decorator(condition(etag_func=etag, last_modified_func=last_modified), name=name)
@@ -1,29 +1,105 @@
-import yaml
 import re
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
 
 from rest_framework import mixins, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from backend.analytics import METRICS as SALES_METRICS, record_orders, shop_summary
+from backend.batch import execute as execute_batch
+from backend.catalog import get_snapshot
+from backend.exports import EXPORT_FORMATS, export_rows, render as render_export
+from backend.idempotency import idempotent
+from backend.importer import load_feed, import_shop, apply_stock_updates, parse_parameter_value, STOCK_FIELDS
 from backend.permissions import IsOwner, IsShop
-from backend.tasks import new_order_send_message, new_user_register_send_message, canceled_order_send_mail
-from requests import get
-from distutils.util import strtobool
+from backend.push import issue_ticket
+from backend.suggest import get_index as get_suggest_index
+from backend.order_templates import copy_order_to_basket, copy_order_to_template, copy_template_to_basket, \
+    next_run_at
+from backend.outbox import publish
+from backend.versions import versioned, catalog_version_keys, order_version_keys, bump_catalog_version, \
+    bump_order_version
+from backend.webhooks import generate_secret
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
-from django.core.validators import URLValidator
-from django.db import IntegrityError
-from django.db.models import Q, Sum, F
-from django.http import JsonResponse
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q, Sum, F, Exists, OuterRef, Prefetch, Subquery
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework.authtoken.models import Token
 from rest_framework.generics import ListAPIView
+from rest_framework.negotiation import DefaultContentNegotiation
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from ujson import loads as load_json
-from yaml import load as load_yaml, Loader
-from backend.models import Shop, Category, ProductInfo, ProductParameter, Order, OrderItem, \
-    Contact, ConfirmEmailToken, Product, Parameter, User
+from backend.models import Shop, Category, ProductInfo, Parameter, ProductParameter, Order, OrderItem, \
+    Contact, ConfirmEmailToken, User, ArchivedOrder, ArchivedOrderItem, PriceHistory, BestOffer, OrderTemplate, \
+    OrderTemplateItem, ShopWebhook
 from backend.serializers import UserSerializer, CategorySerializer, ShopSerializer, ProductInfoSerializer, \
-    OrderItemSerializer, OrderSerializer, ContactSerializer, ProductParameterSerializer
+    OrderItemSerializer, OrderSerializer, ContactSerializer, ProductParameterSerializer, ArchivedOrderSerializer, \
+    BestOfferSerializer, OrderTemplateSerializer, ShopWebhookSerializer, WebhookDeliverySerializer, \
+    EXPANDED, INCLUDED, field_state, parse_fields
+
+
+# связанные объекты позиций заказа: путь поля, lookup для select_related, нужен ли объект только при раскрытии
+ORDER_ITEM_RELATED = (
+    ('ordered_items.product_info', 'product_info', EXPANDED),
+    ('ordered_items.product_info.product', 'product_info__product', EXPANDED),
+    ('ordered_items.product_info.product.category', 'product_info__product__category', INCLUDED),
+)
+TRUE_VALUES, FALSE_VALUES = ('y', 'yes', 't', 'true', 'on', '1'), ('n', 'no', 'f', 'false', 'off', '0')
+
+
+def strtobool(value):
+    """
+    Строка да/нет в bool, как distutils.util.strtobool: импорт distutils подгружает setuptools
+    и замедляет старт процесса
+    """
+    if value.lower() in TRUE_VALUES:
+        return True
+    if value.lower() in FALSE_VALUES:
+        return False
+    raise ValueError(f'invalid truth value {value!r}')
+
+
+def field_selection(request):
+    """
+    Выбранные поля (?fields=) и раскрываемые объекты (?expand=) для сериализатора
+    \n:return: словарь {"fields": <дерево или None>, "expand": <дерево или None>}
+    """
+    fields, expand = request.query_params.get('fields'), request.query_params.get('expand')
+    return {'fields': parse_fields(fields) if fields else None, 'expand': parse_fields(expand) if expand else None}
+
+
+def order_queryset(orders, selection):
+    """
+    Соединения, подзапросы и сумма заказа только для выводимых полей OrderSerializer
+    \n:param orders: queryset заказов
+    \n:param selection: результат field_selection
+    """
+    if field_state(selection, 'contact') == EXPANDED:
+        orders = orders.select_related('contact')
+    if field_state(selection, 'ordered_items'):
+        related = [lookup for path, lookup, required in ORDER_ITEM_RELATED
+                   if field_state(selection, path) in (EXPANDED, required)]
+        orders = orders.prefetch_related(Prefetch('ordered_items', queryset=OrderItem.objects.select_related(
+            *related) if related else OrderItem.objects.all()))
+    if field_state(selection, 'total_sum'):
+        orders = orders.annotate(total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price')))
+    return orders
+
+
+class FieldSelectionMixin:
+    """
+    Поддержка ?fields= и ?expand= для сериализатора списка
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        if 'data' not in kwargs:
+            kwargs.update(field_selection(self.request))
+        return super().get_serializer(*args, **kwargs)
 
 
 class RegisterAccount(APIView):
@@ -53,6 +129,7 @@ class RegisterAccount(APIView):
                     user = user_serializer.save()
                     user.set_password(request.data['password'])
                     user.save()
+                    from backend.tasks import new_user_register_send_message  # Celery - при первой отправке
                     new_user_register_send_message.delay(user_id=user.id)
                     return JsonResponse({'Status': True})
                 else:
@@ -100,9 +177,9 @@ class AccountDetailsViewSet(mixins.ListModelMixin,
         """
         Получение данных о пользователе
         \n:param request: запрос пользователя
-        \n:return: возвращает полные данные о пользователе
+        \n:return: возвращает полные данные о пользователе, поля выбираются параметрами fields и expand
         """
-        serializer = UserSerializer(request.user)
+        serializer = UserSerializer(request.user, **field_selection(request))
         return Response(serializer.data)
 
     def create(self, request, *args, **kwargs):
@@ -238,6 +315,7 @@ class ContactView(APIView):
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
+@versioned(catalog_version_keys)
 class CategoryView(ListAPIView):
     """
     Класс для просмотра списка категорий
@@ -246,6 +324,7 @@ class CategoryView(ListAPIView):
     serializer_class = CategorySerializer
 
 
+@versioned(catalog_version_keys)
 class ShopView(ListAPIView):
     """
     Класс для просмотра списка магазинов
@@ -254,6 +333,93 @@ class ShopView(ListAPIView):
     serializer_class = ShopSerializer
 
 
+def category_filter(category_id, prefix='product__category'):
+    """
+    Условие на категорию вместе со всеми вложенными категориями - одно условие LIKE по индексу пути категории
+    \n:param category_id: id категории
+    \n:param prefix: путь к категории от модели queryset
+    """
+    path = Category.objects.filter(id=category_id).values_list('path', flat=True).first()
+    if not path:  # категории нет или путь не заполнен (python manage.py rebuild_category_paths)
+        return Q(**{f'{prefix}_id': category_id})
+    return Q(**{f'{prefix}__path__startswith': path})
+
+
+PARAMETER_FILTER = re.compile(r'^([\w-]+)(>=|<=|>|<|=)(.+)$')
+PARAMETER_LOOKUPS = {'>=': 'gte', '<=': 'lte', '>': 'gt', '<': 'lt'}
+PRODUCT_QUERY_PARAMS = {'shop_id', 'category_id', 'product_id', 'parameters', 'format', 'fields',
+                        'expand'}  # не коды параметров
+
+
+def parameter_filters(query_params, snapshot=None):
+    """
+    Условия отбора предложений по значениям параметров с кодом (Parameter.code)
+    \n:param query_params: параметры запроса, например memory>=256&diagonal<=6.5&color=черный
+    (в строке запроса "memory>=256" это ключ "memory>" и значение "256", "memory>256" - ключ без значения)
+    \n:param snapshot: снимок каталога, из которого берутся id параметров вместо запроса к базе
+    \n:return: список условий Exists по индексированным полям ProductParameter
+    """
+    conditions = {}
+    for key, values in query_params.lists():
+        for value in values:
+            match = PARAMETER_FILTER.match(f'{key}={value}' if value else key)
+            if match:
+                code, operator, value = match.groups()
+                if code.endswith(('>', '<')):
+                    code, operator = code[:-1], code[-1] + operator
+                if operator != '=' or code not in PRODUCT_QUERY_PARAMS:
+                    conditions.setdefault(code, []).append((operator, value))
+    if not conditions:
+        return []
+    if snapshot is not None:
+        parameter_ids = snapshot.parameter_ids(conditions)
+    else:
+        parameter_ids = dict(Parameter.objects.filter(code__in=conditions).order_by().values_list('code', 'id'))
+    filters = []
+    for code, items in conditions.items():
+        if code not in parameter_ids:
+            if any(operator != '=' for operator, _ in items):
+                raise ValueError(f'Unknown parameter: {code}')
+            continue  # обычный параметр запроса, например shop_id
+        query = Q()
+        for operator, value in items:
+            if operator == '=':
+                fields = parse_parameter_value(value)
+                if fields['value_bool'] is not None:
+                    query &= Q(value_bool=fields['value_bool'])
+                elif fields['value_number'] is not None:
+                    query &= Q(value_number=fields['value_number'])
+                else:
+                    query &= Q(value=value)
+            else:
+                try:
+                    number = Decimal(value.replace(',', '.'))
+                except InvalidOperation:
+                    raise ValueError(f'Invalid number for {code}: {value}')
+                query &= Q(**{f'value_number__{PARAMETER_LOOKUPS[operator]}': number})
+        filters.append(Exists(ProductParameter.objects.filter(query, product_info=OuterRef('pk'),
+                                                              parameter_id=parameter_ids[code])))
+    return filters
+
+
+def parameters_contain(document):
+    """
+    Условие на документ параметров предложения (ProductInfo.parameters)
+    \n:param document: словарь {"название параметра": "значение"}
+    \n:return: условие @> по GIN индексу в PostgreSQL, на остальных СУБД - сравнение по ключам
+    """
+    if not isinstance(document, dict):
+        raise ValueError('parameters must be a JSON object')
+    document = {name: str(value) for name, value in document.items()}
+    if connection.vendor == 'postgresql':
+        return Q(parameters__contains=document)
+    query = Q()
+    for name, value in document.items():
+        query &= Q(**{f'parameters__{name}': value})
+    return query
+
+
+@versioned(catalog_version_keys)
 class ProductInfoView(APIView):
     """
     Класс для поиска товаров
@@ -264,10 +430,21 @@ class ProductInfoView(APIView):
         Получение списка товаров или характеристики товара
         \n:param request: запрос пользователя с указанием или без указания необязательных параметров
         \n:return: без указания параметров возвращает список всех товаров
-                при указании category_id=<int> возвращает отсортированный по категории список товаров
+                при указании category_id=<int> возвращает список товаров категории и всех вложенных в нее
                 при указании shop_id=<int> возвращает список товаров определенного магазина
                 при указании product_id=<int> возвращает список с характеристиками определенного товара
+                при указании <код параметра>>=<число>, <код параметра><=<число>, <код параметра>=<значение>
+                возвращает товары с подходящими значениями параметров, например memory>=256&diagonal<=6.5
+                при указании parameters={"Цвет": "черный"} возвращает товары, параметры которых содержат указанные
+                без фильтров по параметрам и выбора полей список отдается из снимка каталога в памяти, если он включен
         """
+        snapshot = get_snapshot()
+        try:
+            parameter_query = parameter_filters(request.query_params, snapshot)
+            if request.query_params.get('parameters'):
+                parameter_query.append(parameters_contain(load_json(request.query_params['parameters'])))
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
         try:
             query = Q(shop__state=True)
             shop_id = request.query_params.get('shop_id')
@@ -277,20 +454,217 @@ class ProductInfoView(APIView):
                 queryset = ProductParameter.objects.filter(product_info__product=product_id)
                 serializer = ProductParameterSerializer(queryset, many=True)
                 return Response(serializer.data)  # возвращает характеристики продукта по id
+            selection = field_selection(request)
+            if snapshot is not None and not parameter_query and not any(selection.values()) and all(
+                    value.isdigit() for value in (shop_id, category_id) if value):
+                return Response(snapshot.find_offers(shop_id=int(shop_id) if shop_id else None,
+                                                     category_id=int(category_id) if category_id else None))
             if shop_id:
                 query = query & Q(shop_id=shop_id)
             if category_id:
-                query = query & Q(product__category_id=category_id)  # фильтруем и отбрасываем дуликаты
-            queryset = ProductInfo.objects.filter(
-                query).select_related(
-                'shop', 'product__category').prefetch_related(
-                'product_parameter__parameter').distinct()
-            serializer = ProductInfoSerializer(queryset, many=True)
+                query = query & category_filter(category_id)  # фильтруем и отбрасываем дуликаты
+            queryset = ProductInfo.objects.filter(query, *parameter_query).distinct()
+            if field_state(selection, 'product') == EXPANDED:
+                queryset = queryset.select_related(
+                    'product__category' if field_state(selection, 'product.category') else 'product')
+            if not field_state(selection, 'product_parameters'):
+                queryset = queryset.defer('parameters')
+            serializer = ProductInfoSerializer(queryset, many=True, **selection)
             return Response(serializer.data)
         except ValueError as error:
             return JsonResponse({'Status': False, 'Error': error})
 
 
+@versioned(catalog_version_keys)
+class BestOfferView(APIView):
+    """
+    Класс для получения лучших предложений по товарам среди всех поставщиков
+    """
+
+    def get(self, request):
+        """
+        Получение лучших предложений по списку товаров или категории
+        \n:param request: запрос пользователя с одним из параметров
+                product_id=<int>,<int>,... - id товаров через запятую (не более BEST_OFFERS_MAX_PRODUCTS)
+                category_id=<int> - все товары категории и вложенных в нее категорий
+        \n:return: для каждого товара, который есть в наличии - самое дешевое предложение (product_info, shop, price,
+                quantity), следующее за ним (runner_up_*) и количество предложений в наличии
+        """
+        product_ids = request.query_params.get('product_id')
+        category_id = request.query_params.get('category_id')
+        if product_ids:
+            product_ids = product_ids.split(',')
+            if not all(product_id.isdigit() for product_id in product_ids):
+                return JsonResponse({'Status': False, 'Errors': 'product_id must be a comma separated list of ids'},
+                                    status=400)
+            return self.best_offers(product_ids)
+        if category_id and category_id.isdigit():
+            snapshot = get_snapshot()
+            if snapshot is not None:
+                return Response(snapshot.category_best_offers(int(category_id)))
+            queryset = BestOffer.objects.filter(category_filter(category_id)).order_by('product_id')
+            return Response(BestOfferSerializer(queryset, many=True).data)
+        return JsonResponse({'Status': False, 'Errors': 'All necessary arguments are not specified'}, status=400)
+
+    def post(self, request):
+        """
+        Получение лучших предложений по длинному списку товаров, который не помещается в строку запроса
+        \n:param request: запрос пользователя формата - {"product_ids": [<int>, ...]}
+        \n:return: то же, что GET
+        """
+        product_ids = request.data.get('product_ids')
+        if not isinstance(product_ids, list) or not all(
+                isinstance(product_id, int) and not isinstance(product_id, bool) for product_id in product_ids):
+            return JsonResponse({'Status': False, 'Errors': 'product_ids must be a list of ids'}, status=400)
+        return self.best_offers(product_ids)
+
+    def best_offers(self, product_ids):
+        if len(product_ids) > settings.BEST_OFFERS_MAX_PRODUCTS:
+            return JsonResponse({'Status': False,
+                                 'Errors': f'Too many products, max {settings.BEST_OFFERS_MAX_PRODUCTS}'}, status=400)
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            return Response(snapshot.best_offers(map(int, product_ids)))
+        queryset = BestOffer.objects.filter(product_id__in=product_ids).order_by('product_id')  # по первичному ключу
+        return Response(BestOfferSerializer(queryset, many=True).data)
+
+
+class ProductSuggestView(APIView):
+    """
+    Класс для подсказок названий товаров при вводе
+    """
+
+    def get(self, request):
+        """
+        Подсказки по началу слов названия товара или модели
+        \n:param request: запрос пользователя с параметрами
+                q=<строка> - начало слов названия или модели, например "iph xr" или "apple/iph"
+                category_id=<int> - только товары категории и вложенных в нее категорий
+                in_stock=true - только товары, которые есть в наличии
+                limit=<int> - количество подсказок (по умолчанию SUGGEST_LIMIT, не более SUGGEST_MAX_LIMIT)
+        \n:return: список товаров (id, name, category, offers - количество предложений в наличии),
+                товары с большим количеством предложений в наличии первыми
+        """
+        query = request.query_params.get('q', '')
+        category_id = request.query_params.get('category_id')
+        limit = request.query_params.get('limit', str(settings.SUGGEST_LIMIT))
+        if category_id and not category_id.isdigit() or not limit.isdigit():
+            return JsonResponse({'Status': False, 'Errors': 'category_id and limit must be integers'}, status=400)
+        try:
+            in_stock = strtobool(request.query_params.get('in_stock', 'false'))
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+        if not query.strip():
+            return Response([])
+        return Response(get_suggest_index().suggest(query, min(int(limit), settings.SUGGEST_MAX_LIMIT),
+                                                    category_id=int(category_id) if category_id else None,
+                                                    in_stock=in_stock))
+
+
+PRICE_HISTORY_INTERVALS = ('hour', 'day', 'week', 'month')
+
+
+def _parse_moment(value):
+    """
+    Дата или дата и время из параметра запроса, дата без времени - начало суток
+    \n:return: aware datetime или None, если значение не распознано
+    """
+    moment = parse_datetime(value) or (parse_date(value) and datetime.combine(parse_date(value), time()))
+    if moment and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _price_bucket(moment, interval):
+    """
+    Начало интервала, к которому относится изменение цены
+    """
+    moment = timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+    if interval == 'hour':
+        return moment
+    moment = moment.replace(hour=0)
+    if interval == 'week':
+        return moment - timedelta(days=moment.weekday())
+    if interval == 'month':
+        return moment.replace(day=1)
+    return moment
+
+
+def _price_history_window(request):
+    """
+    Начало суток, от которого отсчитывается период истории цен по умолчанию
+    \n:return: aware datetime или None, если период задан параметрами date_from/date_to
+    """
+    if request.query_params.get('date_from') or request.query_params.get('date_to'):
+        return None
+    return timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+@versioned(catalog_version_keys, window_func=_price_history_window)
+class ProductPriceHistoryView(APIView):
+    """
+    Класс для просмотра истории цен товара
+    """
+
+    def get(self, request, product_id):
+        """
+        Получение истории цен товара, прореженной по интервалам
+        \n:param request: запрос пользователя с необязательными параметрами
+                shop_id=<int> - только предложения указанного магазина
+                date_from=<дата или дата и время>, date_to=<...> - период, по умолчанию год до date_to
+                (без date_to - с начала суток год назад до текущего момента)
+                interval=hour|day|week|month - интервал прореживания, по умолчанию day
+        \n:param product_id: id товара
+        \n:return: для каждого магазина и интервала с изменениями - последняя цена интервала (price, price_rrc),
+                минимальная и максимальная цена интервала; первая точка - цена, действовавшая на начало периода
+        """
+        interval = request.query_params.get('interval', 'day')
+        if interval not in PRICE_HISTORY_INTERVALS:
+            return JsonResponse({'Status': False, 'Errors': f'interval must be one of {PRICE_HISTORY_INTERVALS}'},
+                                status=400)
+        date_to, date_from = timezone.now(), None
+        for name in ('date_from', 'date_to'):
+            value = request.query_params.get(name)
+            if value:
+                moment = _parse_moment(value)
+                if not moment:
+                    return JsonResponse({'Status': False, 'Errors': f'Invalid {name}: {value}'}, status=400)
+                if name == 'date_from':
+                    date_from = moment
+                else:
+                    date_to = moment
+        if not date_from:
+            # без date_to период выравнивается по началу суток, чтобы ETag ответа менялся вместе с периодом
+            date_from = (_price_history_window(request) or date_to) - timedelta(days=365)
+
+        history = PriceHistory.objects.filter(product_id=product_id)
+        shop_id = request.query_params.get('shop_id')
+        if shop_id:
+            if not shop_id.isdigit():
+                return JsonResponse({'Status': False, 'Errors': f'Invalid shop_id: {shop_id}'}, status=400)
+            history = history.filter(shop_id=shop_id)
+        # цены, действовавшие на начало периода: последнее изменение каждого магазина до date_from
+        previous = history.filter(changed_at__lt=date_from, changed_at=Subquery(
+            PriceHistory.objects.filter(product_id=product_id, shop_id=OuterRef('shop_id'),
+                                        changed_at__lt=date_from).order_by('-changed_at').values('changed_at')[:1]))
+        rows = [(shop, date_from, price, price_rrc) for shop, price, price_rrc in previous.values_list(
+            'shop_id', 'price', 'price_rrc')]
+        rows += history.filter(changed_at__gte=date_from, changed_at__lte=date_to).order_by(
+            'changed_at').values_list('shop_id', 'changed_at', 'price', 'price_rrc')
+
+        points = {}
+        for shop, changed_at, price, price_rrc in rows:
+            key = (shop, _price_bucket(changed_at, interval))
+            point = points.get(key)
+            if point is None:
+                points[key] = {'shop': shop, 'date': key[1], 'price': price, 'price_rrc': price_rrc,
+                               'price_min': price, 'price_max': price}
+            else:
+                point.update(price=price, price_rrc=price_rrc, price_min=min(point['price_min'], price),
+                             price_max=max(point['price_max'], price))
+        return Response([points[key] for key in sorted(points)])
+
+
 class BasketViewSet(mixins.ListModelMixin,
                             mixins.CreateModelMixin,
                             viewsets.GenericViewSet):
@@ -306,16 +680,15 @@ class BasketViewSet(mixins.ListModelMixin,
         Получение информации о корзине
         \n:param request: запрос пользователя
         \n:return: возвращает id заказа, список товаров добавленных в корзину, статус заказа, дату формирования,
-        общую сумму заказа и контактные данные покупателя
-        """
-        basket = Order.objects.filter(
-            user_id=request.user.id, state='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameter__parameter').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
-        serializer = OrderSerializer(basket, many=True)
+        общую сумму заказа и контактные данные покупателя; параметры fields=id,state,ordered_items.quantity и
+        expand=contact выбирают поля и раскрываемые объекты, не раскрытые вложенные объекты выводятся как id
+        """
+        selection = field_selection(request)
+        basket = order_queryset(Order.objects.filter(user_id=request.user.id, state='basket'), selection).distinct()
+        serializer = OrderSerializer(basket, many=True, **selection)
         return Response(serializer.data)
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         """
         Создание корзины или добавление новых товаров в уже существующую
@@ -333,9 +706,10 @@ class BasketViewSet(mixins.ListModelMixin,
             else:
                 basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
                 objects_created = 0
+                catalog = get_snapshot()  # наличие предложений проверяется в памяти, если снимок включен
                 for order_item in items_dict:
                     order_item.update({'order': basket.id})
-                    serializer = OrderItemSerializer(data=order_item)
+                    serializer = OrderItemSerializer(data=order_item, context={'catalog': catalog})
                     if serializer.is_valid():
                         try:
                             serializer.save()
@@ -403,6 +777,7 @@ class BasketViewSet(mixins.ListModelMixin,
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
+@versioned(order_version_keys, name='list')
 class OrderViewSet(mixins.ListModelMixin,
                     mixins.CreateModelMixin,
                     viewsets.GenericViewSet):
@@ -418,16 +793,16 @@ class OrderViewSet(mixins.ListModelMixin,
         Получение информации о заказе
         \n:param request: запрос пользователя
         \n:return: возвращает id заказа, список товаров, статус заказа, дату формирования,
-        общую сумму заказа и контактные данные покупателя
-        """
-        order = Order.objects.filter(  # формирование информации
-            user_id=request.user.id).exclude(state='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameter__parameter').select_related('contact').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
-        serializer = OrderSerializer(order, many=True)
+        общую сумму заказа и контактные данные покупателя; параметры fields=id,state,ordered_items.quantity и
+        expand=contact выбирают поля и раскрываемые объекты, не раскрытые вложенные объекты выводятся как id
+        """
+        selection = field_selection(request)
+        order = order_queryset(Order.objects.filter(  # формирование информации
+            user_id=request.user.id).exclude(state='basket'), selection).distinct()
+        serializer = OrderSerializer(order, many=True, **selection)
         return Response(serializer.data)
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         """
         Размещение заказа из корзины
@@ -439,37 +814,65 @@ class OrderViewSet(mixins.ListModelMixin,
         if {'id', 'contact'}.issubset(request.data):
             if request.data['id'].isdigit():
                 try:
-                    order = Order.objects.filter(
-                        user_id=request.user.id, id=request.data['id'])
-                    contact_id = request.data['contact']
-                    for item in OrderItem.objects.filter(order_id=request.data['id'], order__user_id=request.user.id):
-                        if item.order.state == 'basket':
-                            new_quantity = item.product_info.quantity - item.quantity
-                            if int(new_quantity) < 0:
-                                return JsonResponse(
-                                    {'Status': False, 'Errors': 'Выбрано больше позиций, чем есть в наличии. '
-                                                                'Выберете другое количество'})
-                            if not Contact.objects.filter(id=contact_id, user_id=request.user.id):
-                                return JsonResponse(
-                                    {'Status': False, 'Result': 'Укажите контактные данные для доставки товара'})
-                            ProductInfo.objects.filter(quantity=item.product_info.quantity,
-                                                       id=item.product_info.id).update(
-                                quantity=new_quantity)  # удаление позиций товара из базы после подтверждения заказа
-                        else:
-                            return JsonResponse({'Status': False, 'Errors': 'Basket is empty'})
-                    is_updated = order.update(
-                        contact_id=contact_id,
-                        state='new')
-                    if is_updated:
-                        new_order_send_message.delay(
-                            user_id=request.user.id,
-                            order_id=request.data['id'])  # отправка уведомления о заказе на email пользователя
-                        return JsonResponse({'Status': True, 'Result': 'Сообщение отправлено'})
+                    with transaction.atomic():
+                        order = Order.objects.filter(
+                            user_id=request.user.id, id=request.data['id'])
+                        contact_id = request.data['contact']
+                        shop_ids, product_ids = set(), set()
+                        for item in OrderItem.objects.filter(order_id=request.data['id'],
+                                                             order__user_id=request.user.id):
+                            if item.order.state == 'basket':
+                                new_quantity = item.product_info.quantity - item.quantity
+                                if int(new_quantity) < 0:
+                                    transaction.set_rollback(True)  # возвращаем остатки уже обработанных позиций
+                                    return JsonResponse(
+                                        {'Status': False, 'Errors': 'Выбрано больше позиций, чем есть в наличии. '
+                                                                    'Выберете другое количество'})
+                                if not Contact.objects.filter(id=contact_id, user_id=request.user.id):
+                                    transaction.set_rollback(True)
+                                    return JsonResponse(
+                                        {'Status': False, 'Result': 'Укажите контактные данные для доставки товара'})
+                                ProductInfo.objects.filter(quantity=item.product_info.quantity,
+                                                           id=item.product_info.id).update(
+                                    quantity=new_quantity)  # удаление позиций товара из базы после подтверждения заказа
+                                shop_ids.add(item.product_info.shop_id)
+                                product_ids.add(item.product_info.product_id)
+                            else:
+                                transaction.set_rollback(True)
+                                return JsonResponse({'Status': False, 'Errors': 'Basket is empty'})
+                        is_updated = order.update(
+                            contact_id=contact_id,
+                            state='new')
+                        if is_updated:
+                            publish('order.new', user_id=request.user.id, order_id=int(request.data['id']),
+                                    shop_ids=sorted(shop_ids), product_ids=sorted(product_ids))
+                            # уведомление на email и пересчет лучших предложений после коммита
+                            transaction.on_commit(lambda: bump_order_version(request.user.id))
+                            transaction.on_commit(lambda: bump_catalog_version(*shop_ids))  # остатки изменились
+                            return JsonResponse({'Status': True, 'Result': 'Сообщение отправлено'})
                 except Exception as error:
                     print(error)
                     return JsonResponse({'Status': False, 'Errors': f'{error}'})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
+    @action(detail=False, methods=['POST'], url_path='reorder')
+    def reorder(self, request):
+        """
+        Повтор заказа: все позиции прошлого заказа добавляются в корзину одним запросом
+        При выполнении этого запроса, к базовому url этого класса нужно добавить /reorder/
+        \n:param request: запрос пользователя с id заказа формата - {"id":<int>}
+        \n:return: возвращает статус ответа и количество добавленных в корзину позиций
+        """
+        order_id = str(request.data.get('id', ''))
+        if not order_id.isdigit():
+            return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+        if not Order.objects.filter(user_id=request.user.id, id=order_id).exclude(state='basket').exists():
+            return JsonResponse({'Status': False, 'Errors': 'Order not found'}, status=404)
+        with transaction.atomic():
+            basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
+            added = copy_order_to_basket(int(order_id), basket.id)
+        return JsonResponse({'Status': True, 'Добавлено позиций': added})
+
     @action(detail=False, methods=['DELETE'], url_path='delete')
     def my_custom_destroy(self, request):
         """
@@ -480,20 +883,27 @@ class OrderViewSet(mixins.ListModelMixin,
         возвращает статус ответа и сообщение с номером удаленного заказа
         """
         try:
-            if Order.objects.filter(user_id=request.user.id, state='new', id=request.data['id']):
-                for item in OrderItem.objects.filter(order_id=request.data['id']):
-                    if item.order.state == 'new':
-                        new_quantity = item.product_info.quantity + item.quantity
-                        ProductInfo.objects.filter(quantity=item.product_info.quantity,
-                                                   id=item.product_info.id).update(
-                            quantity=new_quantity)  # возвращение количества отмененных позиций
-                Order.objects.filter(user_id=request.user.id, state='new',
-                                     id=request.data['id']).delete()  # удаление отмененного заказа
-                canceled_order_send_mail.delay(user_id=request.user.id, order_id=request.data[
-                    'id'])  # отправка уведомления об отмене заказа на email пользователя
-                return JsonResponse({'Status': True, 'Message': f'Order # {request.data["id"]} has been canceled.'})
-            else:
-                return JsonResponse({'Status': False, 'Message': 'Order not found'})
+            with transaction.atomic():
+                if Order.objects.filter(user_id=request.user.id, state='new', id=request.data['id']):
+                    shop_ids, product_ids = set(), set()
+                    for item in OrderItem.objects.filter(order_id=request.data['id']):
+                        if item.order.state == 'new':
+                            new_quantity = item.product_info.quantity + item.quantity
+                            ProductInfo.objects.filter(quantity=item.product_info.quantity,
+                                                       id=item.product_info.id).update(
+                                quantity=new_quantity)  # возвращение количества отмененных позиций
+                            shop_ids.add(item.product_info.shop_id)
+                            product_ids.add(item.product_info.product_id)
+                    record_orders([int(request.data['id'])], state='canceled')  # позиции удаляются вместе с заказом
+                    Order.objects.filter(user_id=request.user.id, state='new',
+                                         id=request.data['id']).delete()  # удаление отмененного заказа
+                    publish('order.canceled', user_id=request.user.id, order_id=int(request.data['id']),
+                            shop_ids=sorted(shop_ids), product_ids=sorted(product_ids))  # уведомление об отмене заказа на email пользователя
+                    transaction.on_commit(lambda: bump_order_version(request.user.id))
+                    transaction.on_commit(lambda: bump_catalog_version(*shop_ids))
+                    return JsonResponse({'Status': True, 'Message': f'Order # {request.data["id"]} has been canceled.'})
+                else:
+                    return JsonResponse({'Status': False, 'Message': 'Order not found'})
         except BaseException as error:
             return JsonResponse({'Status': False, 'Errors': 'error'})
 
@@ -527,7 +937,10 @@ class PartnerStateViewSet(mixins.ListModelMixin,
         state = request.data.get('state')
         if state:
             try:
-                Shop.objects.filter(user_id=request.user.id).update(state=strtobool(state))
+                with transaction.atomic():
+                    Shop.objects.filter(user_id=request.user.id).update(state=strtobool(state))
+                    publish('catalog.updated',
+                            shop_ids=list(Shop.objects.filter(user_id=request.user.id).values_list('id', flat=True)))
                 return JsonResponse({'Status': True})
             except ValueError as error:
                 return JsonResponse({'Status': False, 'Errors': str(error)})
@@ -549,26 +962,146 @@ class PartnerOrdersViewSet(mixins.ListModelMixin,
         Получение списка заказов магазином
         \n:param request: запрос пользователя
         \n:return: возвращает id заказа, список товаров, статус заказа, дату формирования,
-        общую сумму заказа и контактные данные покупателя
+        общую сумму заказа и контактные данные покупателя; параметры fields=id,state,ordered_items.quantity и
+        expand=contact выбирают поля и раскрываемые объекты, не раскрытые вложенные объекты выводятся как id
         """
         try:
-            order = Order.objects.filter(
-                ordered_items__product_info__shop__user_id=request.user.id).exclude(state='basket').prefetch_related(
-                'ordered_items__product_info__product__category',
-                'ordered_items__product_info__product_parameter__parameter').select_related('contact').annotate(
-                total_sum=Sum(F('ordered_items__quantity') *
-                              F('ordered_items__product_info__price'))).distinct()  # структурирование информации
-            serializer = OrderSerializer(order, many=True)
+            selection = field_selection(request)
+            order = order_queryset(Order.objects.filter(
+                ordered_items__product_info__shop__user_id=request.user.id).exclude(state='basket'),
+                selection).distinct()  # структурирование информации
+            serializer = OrderSerializer(order, many=True, **selection)
             return Response(serializer.data)
         except ValueError as error:
             return JsonResponse({'Status': False, 'Error': error})
 
 
+class PartnerWebhookViewSet(mixins.ListModelMixin,
+                            mixins.CreateModelMixin,
+                            mixins.DestroyModelMixin,
+                            viewsets.GenericViewSet):
+    """
+    Класс для работы с подписками поставщика на уведомления о новых заказах
+    """
+    queryset = ShopWebhook.objects.all()
+    serializer_class = ShopWebhookSerializer
+    permission_classes = [IsAuthenticated, IsShop]
+
+    def get_queryset(self):
+        return ShopWebhook.objects.filter(shop__user_id=self.request.user.id)
+
+    def create(self, request, *args, **kwargs):
+        """
+        Создание подписки формата - {"url": <str>}, ключ подписи генерируется и возвращается в ответе.
+        Адрес должен разрешаться в публичный адрес, иначе возвращается 400
+        """
+        self.shop = Shop.objects.filter(user_id=request.user.id).first()
+        if self.shop is None:
+            return JsonResponse({'Status': False, 'Errors': 'Shop not found'}, status=400)
+        return super().create(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        serializer.save(shop=self.shop, secret=generate_secret())
+
+    @action(detail=True, methods=['GET'], url_path='deliveries')
+    def deliveries(self, request, pk=None):
+        """
+        Последние отправки уведомлений подписки
+        \n:return: возвращает заказы пачки, статус, количество попыток и последнюю ошибку
+        """
+        page = self.paginate_queryset(self.get_object().deliveries.order_by('-id'))
+        return self.get_paginated_response(WebhookDeliverySerializer(page, many=True).data)
+
+
+class OrderTemplateViewSet(mixins.ListModelMixin,
+                           mixins.CreateModelMixin,
+                           mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    Класс для работы с шаблонами регулярных заказов
+    """
+    queryset = OrderTemplate.objects.all()
+    serializer_class = OrderTemplateSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return OrderTemplate.objects.filter(user_id=self.request.user.id).prefetch_related('items')
+
+    def perform_create(self, serializer):
+        """
+        Создание шаблона из списка позиций формата - {"name": <str>, "contact": <int>, "run_time": "09:00",
+        "items": [{"product": <int>, "shop": <int>, "quantity": <int>}, ...]}
+        или из прошлого заказа - {"name": <str>, "contact": <int>, "run_time": "09:00", "order": <int>}
+        Без run_time шаблон выполняется только вручную
+        """
+        items, order_id = serializer.validated_data.pop('items', []), serializer.validated_data.pop('order', None)
+        with transaction.atomic():
+            template = serializer.save(user=self.request.user,
+                                       next_run_at=next_run_at(serializer.validated_data.get('run_time')))
+            OrderTemplateItem.objects.bulk_create([OrderTemplateItem(template=template, **item) for item in items])
+            if order_id:
+                copy_order_to_template(order_id, template.id)
+
+    @action(detail=True, methods=['POST'], url_path='basket')
+    def to_basket(self, request, pk=None):
+        """
+        Добавление позиций шаблона в корзину по текущим предложениям магазинов
+        \n:return: возвращает статус ответа и количество добавленных в корзину позиций
+        """
+        template = self.get_object()
+        with transaction.atomic():
+            basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
+            added = copy_template_to_basket(template.id, basket.id)
+        return JsonResponse({'Status': True, 'Добавлено позиций': added})
+
+
+class ArchivedOrderViewSet(FieldSelectionMixin,
+                           mixins.ListModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    Класс для просмотра архива заказов покупателя
+    """
+    queryset = ArchivedOrder.objects.all()
+    serializer_class = ArchivedOrderSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        """
+        Архивные заказы пользователя постранично, начиная с последних
+        """
+        orders = ArchivedOrder.objects.filter(user_id=self.request.user.id)
+        if field_state(field_selection(self.request), 'ordered_items'):
+            orders = orders.prefetch_related('ordered_items')
+        return orders
+
+
+class PartnerArchivedOrdersViewSet(FieldSelectionMixin,
+                                   mixins.ListModelMixin,
+                                   viewsets.GenericViewSet):
+    """
+    Класс для просмотра архива заказов поставщиком
+    """
+    queryset = ArchivedOrder.objects.all()
+    serializer_class = ArchivedOrderSerializer
+    permission_classes = [IsAuthenticated, IsShop]
+
+    def get_queryset(self):
+        """
+        Архивные заказы с товарами магазина постранично, в заказе остаются только позиции этого магазина
+        """
+        shop_items = ArchivedOrderItem.objects.filter(shop__user_id=self.request.user.id)
+        orders = ArchivedOrder.objects.filter(Exists(shop_items.filter(order_id=OuterRef('pk'))))
+        if field_state(field_selection(self.request), 'ordered_items'):
+            orders = orders.prefetch_related(Prefetch('ordered_items', queryset=shop_items))
+        return orders
+
+
 class PartnerUpdate(APIView):
     """
     Класс для обновления прайса от поставщика
     """
 
+    @idempotent
     def post(self, request, *args, **kwargs):
         """
         Добавление и обновление информации от поставщика
@@ -576,7 +1109,7 @@ class PartnerUpdate(APIView):
         в которых нужно указать путь к данным формата yaml
         пример -
         {'url': 'https://path_to_file.yaml'} путь к url с данными
-        {'file': 'data/data.yaml'} относительный или абсолютный путь к yaml файлу
+        {'file': 'data/data.yaml'} относительный или абсолютный путь к yaml файлу внутри FEED_UPLOAD_DIR
         \n:return: добавляет информацию в базу данных и возвращает статус ответа
         """
         if not request.user.is_authenticated:
@@ -584,43 +1117,213 @@ class PartnerUpdate(APIView):
         if request.user.type != 'shop':  # проверка на тип пользователя (магазин)
             return JsonResponse({'Status': False, 'Error': 'Only for shop'}, status=403)
         try:
-            user_id = request.user.id
             filename = request.data.get('file')
             url = request.data.get('url')
-            if filename:  # извлечение информации из файла
-                with open(filename, 'r', encoding='utf-8') as stream:
-                    data = yaml.safe_load(stream)
-            elif url and filename is None:  # извлечение информации с url
-                validate_url = URLValidator()
-                validate_url(url)
-                stream = get(url).content
-                data = load_yaml(stream, Loader=Loader)
-            else:
-                JsonResponse({'Status': False, 'Error': 'The source of information is incorrectly specified'})
+            data = load_feed(filename=filename, url=url)
             try:  # загрузка информации в базу данных
-                shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=user_id)
+                import_shop(request.user.id, data, filename=filename, url=url)
             except IntegrityError as error:
                 return JsonResponse({'Status': False, 'Error': f'{error}'})
-            Shop.objects.filter(user_id=user_id).update(filename=filename, url=url)
-            for category in data['categories']:
-                category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-                category_object.shops.add(shop.id)
-                category_object.save()
-            ProductInfo.objects.filter(shop_id=shop.id).delete()
-            for item in data['goods']:
-                product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'],
-                                                           id=item['id'])
-                product_info = ProductInfo.objects.create(product_id=product.id,
-                                                          model=item['model'],
-                                                          price=item['price'],
-                                                          price_rrc=item['price_rrc'],
-                                                          quantity=item['quantity'],
-                                                          shop_id=shop.id)
-                for name, value in item['parameters'].items():
-                    parameter_object, _ = Parameter.objects.get_or_create(name=name)
-                    ProductParameter.objects.create(product_info_id=product_info.id,
-                                                    parameter_id=parameter_object.id,
-                                                    value=value)
             return JsonResponse({'Status': True})
         except BaseException as error:
-            return JsonResponse({"Status": "False", "Error": f"{error.__str__()}"})
\ No newline at end of file
+            return JsonResponse({"Status": "False", "Error": f"{error.__str__()}"})
+
+
+class IgnoreFormatNegotiation(DefaultContentNegotiation):
+    """
+    Ответы (ошибки) всегда в JSON: параметр format выбирает формат выгрузки, а не рендерер
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class PartnerOrderExport(APIView):
+    """
+    Класс для потоковой выгрузки позиций заказов магазина
+    """
+    permission_classes = [IsAuthenticated, IsShop]
+    content_negotiation_class = IgnoreFormatNegotiation
+
+    def get(self, request, *args, **kwargs):
+        """
+        Выгрузка позиций заказов магазина за период
+        \n:param request: запрос поставщика с параметрами
+                date_from=<дата или дата и время> - начало периода, обязательно
+                date_to=<...> - конец периода (дата - включительно), по умолчанию текущий момент
+                format=csv|ndjson - формат выгрузки, по умолчанию csv
+                after=<int> - item_id последней полученной строки для продолжения прерванной выгрузки
+        \n:return: поток строк по возрастанию item_id с данными заказа, товара, количеством, ценой и адресом
+        """
+        export_format = request.query_params.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return JsonResponse({'Status': False, 'Errors': f'format must be one of {tuple(EXPORT_FORMATS)}'},
+                                status=400)
+        shop = Shop.objects.filter(user_id=request.user.id).first()
+        if shop is None:
+            return JsonResponse({'Status': False, 'Errors': 'Shop not found'}, status=400)
+        date_from, date_to = request.query_params.get('date_from'), request.query_params.get('date_to')
+        if not date_from:
+            return JsonResponse({'Status': False, 'Errors': 'All necessary arguments are not specified'}, status=400)
+        moments = {}
+        for name, value in (('date_from', date_from), ('date_to', date_to)):
+            if value:
+                moments[name] = _parse_moment(value)
+                if not moments[name]:
+                    return JsonResponse({'Status': False, 'Errors': f'Invalid {name}: {value}'}, status=400)
+        if date_to and parse_datetime(date_to) is None:  # дата без времени - период включает эти сутки
+            moments['date_to'] += timedelta(days=1)
+        after = request.query_params.get('after', '0')
+        if not after.isdigit():
+            return JsonResponse({'Status': False, 'Errors': f'Invalid after: {after}'}, status=400)
+
+        rows = export_rows(shop.id, moments['date_from'], moments.get('date_to', timezone.now()), after=int(after))
+        response = StreamingHttpResponse(render_export(rows, export_format, header=after == '0'),
+                                         content_type=EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="orders-{shop.id}.{export_format}"'
+        return response
+
+
+class PartnerAnalytics(APIView):
+    """
+    Класс для получения сводки продаж магазина
+    """
+    permission_classes = [IsAuthenticated, IsShop]
+
+    def get(self, request, *args, **kwargs):
+        """
+        Продажи товаров магазина за период по дням оформления заказов
+        \n:param request: запрос поставщика с параметрами
+                date_from=<дата> - первый день периода, по умолчанию ANALYTICS_DEFAULT_DAYS дней до date_to
+                date_to=<дата> - последний день периода, по умолчанию сегодня
+                top=<int> - количество товаров в рейтинге, по умолчанию ANALYTICS_TOP
+                order_by=<показатель> - показатель рейтинга товаров, по умолчанию net_revenue
+        \n:return: итоги периода, итоги по дням и рейтинг товаров: количество заказов, заказанные, отмененные,
+        доставленные единицы и их сумма, net_units и net_revenue - заказанное без отмененного
+        """
+        shop = Shop.objects.filter(user_id=request.user.id).first()
+        if shop is None:
+            return JsonResponse({'Status': False, 'Errors': 'Shop not found'}, status=400)
+        days = {}
+        for name in ('date_to', 'date_from'):
+            value = request.query_params.get(name)
+            if value:
+                try:
+                    days[name] = parse_date(value)
+                except ValueError:
+                    days[name] = None
+                if days[name] is None:
+                    return JsonResponse({'Status': False, 'Errors': f'Invalid {name}: {value}'}, status=400)
+        date_to = days.get('date_to') or timezone.localdate()
+        date_from = days.get('date_from') or date_to - timedelta(days=settings.ANALYTICS_DEFAULT_DAYS - 1)
+        if not timedelta(0) <= date_to - date_from < timedelta(days=settings.ANALYTICS_MAX_DAYS):
+            return JsonResponse({'Status': False, 'Errors': f'Period must be from 1 to {settings.ANALYTICS_MAX_DAYS} '
+                                                            f'days'}, status=400)
+        top = request.query_params.get('top', str(settings.ANALYTICS_TOP))
+        if not top.isdigit() or not 0 < int(top) <= settings.ANALYTICS_MAX_TOP:
+            return JsonResponse({'Status': False, 'Errors': f'top must be from 1 to {settings.ANALYTICS_MAX_TOP}'},
+                                status=400)
+        order_by = request.query_params.get('order_by', 'net_revenue')
+        if order_by not in SALES_METRICS:
+            return JsonResponse({'Status': False, 'Errors': f'order_by must be one of {SALES_METRICS}'}, status=400)
+        return JsonResponse({'shop': shop.id, 'date_from': date_from.isoformat(), 'date_to': date_to.isoformat(),
+                             **shop_summary(shop.id, date_from, date_to, int(top), order_by)})
+
+
+class StreamTicketView(APIView):
+    """
+    Класс для получения билета подключения к потоку /api/v1/stream
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        """
+        Выдача одноразового билета для EventSource: /api/v1/stream?ticket=<билет>
+        \n:param request: запрос авторизованного пользователя
+        \n:return: билет и срок его действия в секундах
+        """
+        return JsonResponse({'Status': True, 'ticket': issue_ticket(request.user.id),
+                             'expires_in': settings.PUSH_TICKET_TTL})
+
+
+class BatchView(APIView):
+    """
+    Класс для выполнения нескольких запросов к API за один запрос
+    """
+
+    def post(self, request, *args, **kwargs):
+        """
+        Выполнение подзапросов по порядку
+        \n:param request: запрос формата - {"atomic": <bool>, "requests": [{"method": "POST", "path": "basket/",
+                "body": {...}, "headers": {"Idempotency-Key": ...}}, ...]}, path - адрес относительно /api/v1/
+                с необязательной строкой запроса, вместо body можно передать form - поля формы;
+                в режиме atomic все подзапросы выполняются в одной транзакции, которая откатывается
+                при первом неудачном подзапросе
+        \n:return: возвращает статус ответа и список ответов подзапросов формата {"status": <int>, "body": ...}
+        """
+        operations = request.data.get('requests')
+        if not isinstance(operations, list) or not operations:
+            return JsonResponse({'Status': False, 'Errors': 'All necessary arguments are not specified'}, status=400)
+        if len(operations) > settings.BATCH_MAX_REQUESTS:
+            return JsonResponse({'Status': False, 'Errors': f'Too many requests, max {settings.BATCH_MAX_REQUESTS}'},
+                                status=400)
+        atomic = request.data.get('atomic') in (True, 'true', '1', 1)
+        results, failed_index = execute_batch(request, operations, atomic=atomic)
+        if failed_index is not None:
+            return JsonResponse({'Status': False, 'Errors': f'Request {failed_index} failed, changes rolled back',
+                                 'Responses': results})
+        return JsonResponse({'Status': True, 'Responses': results})
+
+
+class PartnerStock(APIView):
+    """
+    Класс для частичного обновления остатков и цен поставщика
+    """
+    permission_classes = [IsAuthenticated, IsShop]
+
+    def post(self, request, *args, **kwargs):
+        """
+        Обновление остатков и цен отдельных товаров магазина без загрузки всего прайса
+        \n:param request: запрос поставщика со списком изменений в формате JSON
+        [{"product": <id товара>, "quantity": <int>, "price": <int>, "price_rrc": <int>}, ...]
+        или NDJSON (Content-Type: application/x-ndjson, одно изменение в строке).
+        Поле "shop" необязательно и должно совпадать с магазином поставщика
+        \n:return: количество обновленных предложений и id товаров, которых нет в магазине
+        """
+        shop_id = Shop.objects.filter(user_id=request.user.id).values_list('id', flat=True).first()
+        if shop_id is None:
+            return JsonResponse({'Status': False, 'Errors': 'Shop not found'}, status=404)
+        try:
+            if request.content_type in ('application/x-ndjson', 'application/jsonl'):
+                items = [load_json(line) for line in request.body.splitlines() if line.strip()]
+            else:
+                items = load_json(request.body)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': f'Invalid format: {error}'}, status=400)
+        if not isinstance(items, list) or not items:
+            return JsonResponse({'Status': False, 'Errors': 'All necessary arguments are not specified'}, status=400)
+        if len(items) > settings.STOCK_UPDATE_MAX_ITEMS:
+            return JsonResponse({'Status': False, 'Errors': f'Too many items, max {settings.STOCK_UPDATE_MAX_ITEMS}'},
+                                status=400)
+
+        updates, errors = {}, []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                errors.append({'index': index, 'error': 'Invalid item'})
+                continue
+            product_id, values = item.get('product'), {field: item[field] for field in STOCK_FIELDS if field in item}
+            if not isinstance(product_id, int) or isinstance(product_id, bool) or not values:
+                errors.append({'index': index, 'error': 'Product and at least one of quantity, price, price_rrc '
+                                                        'are required'})
+            elif item.get('shop', shop_id) != shop_id:
+                errors.append({'index': index, 'error': 'Foreign shop'})
+            elif not all(isinstance(value, int) and not isinstance(value, bool) and value >= 0
+                         for value in values.values()):
+                errors.append({'index': index, 'error': 'Values must be non-negative integers'})
+            else:
+                updates.setdefault(product_id, {}).update(values)
+        if errors:
+            return JsonResponse({'Status': False, 'Errors': errors}, status=400)
+
+        updated, missing = apply_stock_updates(shop_id, updates, chunk_size=settings.STOCK_UPDATE_CHUNK_SIZE)
+        return JsonResponse({'Status': True, 'Updated': updated, 'Missing': missing})
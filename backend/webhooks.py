@@ -0,0 +1,191 @@
+"""
+Уведомления поставщиков о новых заказах (webhooks).
+
+Потребитель события order.new собирает новые заказы магазина в пачку (WebhookDelivery), открытую
+WEBHOOK_BATCH_WINDOW секунд, после чего задача deliver_webhook на очереди webhooks отправляет пачку
+на адрес подписки. Тело запроса подписывается HMAC-SHA256 ключом подписки:
+
+    X-Shop-Signature: sha256=hex(hmac(secret, "<X-Shop-Timestamp>.<тело запроса>"))
+
+При ошибке отправка повторяется с экспоненциально растущей задержкой, тело запроса не меняется,
+заголовок X-Shop-Delivery позволяет поставщику отбросить повторно полученную пачку.
+
+Адрес подписки должен указывать на публичный хост: он проверяется при создании подписки и перед каждой
+отправкой (адрес мог начать разрешаться во внутреннюю сеть), перенаправления не выполняются.
+"""
+import hashlib
+import hmac
+import ipaddress
+import json
+import secrets
+import socket
+import time
+from collections import defaultdict
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.utils import timezone
+
+from backend.models import OrderItem, ShopWebhook, WebhookDelivery
+
+SIGNATURE_HEADER = 'X-Shop-Signature'
+TIMESTAMP_HEADER = 'X-Shop-Timestamp'
+DELIVERY_HEADER = 'X-Shop-Delivery'
+
+
+def generate_secret():
+    return secrets.token_hex(32)
+
+
+def check_url(url, allow_private=None):
+    """
+    Проверка, что адрес подписки разрешается только в публичные адреса: запросы воркера не должны уходить
+    на loopback, в частные сети, на link-local адреса и сервис метаданных облака
+    \n:param url: адрес подписки
+    \n:param allow_private: не проверять адрес, по умолчанию WEBHOOK_ALLOW_PRIVATE_HOSTS
+    \n:return: текст ошибки или None, если адрес допустим
+    """
+    if settings.WEBHOOK_ALLOW_PRIVATE_HOSTS if allow_private is None else allow_private:
+        return None
+    try:
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80)
+        if not host:
+            return 'URL has no host'
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)}
+    except (OSError, UnicodeError, ValueError):
+        return f'Cannot resolve host of {url}'
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%')[0])
+        if not ip.is_global or ip.is_multicast:
+            return f'Host {host} resolves to a non-public address {ip}'
+    return None
+
+
+def sign(secret, timestamp, body):
+    """
+    Подпись тела запроса
+    \n:param secret: ключ подписки
+    \n:param timestamp: время отправки (unix time), передается в заголовке X-Shop-Timestamp
+    \n:param body: тело запроса (bytes)
+    """
+    return 'sha256=' + hmac.new(secret.encode(), f'{timestamp}.'.encode() + body, hashlib.sha256).hexdigest()
+
+
+def retry_delay(attempts):
+    """
+    Задержка перед следующей попыткой отправки, секунд
+    """
+    return min(settings.WEBHOOK_RETRY_BASE_DELAY * 2 ** (attempts - 1), settings.WEBHOOK_RETRY_MAX_DELAY)
+
+
+def schedule(delivery_id, countdown):
+    """
+    Постановка задачи отправки пачки на очередь webhooks
+    """
+    from backend.tasks import deliver_webhook
+    try:
+        deliver_webhook.apply_async((delivery_id,), countdown=countdown)
+    except Exception:  # брокер недоступен: пачку отправит периодический запуск deliver_due_webhooks
+        pass
+
+
+def enqueue_orders(events):
+    """
+    Добавление новых заказов в открытые пачки подписок магазинов, пачка создается, если открытой нет
+    \n:param events: payload'ы событий order.new
+    \n:return: созданные пачки, отправку которых нужно запланировать
+    """
+    order_ids = defaultdict(set)
+    for event in events:
+        for shop_id in event.get('shop_ids', ()):
+            order_ids[shop_id].add(event['order_id'])
+    now, created = timezone.now(), []
+    for webhook in ShopWebhook.objects.filter(shop_id__in=order_ids, is_active=True):
+        delivery = WebhookDelivery.objects.select_for_update().filter(
+            webhook=webhook, state='pending', body__isnull=True, next_attempt_at__gt=now).first()
+        if delivery:
+            delivery.order_ids = sorted(set(delivery.order_ids) | order_ids[webhook.shop_id])
+            delivery.save(update_fields=['order_ids'])
+        else:
+            created.append(WebhookDelivery.objects.create(
+                webhook=webhook, order_ids=sorted(order_ids[webhook.shop_id]),
+                next_attempt_at=now + timedelta(seconds=settings.WEBHOOK_BATCH_WINDOW)))
+    return created
+
+
+def build_body(delivery):
+    """
+    Тело запроса: позиции заказов пачки, относящиеся к магазину подписки, одним запросом к базе
+    """
+    orders = {}
+    for item in OrderItem.objects.filter(order_id__in=delivery.order_ids,
+                                         product_info__shop_id=delivery.webhook.shop_id).exclude(
+            order__state='basket').select_related('order__contact', 'product_info__product').order_by(
+            'order_id', 'id'):
+        order = item.order
+        if order.id not in orders:
+            contact = order.contact
+            orders[order.id] = {
+                'id': order.id, 'dt': order.dt.isoformat(), 'state': order.state, 'total_sum': 0, 'items': [],
+                'contact': contact and {'city': contact.city, 'street': contact.street, 'house': contact.house,
+                                        'structure': contact.structure, 'building': contact.building,
+                                        'apt': contact.apt, 'phone': contact.phone},
+            }
+        orders[order.id]['items'].append({
+            'product_info': item.product_info_id, 'product': item.product_info.product_id,
+            'name': item.product_info.product.name, 'model': item.product_info.model,
+            'quantity': item.quantity, 'price': item.product_info.price})
+        orders[order.id]['total_sum'] += item.quantity * item.product_info.price
+    return json.dumps({'event': 'order.new', 'delivery': delivery.id, 'shop': delivery.webhook.shop_id,
+                       'orders': list(orders.values())}, ensure_ascii=False).encode()
+
+
+def deliver(delivery_id):
+    """
+    Отправка пачки, если подошло время отправки и пачку не отправляет другой воркер
+    \n:param delivery_id: id пачки
+    \n:return: задержка до следующей попытки в секундах или None, если повтор не нужен
+    """
+    now = timezone.now()
+    lease = now + timedelta(seconds=settings.WEBHOOK_TIMEOUT * 2)  # после этого пачку может забрать другой воркер
+    if not WebhookDelivery.objects.filter(id=delivery_id, state__in=['pending', 'sending'],
+                                          next_attempt_at__lte=now).update(state='sending', next_attempt_at=lease):
+        return None
+    import requests  # requests нужен только воркеру очереди webhooks, не веб-процессу
+    delivery = WebhookDelivery.objects.select_related('webhook').get(id=delivery_id)
+    if delivery.body is None:
+        delivery.body = build_body(delivery)
+    body = bytes(delivery.body)
+
+    error = '' if delivery.webhook.is_active else 'Webhook is disabled'
+    blocked = delivery.webhook.is_active and check_url(delivery.webhook.url)
+    if blocked:
+        error = blocked
+    elif delivery.webhook.is_active:
+        timestamp = int(time.time())
+        try:
+            response = requests.post(delivery.webhook.url, data=body, timeout=settings.WEBHOOK_TIMEOUT, headers={
+                'Content-Type': 'application/json; charset=utf-8',
+                SIGNATURE_HEADER: sign(delivery.webhook.secret, timestamp, body),
+                TIMESTAMP_HEADER: str(timestamp),
+                DELIVERY_HEADER: str(delivery.id),
+            }, allow_redirects=False)  # перенаправление могло бы увести запрос во внутреннюю сеть
+            if not 200 <= response.status_code < 300:
+                error = f'HTTP {response.status_code}: {response.text[:500]}'
+        except requests.RequestException as request_error:
+            error = str(request_error)
+
+    delivery.attempts += 1
+    delivery.last_error = error
+    countdown = None
+    if not error:
+        delivery.state, delivery.delivered_at = 'delivered', timezone.now()
+    elif delivery.attempts >= settings.WEBHOOK_MAX_ATTEMPTS or not delivery.webhook.is_active or blocked:
+        delivery.state = 'failed'
+    else:
+        countdown = retry_delay(delivery.attempts)
+        delivery.state, delivery.next_attempt_at = 'pending', timezone.now() + timedelta(seconds=countdown)
+    delivery.save(update_fields=['body', 'attempts', 'last_error', 'state', 'delivered_at', 'next_attempt_at'])
+    return countdown
@@ -0,0 +1,64 @@
+"""
+Синхронизация магазина сети отдельными запросами и одним запросом /api/v1/batch.
+
+Запросы выполняются через django.test.Client со всеми middleware в настроенной базе; сетевые издержки
+(TLS, задержка до сервера) не учитываются, поэтому реальный выигрыш batch больше измеренного.
+Создает временного пользователя и удаляет его после замера.
+
+Запуск: python benchmarks/bench_batch.py [--requests 50] [--rounds 5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shopping_service.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from django.db import connection  # noqa: E402
+from rest_framework.authtoken.models import Token  # noqa: E402
+
+from backend.models import User  # noqa: E402
+
+
+def operations(count):
+    # типичная синхронизация: чтение корзины, контактов и каталога
+    paths = ('basket/?fields=id,state', 'user/contact', 'categories', 'shops')
+    return [{'method': 'GET', 'path': paths[index % len(paths)]} for index in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    user = User.objects.create_user(email=f'bench-{time.time()}@bench.ru', password='a1d2m3i4n5', is_active=True)
+    client = Client(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+    requests = operations(args.requests)
+    try:
+        for name, run in (
+                ('sequential', lambda: [client.get('/api/v1/' + request['path']) for request in requests]),
+                ('batch', lambda: client.post('/api/v1/batch', json.dumps({'requests': requests}),
+                                              content_type='application/json'))):
+            run()  # прогрев
+            started = time.perf_counter()
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(args.rounds):
+                    run()
+            elapsed = (time.perf_counter() - started) / args.rounds
+            print(f'{name:>10}: {elapsed * 1000:8.1f} ms per {args.requests} requests, '
+                  f'{len(queries) / args.rounds:.0f} queries')
+    finally:
+        user.delete()
+
+
+if __name__ == '__main__':
+    main()
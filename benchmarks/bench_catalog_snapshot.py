@@ -0,0 +1,104 @@
+"""
+Память и время снимка каталога (backend.catalog) на синтетическом каталоге.
+
+Снимок строится из сгенерированных строк без обращения к базе; для сравнения измеряется память экземпляров
+ProductInfo, загруженных ORM (выборка --orm-sample, результат пересчитывается на весь каталог).
+
+Запуск: python benchmarks/bench_catalog_snapshot.py [--offers 1000000] [--products 200000] [--shops 50]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shopping_service.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from backend.catalog import CatalogSnapshot  # noqa: E402
+from backend.models import ProductInfo  # noqa: E402
+
+COLORS = ('черный', 'белый', 'серебристый', 'золотой', 'синий')
+
+
+def document(random_state):
+    return {'Диагональ (дюйм)': str(random_state.choice((5.5, 5.8, 6.1, 6.5, 6.7))),
+            'Встроенная память (Гб)': str(random_state.choice((32, 64, 128, 256, 512))),
+            'Цвет': random_state.choice(COLORS)}
+
+
+def offer_rows(count, products, shops, seed=1):
+    random_state = random.Random(seed)
+    for offer_id in range(1, count + 1):
+        yield (offer_id, random_state.randint(1, products), random_state.randint(1, shops),
+               f'model-{random_state.randint(1, 5000)}', random_state.randint(0, 50),
+               random_state.randint(1000, 200000), 210000, document(random_state))
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--offers', type=int, default=1000000)
+    parser.add_argument('--products', type=int, default=200000)
+    parser.add_argument('--shops', type=int, default=50)
+    parser.add_argument('--categories', type=int, default=100)
+    parser.add_argument('--orm-sample', type=int, default=50000)
+    args = parser.parse_args()
+
+    build = lambda: CatalogSnapshot(  # noqa: E731
+        'bench',
+        ((category_id, f'Категория {category_id}', f'/{category_id}/')
+         for category_id in range(1, args.categories + 1)),
+        ((shop_id, f'Магазин {shop_id}', True) for shop_id in range(1, args.shops + 1)),
+        ((product_id, f'Смартфон {product_id}', product_id % args.categories + 1)
+         for product_id in range(1, args.products + 1)),
+        [],
+        offer_rows(args.offers, args.products, args.shops))
+    started = time.perf_counter()
+    build()  # время без tracemalloc, который замедляет выделение памяти в несколько раз
+    elapsed = time.perf_counter() - started
+    snapshot, current, peak = measure(build)
+    print(f'snapshot: {len(snapshot)} offers, {current / 2 ** 20:.1f} MiB retained, {peak / 2 ** 20:.1f} MiB peak, '
+          f'{current / len(snapshot):.0f} B/offer, built in {elapsed:.1f} s with row generation')
+
+    instances, current, _ = measure(lambda: [ProductInfo(
+        id=row[0], product_id=row[1], shop_id=row[2], model=row[3], quantity=row[4], price=row[5], price_rrc=row[6],
+        parameters=row[7]) for row in offer_rows(args.orm_sample, args.products, args.shops)])
+    print(f'ORM instances: {current / len(instances):.0f} B/offer, '
+          f'~{current / len(instances) * args.offers / 2 ** 20:.0f} MiB for {args.offers} offers')
+    del instances
+
+    random_state = random.Random(2)
+    offer_ids = [random_state.randint(1, args.offers) for _ in range(100000)]
+    started = time.perf_counter()
+    for offer_id in offer_ids:
+        snapshot.has_offer(offer_id)
+    print(f'has_offer: {(time.perf_counter() - started) / len(offer_ids) * 1e6:.2f} us')
+
+    product_ids = [random_state.randint(1, args.products) for _ in range(5000)]
+    started = time.perf_counter()
+    offers = snapshot.best_offers(product_ids)
+    print(f'best_offers: {(time.perf_counter() - started) * 1000:.1f} ms for {len(product_ids)} products '
+          f'({len(offers)} in stock)')
+
+    started = time.perf_counter()
+    offers = snapshot.find_offers(category_id=1)
+    print(f'find_offers(category_id): {(time.perf_counter() - started) * 1000:.1f} ms for {len(offers)} offers')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Накладные расходы на открытие соединения с базой в цикле запроса.
+
+Имитирует обработку запроса (сигналы request_started/request_finished и один простой запрос к базе)
+без постоянных соединений (CONN_MAX_AGE=0) и с ними (CONN_MAX_AGE=600).
+
+Запуск: DJANGO_SETTINGS_MODULE=shopping_service.settings_production python benchmarks/bench_connections.py
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shopping_service.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.signals import request_started, request_finished  # noqa: E402
+from django.db import connection  # noqa: E402
+
+
+def run(requests, conn_max_age):
+    connection.close()
+    connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+    timings = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        request_started.send(sender=None)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+        request_finished.send(sender=None)
+        timings.append((time.perf_counter() - started) * 1000)
+    connection.close()
+    timings.sort()
+    return statistics.mean(timings), timings[len(timings) // 2], timings[int(len(timings) * 0.95)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    print(f'database: {connection.vendor} {connection.settings_dict["HOST"] or ""}')
+    print(f'{"CONN_MAX_AGE":<14}{"mean, ms":>10}{"p50, ms":>10}{"p95, ms":>10}')
+    for conn_max_age in (0, 600):
+        mean, p50, p95 = run(args.requests, conn_max_age)
+        print(f'{conn_max_age:<14}{mean:>10.3f}{p50:>10.3f}{p95:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Время холодного старта процесса (python -X importtime) для профилей настроек.
+
+Для каждого профиля запускается отдельный процесс, который выполняет django.setup() и импортирует URLConf,
+как это делает воркер gunicorn перед приемом запросов. Результаты дописываются в
+benchmarks/results/importtime.jsonl, чтобы отслеживать изменения между коммитами.
+
+Запуск: python benchmarks/bench_importtime.py [--top 15] [--settings shopping_service.settings_api ...]
+"""
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_FILE = os.path.join(BASE_DIR, 'benchmarks', 'results', 'importtime.jsonl')
+STARTUP_CODE = 'import django; django.setup(); from django.urls import get_resolver; get_resolver().url_patterns'
+DEFAULT_SETTINGS = ('shopping_service.settings', 'shopping_service.settings_production',
+                    'shopping_service.settings_api')
+
+
+def measure(settings_module):
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings_module}
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP_CODE], cwd=BASE_DIR, env=env,
+                             capture_output=True, text=True, check=True)
+    wall_time = time.perf_counter() - started
+    modules = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        modules.append((int(cumulative_us), int(self_us), name.rstrip()))
+    top_level = [module for module in modules if not module[2].startswith('   ')]
+    return {
+        'wall_ms': round(wall_time * 1000, 1),
+        'imports_ms': round(sum(module[0] for module in top_level) / 1000, 1),
+        'modules': len(modules),
+    }, sorted(top_level, reverse=True)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--settings', nargs='+', default=DEFAULT_SETTINGS)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    records = []
+    for settings_module in args.settings:
+        summary, top_level = measure(settings_module)
+        print(f'{settings_module}: {summary["wall_ms"]} ms wall, {summary["imports_ms"]} ms imports, '
+              f'{summary["modules"]} modules')
+        for cumulative_us, _, name in top_level[:args.top]:
+            print(f'    {cumulative_us / 1000:>8.1f} ms  {name.strip()}')
+        records.append({'settings': settings_module, **summary})
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+        with open(RESULTS_FILE, 'a', encoding='utf-8') as stream:
+            for record in records:
+                stream.write(json.dumps({'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                                         'revision': git_revision(), **record}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Сравнение размера ответа и времени кодирования страницы каталога из 10 000 товаров.
+
+Запуск: python benchmarks/bench_renderers.py [--items 10000] [--repeat 5]
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shopping_service.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+from backend.renderers import FastJSONRenderer, MessagePackRenderer, msgpack  # noqa: E402
+from backend.middleware import brotli  # noqa: E402
+
+
+def make_page(items):
+    return [{
+        'id': i,
+        'model': 'apple/iphone/xs-max',
+        'product': {'id': 4216292 + i, 'name': f'Смартфон Apple iPhone XS Max 512GB (золотистый) #{i}',
+                    'category': 'Смартфоны'},
+        'shop': i % 10,
+        'quantity': i % 20,
+        'price': 110000 + i,
+        'price_rrc': 116990 + i,
+        'product_parameters': [
+            {'parameter': 'Диагональ (дюйм)', 'value': '6.5'},
+            {'parameter': 'Разрешение (пикс)', 'value': '2688x1242'},
+            {'parameter': 'Встроенная память (Гб)', 'value': '512'},
+            {'parameter': 'Цвет', 'value': 'золотистый'},
+        ],
+    } for i in range(items)]
+
+
+def measure(func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    data = make_page(args.items)
+    renderers = [('stdlib json', JSONRenderer()), ('fast json', FastJSONRenderer())]
+    if msgpack is not None:
+        renderers.append(('msgpack', MessagePackRenderer()))
+
+    print(f'{"format":<14}{"size, KB":>12}{"encode, ms":>12}{"gzip, KB":>12}{"gzip, ms":>10}'
+          f'{"br, KB":>10}{"br, ms":>10}')
+    for name, renderer in renderers:
+        payload, encode_time = measure(lambda: renderer.render(data), args.repeat)
+        gzipped, gzip_time = measure(lambda: gzip.compress(payload, mtime=0), args.repeat)
+        row = f'{name:<14}{len(payload) / 1024:>12.1f}{encode_time * 1000:>12.1f}' \
+              f'{len(gzipped) / 1024:>12.1f}{gzip_time * 1000:>10.1f}'
+        if brotli is not None:
+            compressed, brotli_time = measure(lambda: brotli.compress(payload, quality=5), args.repeat)
+            row += f'{len(compressed) / 1024:>10.1f}{brotli_time * 1000:>10.1f}'
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
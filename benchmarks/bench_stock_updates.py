@@ -0,0 +1,62 @@
+"""
+Пропускная способность частичного обновления остатков (backend.importer.apply_stock_updates).
+
+Создает временный магазин с N предложениями в настроенной базе, применяет изменения остатков и цен
+пачками разного размера и удаляет магазин.
+
+Запуск: python benchmarks/bench_stock_updates.py [--offers 20000] [--chunks 500 1000 5000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shopping_service.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from backend import outbox  # noqa: E402
+from backend.importer import apply_stock_updates  # noqa: E402
+from backend.models import Category, Product, ProductInfo, Shop  # noqa: E402
+
+PRODUCT_ID_BASE = 900_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--offers', type=int, default=20000)
+    parser.add_argument('--chunks', type=int, nargs='+', default=(500, 1000, 5000))
+    args = parser.parse_args()
+
+    outbox._schedule_relay = lambda: None  # брокер для замера не нужен
+    category, _ = Category.objects.get_or_create(id=PRODUCT_ID_BASE, defaults={'name': 'bench'})
+    shop = Shop.objects.create(name=f'bench-{time.time()}')
+    product_ids = range(PRODUCT_ID_BASE, PRODUCT_ID_BASE + args.offers)
+    try:
+        Product.objects.bulk_create([Product(id=product_id, name=str(product_id), category=category)
+                                     for product_id in product_ids], ignore_conflicts=True, batch_size=5000)
+        ProductInfo.objects.bulk_create([ProductInfo(product_id=product_id, shop=shop, quantity=1, price=1, price_rrc=1)
+                                         for product_id in product_ids], batch_size=5000)
+        print(f'database: {connection.vendor}, offers: {args.offers}')
+        print(f'{"chunk":<8}{"seconds":>10}{"updates/s":>12}')
+        for chunk_size in args.chunks:
+            updates = {product_id: {'quantity': random.randint(0, 100), 'price': random.randint(1, 10 ** 6)}
+                       for product_id in product_ids}
+            started = time.perf_counter()
+            apply_stock_updates(shop.id, updates, chunk_size=chunk_size)
+            elapsed = time.perf_counter() - started
+            print(f'{chunk_size:<8}{elapsed:>10.3f}{args.offers / elapsed:>12.0f}')
+    finally:
+        shop.delete()
+        Product.objects.filter(id__in=product_ids).delete()
+        category.delete()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Нагрузочный тест потока /api/v1/stream: N неактивных подписчиков и рассылка событий по ним.
+
+По умолчанию подписчики подключаются к backend.stream.StreamApplication в этом же процессе
+(без HTTP-сервера), что позволяет измерить память на одного подписчика (tracemalloc). С --url подписчики
+открывают настоящие HTTP-соединения с запущенным сервером, например:
+
+    gunicorn -k uvicorn.workers.UvicornWorker -w 1 shopping_service.asgi:application
+    python benchmarks/bench_stream_subscribers.py --url http://127.0.0.1:8000 --subscribers 5000
+
+(ulimit -n должен быть больше количества подписчиков). Нужен только локальный Redis (PUSH_REDIS_URL):
+события публикуются в него так же, как это делают потребители outbox (backend.push.publish).
+
+Запуск: python benchmarks/bench_stream_subscribers.py [--subscribers 5000] [--products 100] [--events 20]
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shopping_service.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from backend import push  # noqa: E402
+from backend.stream import StreamApplication  # noqa: E402
+
+PRODUCT_ID_BASE = 900_000_000
+
+
+class InProcessClient:
+    """
+    Подписчик, вызывающий ASGI-приложение напрямую
+    """
+
+    def __init__(self, application, product_id):
+        self.frames = 0
+        self.closed = asyncio.Event()
+        self.task = asyncio.create_task(application(
+            {'type': 'http', 'path': '/api/v1/stream', 'query_string': f'products={product_id}'.encode(),
+             'headers': []}, self.receive, self.send))
+
+    async def receive(self):
+        await self.closed.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.body' and message['body'].startswith(b'event:'):
+            self.frames += 1
+
+    async def close(self):
+        self.closed.set()
+        await self.task
+
+
+class HttpClient:
+    """
+    Подписчик с HTTP-соединением к запущенному серверу
+    """
+
+    def __init__(self, url, product_id):
+        self.url, self.product_id = urlsplit(url), product_id
+        self.frames = 0
+        self.task = None
+
+    async def connect(self):
+        reader, self.writer = await asyncio.open_connection(self.url.hostname, self.url.port or 80)
+        self.writer.write(f'GET /api/v1/stream?products={self.product_id} HTTP/1.1\r\n'
+                          f'Host: {self.url.netloc}\r\nAccept: text/event-stream\r\n\r\n'.encode())
+        await self.writer.drain()
+        status = await reader.readline()
+        if b' 200 ' not in status:
+            raise RuntimeError(status.decode().strip())
+        self.task = asyncio.create_task(self.read(reader))
+
+    async def read(self, reader):
+        while line := await reader.readline():
+            if b'event: stock' in line:
+                self.frames += 1
+
+    async def close(self):
+        self.writer.close()
+        self.task.cancel()
+
+
+async def wait_frames(clients, expected, timeout=60):
+    started = time.perf_counter()
+    while sum(client.frames for client in clients) < expected:
+        if time.perf_counter() - started > timeout:
+            break
+        await asyncio.sleep(0.005)
+    return time.perf_counter() - started, sum(client.frames for client in clients)
+
+
+async def run(args):
+    product_ids = [PRODUCT_ID_BASE + index for index in range(args.products)]
+    tracemalloc.start()
+    application = StreamApplication(None)
+    memory_before = tracemalloc.get_traced_memory()[0]
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    started = time.perf_counter()
+    if args.url:
+        clients = [HttpClient(args.url, random.choice(product_ids)) for _ in range(args.subscribers)]
+        for start in range(0, len(clients), 500):
+            await asyncio.gather(*(client.connect() for client in clients[start:start + 500]))
+    else:
+        clients = [InProcessClient(application, random.choice(product_ids)) for _ in range(args.subscribers)]
+        while sum(map(len, application.hub.listeners.values())) < args.subscribers:
+            await asyncio.sleep(0.01)
+    print(f'{args.subscribers} subscribers connected in {time.perf_counter() - started:.2f} s')
+    if not args.url:
+        per_subscriber = (tracemalloc.get_traced_memory()[0] - memory_before) / args.subscribers
+        print(f'memory: {per_subscriber / 1024:.1f} KiB per idle subscriber (tracemalloc), '
+              f'max RSS +{(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024:.1f} MiB')
+    tracemalloc.stop()
+
+    # каждое событие - изменение остатков всех товаров, т.е. каждый подписчик получает по кадру
+    for event in range(args.events):
+        expected = sum(client.frames for client in clients) + args.subscribers
+        messages = [(push.PRODUCT_CHANNEL.format(product_id),
+                     push.frame('stock', {'product': product_id, 'quantity': event, 'price': 100, 'offers': 1}))
+                    for product_id in product_ids]
+        started = time.perf_counter()
+        await asyncio.get_running_loop().run_in_executor(None, push.publish, messages)
+        elapsed, received = await wait_frames(clients, expected)
+        if event == 0 or event == args.events - 1:
+            print(f'event {event + 1}: {args.subscribers} frames delivered in {elapsed * 1000:.1f} ms'
+                  + ('' if received >= expected else f' (only {received - expected + args.subscribers})'))
+
+    await asyncio.gather(*(client.close() for client in clients))
+    if not args.url:
+        await application.hub.close()
+        print(f'channels left subscribed: {len(application.hub.listeners)}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--subscribers', type=int, default=5000)
+    parser.add_argument('--products', type=int, default=100)
+    parser.add_argument('--events', type=int, default=20)
+    parser.add_argument('--url', help='адрес запущенного ASGI-сервера, по умолчанию замер в этом процессе')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
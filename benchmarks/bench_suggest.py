@@ -0,0 +1,75 @@
+"""
+Время построения индекса подсказок (backend.suggest) и ответа на запрос на синтетическом каталоге.
+
+Запуск: python benchmarks/bench_suggest.py [--products 200000] [--offers 1000000] [--queries 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shopping_service.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from backend.suggest import SuggestIndex  # noqa: E402
+
+BRANDS = ('apple', 'samsung', 'xiaomi', 'huawei', 'honor', 'kingston', 'sandisk', 'lenovo', 'asus', 'acer')
+KINDS = ('Смартфон', 'Планшет', 'Ноутбук', 'Флешка', 'Наушники', 'Чехол', 'Зарядное устройство')
+COLORS = ('черный', 'белый', 'серебристый', 'золотой', 'синий', 'красный')
+
+
+def catalog(products, offers, categories, seed=1):
+    random_state = random.Random(seed)
+    product_rows, models = [], []
+    for product_id in range(1, products + 1):
+        brand, line = random_state.choice(BRANDS), f'{random_state.choice("abcdefghkmnprstxz")}{product_id % 997}'
+        models.append(f'{brand}/{line}/{random_state.choice(("pro", "lite", "max", "mini", "plus"))}')
+        product_rows.append((product_id, f'{random_state.choice(KINDS)} {brand.title()} {line.upper()} '
+                                         f'{random_state.choice((32, 64, 128, 256))}GB '
+                                         f'({random_state.choice(COLORS)})', product_id % categories + 1))
+    offer_rows = [(product_id, random_state.randint(1, 50), models[product_id - 1], random_state.randint(0, 20))
+                  for product_id in (random_state.randint(1, products) for _ in range(offers))]
+    return product_rows, offer_rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=200000)
+    parser.add_argument('--offers', type=int, default=1000000)
+    parser.add_argument('--categories', type=int, default=100)
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    products, offers = catalog(args.products, args.offers, args.categories)
+    started = time.perf_counter()
+    index = SuggestIndex(products, offers, set(range(1, 51)))
+    print(f'index: {len(index)} products, {len(index.terms)} terms, {len(index.top)} cached prefixes, '
+          f'built in {time.perf_counter() - started:.1f} s')
+
+    random_state = random.Random(2)
+    names = [name for _, name, _ in products]
+    for label, make_query, filters in (
+            ('1 char', lambda: random_state.choice(BRANDS)[:1], {}),
+            ('word prefix', lambda: random_state.choice(BRANDS)[:4], {}),
+            ('two words', lambda: ' '.join(word[:3] for word in random_state.choice(names).split()[1:3]), {}),
+            ('model', lambda: random_state.choice(BRANDS) + '/', {}),
+            ('category', lambda: random_state.choice(BRANDS)[:3], {'category_id': 7}),
+            ('in stock', lambda: random_state.choice(KINDS)[:3], {'in_stock': True})):
+        queries = [make_query() for _ in range(args.queries)]
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            index.suggest(query, 10, **filters)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        print(f'{label:>12}: p50 {timings[len(timings) // 2] * 1e6:8.0f} us, '
+              f'p99 {timings[int(len(timings) * 0.99)] * 1e6:8.0f} us')
+
+
+if __name__ == '__main__':
+    main()
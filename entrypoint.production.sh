@@ -0,0 +1,31 @@
+#!/bin/sh
+# Запуск в production: ./entrypoint.production.sh web|stream|worker|webhooks|beat
+set -e
+
+export DJANGO_SETTINGS_MODULE="${DJANGO_SETTINGS_MODULE:-shopping_service.settings_production}"
+
+case "$1" in
+  web)
+    python manage.py migrate --no-input
+    python manage.py collectstatic --no-input
+    exec gunicorn -c gunicorn.conf.py shopping_service.wsgi:application
+    ;;
+  worker)
+    exec celery -A shopping_service.celery:app worker -l INFO
+    ;;
+  stream)
+    # поток /api/v1/stream: соединения долгие, поэтому асинхронные воркеры uvicorn вместо gthread
+    exec gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker shopping_service.asgi:application
+    ;;
+  webhooks)
+    # запросы к серверам поставщиков ограничены сетью, поэтому пул потоков вместо процессов
+    exec celery -A shopping_service.celery:app worker -Q webhooks -P threads -c "${WEBHOOK_CONCURRENCY:-32}" -l INFO
+    ;;
+  beat)
+    exec celery -A shopping_service.celery:app beat -l INFO
+    ;;
+  *)
+    echo "Usage: $0 web|stream|worker|webhooks|beat" >&2
+    exit 1
+    ;;
+esac
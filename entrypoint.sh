@@ -4,8 +4,8 @@ python manage.py flush --no-input
 python manage.py migrate
 python manage.py collectstatic --no-input
 #python manage.py runserver
+celery -A shopping_service.celery:app worker -Q celery,webhooks -l INFO &
 gunicorn --bind 0.0.0.0:8000 shopping_service.wsgi:application
-celery -A shopping_service.celery:app worker -l INFO
 
 
 set -e
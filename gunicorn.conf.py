@@ -0,0 +1,30 @@
+"""
+Конфигурация gunicorn для production (entrypoint.production.sh web).
+Параметры переопределяются переменными окружения GUNICORN_*.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# потоковые воркеры: запросы к API в основном ждут базу и Redis, поэтому потоки дешевле процессов
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# приложение загружается один раз в мастер-процессе до fork: быстрее старт воркеров и меньше памяти
+preload_app = True
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    # соединения, случайно открытые в мастере при импорте, не должны разделяться между процессами
+    from django.db import connections
+    connections.close_all()
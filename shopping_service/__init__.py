@@ -1,3 +1,9 @@
-from .celery import app as celery_app
+def __getattr__(name):
+    # приложение Celery загружается при первом обращении: веб-процесс импортирует его только при постановке задач
+    if name == 'celery_app':
+        from .celery import app
+        return app
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
 
 __all__ = ('celery_app',)
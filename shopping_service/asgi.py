@@ -2,6 +2,8 @@
 ASGI config for shopping_service project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests to /api/v1/stream (Server-Sent Events) are served by backend.stream,
+everything else is passed to Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
@@ -13,4 +15,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shopping_service.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from backend.stream import StreamApplication  # noqa: E402 настройки Django должны быть загружены
+
+application = StreamApplication(django_application)
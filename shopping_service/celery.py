@@ -2,6 +2,7 @@ import os
 
 from celery import Celery
 from celery.result import AsyncResult
+from celery.schedules import crontab
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shopping_service.settings')
@@ -14,6 +15,11 @@ app = Celery('shopping_service')
 #   should have a `CELERY_` prefix.
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
+# в CELERY_BEAT_SCHEDULE расписание crontab задается словарем аргументов
+for entry in app.conf.beat_schedule.values():
+    if isinstance(entry['schedule'], dict):
+        entry['schedule'] = crontab(**entry['schedule'])
+
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
 
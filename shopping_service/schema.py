@@ -0,0 +1,51 @@
+"""
+Раздача заранее собранной схемы OpenAPI (python manage.py spectacular --file schema.yml).
+
+Схема читается с диска один раз на процесс. Адрес /api/schema/<hash>/ содержит хэш содержимого
+и кэшируется клиентами бессрочно, /api/schema/ отдается с ETag.
+"""
+import hashlib
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.shortcuts import redirect
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from django.views import View
+
+
+@lru_cache(maxsize=None)
+def load_schema():
+    """
+    Содержимое собранной схемы и хэш содержимого
+    """
+    with open(settings.SPECTACULAR_PREBUILT_SCHEMA, 'rb') as stream:
+        content = stream.read()
+    return content, hashlib.sha256(content).hexdigest()[:16]
+
+
+def schema_url():
+    return f'/api/schema/{load_schema()[1]}/'
+
+
+class PrebuiltSchemaView(View):
+    """
+    Класс для получения собранной схемы OpenAPI
+    """
+
+    def get(self, request, digest=None):
+        content, content_hash = load_schema()
+        if digest is not None and digest != content_hash:  # ссылка на устаревшую версию схемы
+            return redirect(schema_url())
+        etag = f'"{content_hash}"'
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type='application/vnd.oai.openapi; charset=utf-8')
+        response['ETag'] = etag
+        if digest is None:
+            patch_cache_control(response, public=True, no_cache=True)
+        else:
+            patch_cache_control(response, public=True, max_age=60 * 60 * 24 * 365, immutable=True)
+        return response
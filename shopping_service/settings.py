@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 import os
 import sys
+from importlib.util import find_spec
 
 from dotenv import dotenv_values
 from pathlib import Path
@@ -92,6 +93,7 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'backend.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -189,6 +191,11 @@ SPECTACULAR_SETTINGS = {
     'REDOC_DIST': 'SIDECAR',
 }
 
+# собранная схема (python manage.py spectacular --file schema.yml) раздается вместо построения на каждый запрос
+# только при SPECTACULAR_SERVE_PREBUILT, в разработке и тестах схема строится по текущему коду
+SPECTACULAR_PREBUILT_SCHEMA = BASE_DIR / 'schema.yml'
+SPECTACULAR_SERVE_PREBUILT = False
+
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
     'allauth.account.auth_backends.AuthenticationBackend'
@@ -207,10 +214,9 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
 
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'backend.renderers.FastJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
-        'backend.renderers.UTF8CharsetJSONRenderer',
-
+        *(('backend.renderers.MessagePackRenderer',) if find_spec('msgpack') else ()),
     ),
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -232,8 +238,21 @@ EMAIL_PORT = env['EMAIL_PORT']
 EMAIL_USE_SSL = True
 SERVER_EMAIL = EMAIL_HOST_USER
 
-REDIS_HOST = '127.0.0.1'
-REDIS_PORT = '6379'
+REDIS_HOST = env.get('REDIS_HOST', '127.0.0.1')
+REDIS_PORT = env.get('REDIS_PORT', '6379')
+
+RESPONSE_COMPRESSION_MIN_SIZE = 1024  # ответы меньше этого размера (в байтах) не сжимаются
+RESPONSE_COMPRESSION_BROTLI_QUALITY = 5  # уровень сжатия brotli (0-11): выше - меньше ответ, но дольше сжатие
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://' + REDIS_HOST + ':' + REDIS_PORT + '/3',
+    }
+}
+
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24  # время хранения ответа на запрос с Idempotency-Key (в секундах)
+IDEMPOTENCY_LOCK_TIMEOUT = 60 * 5  # максимальное время обработки запроса, в течение которого повторы получают 409
 
 CELERY_BROKER_URL = 'redis://' + REDIS_HOST + ':' + REDIS_PORT + '/1'
 CELERY_BROKER_TRANSPORT = 'redis'
@@ -242,3 +261,111 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_PREFETCH_MULTIPLIER = 0
+CELERY_TASK_ROUTES = {
+    # отправка уведомлений ждет ответа сервера поставщика и выполняется отдельными воркерами
+    'backend.tasks.deliver_webhook': {'queue': 'webhooks'},
+}
+# schedule - интервал в секундах или аргументы crontab (см. shopping_service/celery.py): настройки
+# не импортируют Celery, чтобы веб-процесс его не загружал
+CELERY_BEAT_SCHEDULE = {
+    'relay-outbox': {
+        'task': 'backend.tasks.relay_outbox',
+        'schedule': 10.0,  # страховка на случай, если задача не была поставлена после коммита
+    },
+    'purge-outbox': {
+        'task': 'backend.tasks.purge_outbox',
+        'schedule': {'hour': 4, 'minute': 0},
+    },
+    'archive-orders': {
+        'task': 'backend.tasks.archive_orders',
+        'schedule': {'hour': 3, 'minute': 0},
+    },
+    'poll-shop-feeds': {
+        'task': 'backend.tasks.poll_shop_feeds',
+        'schedule': 60.0,
+    },
+    'run-order-templates': {
+        'task': 'backend.tasks.run_order_templates',
+        'schedule': 60.0,
+    },
+    'send-invoice-digest': {
+        'task': 'backend.tasks.send_invoice_digest',
+        'schedule': {'minute': '*/30'},
+    },
+    'deliver-due-webhooks': {
+        'task': 'backend.tasks.deliver_due_webhooks',
+        'schedule': 60.0,
+    },
+}
+
+OUTBOX_BATCH_SIZE = 500  # количество событий, передаваемых потребителям за один проход
+OUTBOX_MAX_ATTEMPTS = 10  # после стольких неудачных попыток событие больше не обрабатывается
+OUTBOX_RETRY_BASE_DELAY = 10  # задержка перед первым повтором события после ошибки, далее удваивается, секунд
+OUTBOX_RETRY_MAX_DELAY = 60 * 60  # максимальная задержка между попытками, секунд
+OUTBOX_RETENTION_DAYS = 7  # срок хранения обработанных событий
+
+ORDER_ARCHIVE_AFTER_DAYS = 90  # доставленные и отмененные заказы старше этого срока переносятся в архив
+INVOICE_BATCH_SIZE = 500  # количество заказов, загружаемых для накладных одной парой запросов
+INVOICE_DIGEST_MAX_ORDERS = 1000  # максимальное количество заказов в одной сводке для администратора
+# адреса для сводки накладных через запятую, пустое значение отключает сводку
+INVOICE_ADMIN_EMAILS = [email for email in env.get('INVOICE_ADMIN_EMAILS', EMAIL_HOST_USER).split(',') if email]
+ORDER_TEMPLATE_BATCH_SIZE = 100  # количество шаблонов заказов, оформляемых в одной транзакции
+
+FEED_FETCH_TIMEOUT = 30  # таймаут загрузки прайса поставщика по ссылке, секунд
+FEED_POLL_BATCH_SIZE = 100  # количество магазинов, проверяемых за один запуск poll_shop_feeds
+# каталог файлов прайсов: file в partner/update и Shop.filename должны указывать на файл внутри него
+FEED_UPLOAD_DIR = env.get('FEED_UPLOAD_DIR', str(BASE_DIR / 'data'))
+# разрешить ссылки на прайсы во внутренней сети (loopback, частные и link-local адреса) - только для разработки
+FEED_ALLOW_PRIVATE_HOSTS = env.get('FEED_ALLOW_PRIVATE_HOSTS', 'False') == 'True'
+
+STOCK_UPDATE_CHUNK_SIZE = 1000  # количество товаров в одном bulk_update при частичном обновлении остатков
+STOCK_UPDATE_MAX_ITEMS = 100000  # максимальное количество изменений в одном запросе partner/stock
+
+BEST_OFFERS_MAX_PRODUCTS = 5000  # максимальное количество товаров в одном запросе products/best
+
+# снимок каталога в памяти воркера для products, products/best и проверки корзины (backend.catalog)
+CATALOG_SNAPSHOT_ENABLED = env.get('CATALOG_SNAPSHOT_ENABLED', 'False') == 'True'
+CATALOG_SNAPSHOT_RELOAD_INTERVAL = 30  # минимальный интервал между перечитываниями снимка, секунд
+CATALOG_SNAPSHOT_CHUNK_SIZE = 10000  # количество товаров или предложений, читаемых одним запросом
+
+SUGGEST_REBUILD_INTERVAL = 30  # минимальный интервал между перестроениями индекса подсказок products/suggest, секунд
+SUGGEST_CACHED_PREFIX_ENTRIES = 1000  # для префиксов с таким количеством терминов лучшие товары вычисляются заранее
+SUGGEST_CACHED_TOP = 50  # количество лучших товаров, запоминаемых для префикса
+SUGGEST_LIMIT = 10  # количество подсказок по умолчанию
+SUGGEST_MAX_LIMIT = 50  # максимальное количество подсказок в одном запросе
+
+PUSH_REDIS_URL = 'redis://' + REDIS_HOST + ':' + REDIS_PORT + '/0'  # Redis pub/sub потока /api/v1/stream
+PUSH_REDIS_TIMEOUT = 1  # таймаут публикации из потребителей событий, секунд
+PUSH_HEARTBEAT_INTERVAL = 15  # интервал пустых кадров, удерживающих соединение через прокси, секунд
+PUSH_QUEUE_SIZE = 100  # клиент, отставший на столько кадров, получает reset и переподключается
+PUSH_MAX_PRODUCTS = 100  # максимальное количество товаров в одной подписке
+PUSH_TICKET_TTL = 30  # срок действия одноразового билета подключения к потоку, секунд
+
+BATCH_MAX_REQUESTS = 100  # максимальное количество подзапросов в одном запросе /api/v1/batch
+
+ANALYTICS_DEFAULT_DAYS = 30  # период partner/analytics по умолчанию, дней
+ANALYTICS_MAX_DAYS = 366  # максимальный период одного запроса partner/analytics, дней
+ANALYTICS_TOP = 10  # количество товаров в рейтинге partner/analytics по умолчанию
+ANALYTICS_MAX_TOP = 100  # максимальное количество товаров в рейтинге
+ANALYTICS_REBUILD_CHUNK_SIZE = 1000  # количество заказов, учитываемых в одной транзакции при пересчете сводки продаж
+
+EXPORT_CHUNK_SIZE = 2000  # количество строк выгрузки заказов, читаемых одним запросом
+EXPORT_DIR = env.get('EXPORT_DIR', str(BASE_DIR / 'exports'))  # каталог файлов, выгружаемых задачей Celery
+
+WEBHOOK_BATCH_WINDOW = 10  # новые заказы магазина, поступившие за это время, отправляются одним запросом, секунд
+WEBHOOK_TIMEOUT = 10  # таймаут запроса к серверу поставщика, секунд
+# разрешить адреса подписок во внутренней сети (loopback, частные и link-local адреса) - только для разработки
+WEBHOOK_ALLOW_PRIVATE_HOSTS = env.get('WEBHOOK_ALLOW_PRIVATE_HOSTS', 'False') == 'True'
+WEBHOOK_MAX_ATTEMPTS = 12  # после стольких неудачных попыток пачка помечается как не доставленная
+WEBHOOK_RETRY_BASE_DELAY = 30  # задержка перед первым повтором, далее удваивается, секунд
+WEBHOOK_RETRY_MAX_DELAY = 6 * 60 * 60  # максимальная задержка между попытками, секунд
+WEBHOOK_SWEEP_BATCH_SIZE = 1000  # количество пачек, ставящихся на отправку за один запуск deliver_due_webhooks
+
+# коды, присваиваемые новым параметрам при импорте прайса, для фильтров вида products?memory>=256&diagonal<=6.5
+# коды остальных параметров задаются в админке
+PARAMETER_CODES = {
+    'Диагональ (дюйм)': 'diagonal',
+    'Разрешение (пикс)': 'resolution',
+    'Встроенная память (Гб)': 'memory',
+    'Цвет': 'color',
+}
@@ -0,0 +1,43 @@
+"""
+Профиль только для API: без веб-интерфейса (admin, allauth, crispy forms, Swagger UI, Browsable API).
+
+Веб-интерфейс обслуживают поды с shopping_service.settings_production, поды API стартуют быстрее
+за счет меньшего числа импортируемых приложений.
+Запуск: DJANGO_SETTINGS_MODULE=shopping_service.settings_api ./entrypoint.production.sh web
+"""
+from shopping_service.settings_production import *  # noqa: F401,F403
+from shopping_service.settings_production import INSTALLED_APPS, MIDDLEWARE, REST_FRAMEWORK, TEMPLATES
+
+WEB_UI_APPS = {
+    'django.contrib.admin',
+    'django.contrib.messages',
+    'django.contrib.sessions',
+    'crispy_forms',
+    'unittest',
+    'drf_spectacular_sidecar',
+    'django_celery_results',  # результаты задач хранятся в Redis (CELERY_RESULT_BACKEND), модели видны только в admin
+}
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in WEB_UI_APPS and not app.startswith('allauth')]
+
+# авторизация в API выполняется по токену в DRF, сессии и сообщения не нужны
+MIDDLEWARE = [middleware for middleware in MIDDLEWARE if middleware not in {
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+}]
+
+TEMPLATES = [{**TEMPLATES[0], 'OPTIONS': {'context_processors': [
+    'django.template.context_processors.request',
+]}}]
+
+AUTHENTICATION_BACKENDS = [
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': tuple(
+        renderer for renderer in REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']
+        if renderer != 'rest_framework.renderers.BrowsableAPIRenderer'),
+}
@@ -0,0 +1,30 @@
+"""
+Настройки для запуска в production: gunicorn (gunicorn.conf.py) и Celery с постоянными подключениями к базе.
+
+Запуск: DJANGO_SETTINGS_MODULE=shopping_service.settings_production ./entrypoint.production.sh web
+"""
+from shopping_service.settings import *  # noqa: F401,F403
+from shopping_service.settings import DATABASES, env
+
+DEBUG = False
+SPECTACULAR_SERVE_PREBUILT = True  # schema.yml собирается при сборке образа (Dockerfile)
+
+# Подключение к Postgres переиспользуется между запросами и задачами Celery вместо открытия нового на каждый
+# запрос. Перед повторным использованием соединение проверяется, разорванное соединение открывается заново.
+# Количество соединений с базой = воркеры gunicorn * потоки + процессы Celery.
+DATABASES['default'].update({
+    'CONN_MAX_AGE': int(env.get('DB_CONN_MAX_AGE') or 600),
+    'CONN_HEALTH_CHECKS': True,
+})
+
+# Подключение через локальный pgbouncer (docker compose --profile pgbouncer) в режиме transaction pooling:
+# Django держит постоянное соединение с pgbouncer, а он раздает небольшой пул соединений с Postgres.
+if env.get('PGBOUNCER_HOST'):
+    DATABASES['default'].update({
+        'HOST': env['PGBOUNCER_HOST'],
+        'PORT': env.get('PGBOUNCER_PORT') or '6432',
+        'DISABLE_SERVER_SIDE_CURSORS': True,  # серверные курсоры не работают в режиме transaction pooling
+    })
+
+CELERY_WORKER_MAX_TASKS_PER_CHILD = 1000  # процесс воркера перезапускается, освобождая память и соединение
+CELERY_BROKER_POOL_LIMIT = 10
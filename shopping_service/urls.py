@@ -13,20 +13,52 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
-from django.urls import path, include
+import os
+
+from django.apps import apps
+from django.conf import settings
+from django.urls import path, re_path, include
 from django.views.generic import TemplateView
-from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 
+from shopping_service.schema import PrebuiltSchemaView, schema_url
 
 urlpatterns = [
-    path('home/', TemplateView.as_view(template_name='dashboard/home.html'), name='home'),
-    # YOUR PATTERNS
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
-    # Optional UI:
-    path('api/schema/swagger-ui/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-    path('api/schema/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
-    path('admin/', admin.site.urls),
     path('api/v1/', include('backend.urls', namespace='backend')),
-    path('accounts/', include('allauth.urls'))
 ]
+
+# схема собрана заранее и не строится на каждый запрос (production)
+if settings.SPECTACULAR_SERVE_PREBUILT and os.path.exists(settings.SPECTACULAR_PREBUILT_SCHEMA):
+    urlpatterns += [
+        path('api/schema/', PrebuiltSchemaView.as_view(), name='schema'),
+        re_path(r'^api/schema/(?P<digest>[0-9a-f]{16})/$', PrebuiltSchemaView.as_view(), name='schema-hashed'),
+    ]
+    schema_ui_kwargs = {'url': schema_url()}
+else:
+    from drf_spectacular.views import SpectacularAPIView
+
+    urlpatterns += [
+        path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
+    ]
+    schema_ui_kwargs = {'url_name': 'schema'}
+
+if apps.is_installed('drf_spectacular_sidecar'):
+    from drf_spectacular.views import SpectacularRedocView, SpectacularSwaggerView
+
+    urlpatterns += [
+        # Optional UI:
+        path('api/schema/swagger-ui/', SpectacularSwaggerView.as_view(**schema_ui_kwargs), name='swagger-ui'),
+        path('api/schema/redoc/', SpectacularRedocView.as_view(**schema_ui_kwargs), name='redoc'),
+    ]
+
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+
+    urlpatterns += [
+        path('admin/', admin.site.urls),
+    ]
+
+if apps.is_installed('allauth'):
+    urlpatterns += [
+        path('home/', TemplateView.as_view(template_name='dashboard/home.html'), name='home'),
+        path('accounts/', include('allauth.urls')),
+    ]
@@ -0,0 +1,118 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from backend import outbox
+from backend.models import User, Shop, Category, Product, ProductInfo, Order, OrderItem, Contact, SalesRollup
+from backend.outbox import publish
+from backend.tasks import archive_orders
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def rollups():
+    return {product_id: values for product_id, *values in SalesRollup.objects.order_by('product_id').values_list(
+        'product_id', 'orders', 'units', 'revenue', 'canceled_units', 'delivered_units')}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SalesRollupTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.buyer = User.objects.create_user(email='buyer@buyer.ru', password='a1d2m3i4n5')
+        self.supplier = User.objects.create_user(email='shop1@shop.ru', password='a1d2m3i4n5', type='shop')
+        self.shop = Shop.objects.create(name='shop', state=True, user=self.supplier)
+        Category.objects.create(id=1, name='category')
+        for product_id, price in ((1, 100), (2, 300)):
+            Product.objects.create(id=product_id, name=f'product {product_id}', category_id=1)
+            ProductInfo.objects.create(id=product_id, model='model', product_id=product_id, shop=self.shop,
+                                       quantity=10, price=price, price_rrc=1)
+        self.contact = Contact.objects.create(user=self.buyer, city='Moscow', street='Lenina', phone='+7000')
+
+    def place(self, *items, state='new'):
+        order = Order.objects.create(user=self.buyer, state=state, contact=self.contact)
+        for product_info_id, quantity in items:
+            OrderItem.objects.create(order=order, product_info_id=product_info_id, quantity=quantity)
+        publish('order.new', user_id=self.buyer.id, order_id=order.id)
+        outbox.relay()
+        return order
+
+    def set_state(self, order, state):
+        Order.objects.filter(id=order.id).update(state=state)
+        publish('order.updated', user_id=self.buyer.id, order_id=order.id, state=state)
+        outbox.relay()
+
+    def test_incremental_updates(self):
+        order = self.place((1, 2), (2, 1))
+        self.place((1, 1))
+        self.assertEqual(rollups(), {1: [2, 3, 300, 0, 0], 2: [1, 1, 300, 0, 0]})
+
+        publish('order.new', user_id=self.buyer.id, order_id=order.id)  # повторное событие не учитывается
+        outbox.relay()
+        self.set_state(order, 'delivered')
+        self.assertEqual(rollups(), {1: [2, 3, 300, 0, 2], 2: [1, 1, 300, 0, 1]})
+        self.set_state(order, 'sent')  # возврат из доставленных
+        self.set_state(order, 'canceled')
+        self.assertEqual(rollups(), {1: [2, 3, 300, 2, 0], 2: [1, 1, 300, 1, 0]})
+
+    def test_cancel_deletes_order(self):
+        order = self.place((2, 2))
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.buyer).key)
+        response = self.client.delete('/api/v1/order/delete/', {'id': str(order.id)})
+        self.assertTrue(response.json()['Status'])
+        outbox.relay()
+        self.assertEqual(rollups(), {2: [1, 2, 600, 2, 0]})
+
+    def test_rebuild(self):
+        delivered = self.place((1, 2), (2, 1))
+        self.set_state(delivered, 'delivered')
+        Order.objects.filter(id=delivered.id).update(dt=timezone.now() - timedelta(days=120))
+        self.place((1, 1))
+        Order.objects.create(user=self.buyer, state='basket')
+        archive_orders(days=90)
+        self.assertEqual(SalesRollup.objects.count(), 2)  # заказ учтен до переноса даты
+
+        call_command('rebuild_sales_rollups', chunk_size=1, stdout=StringIO())
+        self.assertEqual(SalesRollup.objects.count(), 3)
+        self.assertEqual(rollups()[2], [1, 1, 300, 0, 1])
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(SalesRollup.objects.count(), 3)
+
+    def test_partner_analytics(self):
+        old = self.place((1, 1))
+        Order.objects.filter(id=old.id).update(dt=timezone.now() - timedelta(days=40))
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.set_state(self.place((1, 2), (2, 1)), 'delivered')
+        self.set_state(self.place((2, 1)), 'canceled')
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.supplier).key)
+        with self.assertNumQueries(5):  # токен, магазин, итоги, дни и рейтинг
+            response = self.client.get('/api/v1/partner/analytics')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['date_to'], timezone.localdate().isoformat())
+        self.assertEqual(data['totals']['units'], 4)
+        self.assertEqual(data['totals']['net_revenue'], 500)
+        self.assertEqual(data['totals']['delivered_revenue'], 500)
+        self.assertEqual(len(data['days']), 1)
+        self.assertEqual([(item['product'], item['net_revenue']) for item in data['top']], [(2, 300), (1, 200)])
+
+        response = self.client.get('/api/v1/partner/analytics', {'order_by': 'canceled_units', 'top': 1,
+                                                                 'date_from': data['date_to']})
+        self.assertEqual([(item['product'], item['units']) for item in response.json()['top']], [(2, 2)])
+        response = self.client.get('/api/v1/partner/analytics', {'date_from': (
+            timezone.localdate() - timedelta(days=60)).isoformat()})
+        self.assertEqual(response.json()['totals']['units'], 5)
+        for params in ({'date_from': '2024-13-01'}, {'date_from': '2030-01-01'}, {'top': '0'},
+                       {'order_by': 'price'}):
+            self.assertEqual(self.client.get('/api/v1/partner/analytics', params).status_code, 400)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.buyer).key)
+        self.assertEqual(self.client.get('/api/v1/partner/analytics').status_code, 403)
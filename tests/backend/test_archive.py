@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from backend.models import User, Shop, Category, Product, ProductInfo, Order, OrderItem, Contact, ArchivedOrder
+from backend.tasks import archive_orders
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ArchiveTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='buyer@buyer.ru', password='a1d2m3i4n5')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        Shop.objects.create(id=1, name='shop', state=True)
+        Category.objects.create(id=1, name='category')
+        Product.objects.create(id=1, name='product', category_id=1)
+        ProductInfo.objects.create(id=1, model='model', product_id=1, shop_id=1, quantity=5, price=100, price_rrc=1)
+        contact = Contact.objects.create(user=self.user, city='Moscow', street='Lenina', phone='+7(707)101-69-33')
+        for state in ('delivered', 'canceled', 'new'):
+            order = Order.objects.create(user=self.user, state=state, contact=contact)
+            OrderItem.objects.create(order=order, product_info_id=1, quantity=2)
+        Order.objects.update(dt=timezone.now() - timedelta(days=120))
+        recent = Order.objects.create(user=self.user, state='delivered', contact=contact)
+        OrderItem.objects.create(order=recent, product_info_id=1, quantity=1)
+
+    def test_archive_moves_old_finished_orders(self):
+        self.assertEqual(archive_orders(days=90, batch_size=1), 2)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(set(ArchivedOrder.objects.values_list('state', flat=True)), {'delivered', 'canceled'})
+        self.assertEqual(ArchivedOrder.objects.first().total_sum, 200)
+
+    def test_archive_endpoint(self):
+        archive_orders(days=90)
+        response = self.client.get('/api/v1/order/archive/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['results'][0]['ordered_items'][0]['product_name'], 'product')
+
+    def test_archive_changes_order_list_etag(self):
+        etag = self.client.get('/api/v1/order/')['ETag']
+        self.assertEqual(self.client.get('/api/v1/order/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        archive_orders(days=90)
+        self.assertEqual(self.client.get('/api/v1/order/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
@@ -0,0 +1,85 @@
+import json
+import os
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from backend.importer import load_feed, import_shop
+from backend.models import User, Contact, Order, OrderItem, ProductInfo
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data')
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BatchTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        supplier = User.objects.create_user(email='shop1@shop.ru', password='a1d2m3i4n5', type='shop')
+        import_shop(supplier.id, load_feed(filename=os.path.join(DATA_DIR, 'shop1.yaml')))
+        self.user = User.objects.create_user(email='buyer@buyer.ru', password='a1d2m3i4n5')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.offers = list(ProductInfo.objects.order_by('id').values_list('id', flat=True)[:2])
+
+    def batch(self, requests, atomic=False):
+        response = self.client.post('/api/v1/batch', {'atomic': atomic, 'requests': requests}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def basket_item(self, offer, quantity=1):
+        items = json.dumps([{'product_info': offer, 'quantity': quantity}])
+        return {'method': 'POST', 'path': 'basket/', 'body': {'items': items}}
+
+    def test_sequence(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = self.batch([
+                {'method': 'POST', 'path': '/api/v1/user/contact',
+                 'form': {'city': 'Moscow', 'street': 'Lenina', 'phone': '7071016933'}},
+                self.basket_item(self.offers[0]),
+                self.basket_item(self.offers[1], 2),
+                {'path': 'basket/?fields=id,ordered_items'},
+                {'path': 'categories'},
+            ])
+        self.assertTrue(result['Status'])
+        self.assertEqual([response['status'] for response in result['Responses']], [200] * 5)
+        self.assertEqual(len(result['Responses'][3]['body'][0]['ordered_items']), 2)
+        self.assertIn('ETag', result['Responses'][4]['headers'])
+        self.assertTrue(Contact.objects.filter(user=self.user).exists())
+        # токен проверяется один раз на весь batch
+        self.assertEqual(sum('authtoken_token' in query['sql'] for query in queries), 1)
+
+    def test_atomic_rollback(self):
+        result = self.batch([
+            self.basket_item(self.offers[0]),
+            {'method': 'POST', 'path': 'order/', 'form': {'id': '1', 'contact': 'x'}},
+            self.basket_item(self.offers[1]),
+        ], atomic=True)
+        self.assertFalse(result['Status'])
+        self.assertEqual(result['Responses'][2]['status'], 424)
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertFalse(Order.objects.exists())
+
+    def test_idempotent_request_rolled_back(self):
+        item = dict(self.basket_item(self.offers[0]), headers={'Idempotency-Key': 'basket-1'})
+        with self.captureOnCommitCallbacks(execute=True):
+            result = self.batch([item, {'method': 'POST', 'path': 'order/', 'form': {'id': '1', 'contact': 'x'}}],
+                                atomic=True)
+        self.assertFalse(result['Status'])
+        with self.captureOnCommitCallbacks(execute=True):  # откаченный ответ не сохранен, запрос выполняется заново
+            result = self.batch([item], atomic=True)
+        self.assertTrue(result['Status'])
+        self.assertEqual(OrderItem.objects.count(), 1)
+
+        response = self.client.post('/api/v1/basket/', item['body'], format='json', HTTP_IDEMPOTENCY_KEY='basket-1')
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(OrderItem.objects.count(), 1)
+
+    def test_invalid_requests(self):
+        result = self.batch([{'path': 'unknown/'}, {'method': 'POST', 'path': 'batch'}, self.basket_item(999999)])
+        self.assertEqual([response['status'] for response in result['Responses']][:2], [400, 400])
+        self.assertEqual(self.client.post('/api/v1/batch', {'requests': []}, format='json').status_code, 400)
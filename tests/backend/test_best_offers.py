@@ -0,0 +1,61 @@
+import copy
+import os
+
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from backend import outbox
+from backend.importer import load_feed, import_shop, apply_stock_updates
+from backend.models import User, Shop, BestOffer
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data')
+SHOP1 = os.path.join(DATA_DIR, 'shop1.yaml')
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BestOfferTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        supplier1 = User.objects.create_user(email='shop1@shop.ru', password='a1d2m3i4n5', type='shop')
+        supplier2 = User.objects.create_user(email='shop2@shop.ru', password='a1d2m3i4n5', type='shop')
+        data = load_feed(filename=SHOP1)
+        self.shop1 = import_shop(supplier1.id, data)
+        data = copy.deepcopy(data)
+        data['shop'] = 'Другой'
+        for item in data['goods']:
+            item['price'] -= 1000
+        data['goods'][1]['quantity'] = 0
+        self.shop2 = import_shop(supplier2.id, data)
+        outbox.relay()
+
+    def test_index_built_from_import(self):
+        best = BestOffer.objects.get(product_id=4216292)
+        self.assertEqual((best.shop_id, best.price, best.runner_up_shop_id, best.runner_up_price, best.offers),
+                         (self.shop2.id, 109000, self.shop1.id, 110000, 2))
+        best = BestOffer.objects.get(product_id=4216313)  # у второго магазина нет в наличии
+        self.assertEqual((best.shop_id, best.runner_up_shop_id, best.offers), (self.shop1.id, None, 1))
+
+    def test_incremental_refresh(self):
+        apply_stock_updates(self.shop2.id, {4216292: {'quantity': 0}})
+        outbox.relay()
+        self.assertEqual(BestOffer.objects.get(product_id=4216292).shop_id, self.shop1.id)
+
+        Shop.objects.filter(id=self.shop1.id).update(state=False)
+        outbox.publish('catalog.updated', shop_ids=[self.shop1.id])
+        outbox.relay()
+        self.assertFalse(BestOffer.objects.filter(product_id__in=[4216292, 4216313]).exists())
+        self.assertEqual(BestOffer.objects.count(), 2)
+
+    def test_endpoint(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/products/best', {'product_id': '4216292,4216313,1'})
+        self.assertEqual([offer['product'] for offer in response.json()], [4216292, 4216313])
+        response = self.client.post('/api/v1/products/best', {'product_ids': [4672670]}, format='json')
+        self.assertEqual(response.json()[0]['shop'], self.shop2.id)
+        self.assertEqual(len(self.client.get('/api/v1/products/best', {'category_id': 224}).json()), 4)
+        self.assertEqual(self.client.get('/api/v1/products/best', {'product_id': 'a,b'}).status_code, 400)
+        response = self.client.post('/api/v1/products/best', {'product_ids': [True]}, format='json')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,92 @@
+import copy
+import os
+
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from backend import catalog, outbox
+from backend.importer import load_feed, import_shop
+from backend.models import User, Shop, ProductInfo, OrderItem
+from backend.versions import bump_catalog_version
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data')
+SHOP1 = os.path.join(DATA_DIR, 'shop1.yaml')
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CATALOG_SNAPSHOT_ENABLED=True, CATALOG_SNAPSHOT_RELOAD_INTERVAL=0)
+class CatalogSnapshotTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        catalog.reset_snapshot()
+        supplier1 = User.objects.create_user(email='shop1@shop.ru', password='a1d2m3i4n5', type='shop')
+        supplier2 = User.objects.create_user(email='shop2@shop.ru', password='a1d2m3i4n5', type='shop')
+        data = load_feed(filename=SHOP1)
+        self.shop1 = import_shop(supplier1.id, data)
+        data = copy.deepcopy(data)
+        data['shop'] = 'Другой'
+        for item in data['goods']:
+            item['price'] -= 1000
+        data['goods'][1]['quantity'] = 0
+        self.shop2 = import_shop(supplier2.id, data)
+        outbox.relay()
+
+    def tearDown(self):
+        catalog.reset_snapshot()
+
+    def get_both(self, path, params=None):
+        with self.settings(CATALOG_SNAPSHOT_ENABLED=False):
+            expected = self.client.get(path, params).json()
+        with self.assertNumQueries(0):
+            actual = self.client.get(path, params).json()
+        return expected, actual
+
+    def test_products_from_memory(self):
+        catalog.get_snapshot()  # загрузка снимка
+        for params in ({}, {'shop_id': self.shop2.id}, {'category_id': 224}):
+            expected, actual = self.get_both('/api/v1/products', params)
+            self.assertEqual(actual, sorted(expected, key=lambda offer: offer['id']))
+        with self.assertNumQueries(1):  # выбор полей - запрос к базе
+            self.client.get('/api/v1/products', {'fields': 'id,price'})
+
+    def test_best_offers_from_memory(self):
+        catalog.get_snapshot()
+        for params in ({'product_id': '4216292,4216313,1'}, {'category_id': 224}):
+            expected, actual = self.get_both('/api/v1/products/best', params)
+            self.assertEqual(actual, expected)
+
+    def test_reloaded_on_version_change(self):
+        snapshot = catalog.get_snapshot()
+        self.assertIs(catalog.get_snapshot(), snapshot)
+        offer = ProductInfo.objects.filter(shop=self.shop1).order_by('id').first()
+        ProductInfo.objects.filter(id=offer.id).update(price=1)
+        self.assertEqual(snapshot.prices[snapshot.offer_index(offer.id)], offer.price)
+
+        bump_catalog_version(self.shop1.id)
+        with self.settings(CATALOG_SNAPSHOT_RELOAD_INTERVAL=60):
+            self.assertIsNone(catalog.get_snapshot())  # перечитан недавно, запросы идут в базу
+        reloaded = catalog.get_snapshot()
+        self.assertIsNot(reloaded, snapshot)
+        self.assertEqual(reloaded.prices[reloaded.offer_index(offer.id)], 1)
+
+        Shop.objects.filter(id=self.shop1.id).update(state=False)
+        bump_catalog_version(self.shop1.id)
+        self.assertEqual({offer['shop'] for offer in catalog.get_snapshot().find_offers()}, {self.shop2.id})
+
+    def test_unavailable_cache(self):
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                               'LOCATION': 'redis://127.0.0.1:1/0'}}):
+            self.assertIsNone(catalog.get_snapshot())
+
+    def test_basket_validated_in_memory(self):
+        user = User.objects.create_user(email='user@mail.ru', password='a1d2m3i4n5', is_active=True)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+        offer_id = ProductInfo.objects.order_by('id').values_list('id', flat=True).first()
+        catalog.get_snapshot()
+        self.client.post('/api/v1/basket/', {'items': '[{"product_info": 1000000, "quantity": 1}]'})
+        response = self.client.post('/api/v1/basket/', {'items': f'[{{"product_info": {offer_id}, "quantity": 2}}]'})
+        self.assertEqual(response.json()['Создано объектов'], 1)
+        self.assertEqual(list(OrderItem.objects.values_list('product_info_id', 'quantity')), [(offer_id, 2)])
@@ -0,0 +1,80 @@
+import copy
+import os
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from backend import catalog, outbox, suggest
+from backend.importer import load_feed, import_shop
+from backend.models import User, Category
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data')
+SHOP1 = os.path.join(DATA_DIR, 'shop1.yaml')
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def paths():
+    return dict(Category.objects.values_list('id', 'path'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CATALOG_SNAPSHOT_RELOAD_INTERVAL=0, SUGGEST_REBUILD_INTERVAL=0)
+class CategoryTreeTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        catalog.reset_snapshot()
+        suggest.reset_index()
+        self.supplier = User.objects.create_user(email='shop1@shop.ru', password='a1d2m3i4n5', type='shop')
+        self.data = load_feed(filename=SHOP1)
+        self.data['categories'] = [{'id': 1000, 'name': 'Электроника'},
+                                   {'id': 224, 'name': 'Смартфоны', 'parent': 1000},
+                                   {'id': 15, 'name': 'Аксессуары', 'parent': 1000},
+                                   {'id': 1, 'name': 'Flash-накопители', 'parent': 15}]
+        import_shop(self.supplier.id, self.data)
+        outbox.relay()
+
+    def tearDown(self):
+        catalog.reset_snapshot()
+        suggest.reset_index()
+
+    def test_import_parents(self):
+        self.assertEqual(paths(), {1000: '/1000/', 224: '/1000/224/', 15: '/1000/15/', 1: '/1000/15/1/'})
+
+        data = copy.deepcopy(self.data)
+        data['categories'] = [{'id': 224, 'name': 'Смартфоны'}, {'id': 15, 'name': 'Аксессуары', 'parent': None}]
+        import_shop(self.supplier.id, data)  # без parent категория остается на месте
+        self.assertEqual(paths(), {1000: '/1000/', 224: '/1000/224/', 15: '/15/', 1: '/15/1/'})
+
+    def test_move_subtree(self):
+        root = Category.objects.create(name='Каталог')
+        category = Category.objects.get(id=1000)
+        category.parent = root
+        category.save()
+        self.assertEqual(paths()[1], f'/{root.id}/1000/15/1/')
+
+        root.parent_id = 1
+        with self.assertRaises(ValueError):
+            root.save()
+
+        Category.objects.update(path='')
+        call_command('rebuild_category_paths', stdout=StringIO())
+        self.assertEqual(paths()[1], f'/{root.id}/1000/15/1/')
+
+    def test_subtree_filters(self):
+        with self.assertNumQueries(2):  # путь категории и предложения
+            self.assertEqual(len(self.client.get('/api/v1/products', {'category_id': 1000}).json()), 4)
+        self.assertEqual(len(self.client.get('/api/v1/products', {'category_id': 224}).json()), 4)
+        self.assertEqual(self.client.get('/api/v1/products', {'category_id': 15}).json(), [])
+        self.assertEqual(len(self.client.get('/api/v1/products/best', {'category_id': 1000}).json()), 4)
+        self.assertEqual(len(self.client.get('/api/v1/products/suggest', {'q': 'apple',
+                                                                          'category_id': 1000}).json()), 4)
+        self.assertEqual(self.client.get('/api/v1/products/suggest', {'q': 'apple', 'category_id': 15}).json(), [])
+
+        with self.settings(CATALOG_SNAPSHOT_ENABLED=True):
+            snapshot = catalog.get_snapshot()
+            self.assertEqual(len(snapshot.find_offers(category_id=1000)), 4)
+            self.assertEqual(snapshot.find_offers(category_id=15), [])
+            self.assertEqual(len(snapshot.category_best_offers(1000)), 4)
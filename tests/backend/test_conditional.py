@@ -0,0 +1,71 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from backend.models import User, Shop, Category, Product, ProductInfo, Order, OrderItem, Contact
+from backend.versions import bump_catalog_version, bump_order_version
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalGetTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='buyer@buyer.ru', password='a1d2m3i4n5')
+        self.token = Token.objects.create(user=self.user)
+        Shop.objects.create(id=1, name='shop', state=True)
+        Shop.objects.create(id=2, name='shop2', state=True)
+        Category.objects.create(id=1, name='category')
+        Product.objects.create(id=1, name='product', category_id=1)
+        ProductInfo.objects.create(id=1, model='model', product_id=1, shop_id=1, quantity=1, price=1, price_rrc=1)
+
+    def test_products_not_modified_without_queries(self):
+        response = self.client.get('/api/v1/products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/v1/products/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_import_changes_etag(self):
+        etag = self.client.get('/api/v1/categories/')['ETag']
+        bump_catalog_version(1)
+        response = self.client.get('/api/v1/categories/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_shop_version_is_independent(self):
+        etag = self.client.get('/api/v1/products/?shop_id=1')['ETag']
+        bump_catalog_version(2)
+        response = self.client.get('/api/v1/products/?shop_id=1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        bump_catalog_version(1)
+        response = self.client.get('/api/v1/products/?shop_id=1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_order_version_per_user(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        etag = self.client.get('/api/v1/order/')['ETag']
+        bump_order_version(self.user.id + 1)
+        self.assertEqual(self.client.get('/api/v1/order/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        bump_order_version(self.user.id)
+        self.assertEqual(self.client.get('/api/v1/order/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @mock.patch('backend.outbox._schedule_relay')
+    def test_checkout_changes_order_etag_before_relay(self, schedule_relay):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        contact = Contact.objects.create(user=self.user, city='Moscow', street='Lenina', phone='+7000')
+        basket = Order.objects.create(user=self.user, state='basket')
+        OrderItem.objects.create(order=basket, product_info_id=1, quantity=1)
+        etag = self.client.get('/api/v1/order/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/order/', {'id': str(basket.id), 'contact': str(contact.id)})
+        self.assertTrue(response.json()['Status'])
+        schedule_relay.assert_called()  # события еще не обработаны, версия уже сброшена
+        self.assertEqual(self.client.get('/api/v1/order/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
@@ -0,0 +1,76 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from backend.exports import export_to_file, export_rows, render
+from backend.importer import load_feed, import_shop
+from backend.models import User, Contact, Order, OrderItem, ProductInfo
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data')
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class OrderExportTestCase(APITestCase):
+
+    def setUp(self):
+        supplier = User.objects.create_user(email='shop1@shop.ru', password='a1d2m3i4n5', type='shop')
+        self.shop = import_shop(supplier.id, load_feed(filename=os.path.join(DATA_DIR, 'shop1.yaml')))
+        other = User.objects.create_user(email='shop2@shop.ru', password='a1d2m3i4n5', type='shop')
+        other_shop = import_shop(other.id, load_feed(filename=os.path.join(DATA_DIR, 'shop2.yaml')))
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=supplier).key)
+        buyer = User.objects.create_user(email='buyer@buyer.ru', password='a1d2m3i4n5')
+        contact = Contact.objects.create(user=buyer, city='Moscow', street='Lenina', phone='7071016933')
+        offer, other_offer = ProductInfo.objects.filter(shop=self.shop).first(), other_shop.product_infos.first()
+        self.item_ids = []
+        for quantity in range(1, 6):
+            order = Order.objects.create(user=buyer, contact=contact, state='new')
+            self.item_ids.append(OrderItem.objects.create(order=order, product_info=offer, quantity=quantity).id)
+            OrderItem.objects.create(order=order, product_info=other_offer, quantity=1)
+        basket = Order.objects.create(user=buyer, state='basket')
+        OrderItem.objects.create(order=basket, product_info=offer, quantity=1)
+        old = Order.objects.create(user=buyer, contact=contact, state='delivered')
+        Order.objects.filter(id=old.id).update(dt=timezone.now() - timedelta(days=60))
+        OrderItem.objects.create(order=old, product_info=offer, quantity=1)
+        self.date_from = (timezone.now() - timedelta(days=1)).date().isoformat()
+
+    def export(self, **params):
+        response = self.client.get('/api/v1/partner/orders/export', {'date_from': self.date_from, **params})
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export(self):
+        rows = list(csv.DictReader(io.StringIO(self.export())))
+        self.assertEqual([int(row['item_id']) for row in rows], self.item_ids)
+        self.assertEqual(rows[2]['quantity'], '3')
+        self.assertEqual(int(rows[2]['sum']), 3 * int(rows[2]['price']))
+        self.assertEqual(rows[0]['city'], 'Moscow')
+
+    def test_ndjson_resume(self):
+        lines = self.export(format='ndjson', after=self.item_ids[1]).splitlines()
+        self.assertEqual([json.loads(line)['item_id'] for line in lines], self.item_ids[2:])
+
+    def test_validation(self):
+        self.assertEqual(self.client.get('/api/v1/partner/orders/export').status_code, 400)
+        response = self.client.get('/api/v1/partner/orders/export', {'date_from': self.date_from, 'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_file_export_resumes_after_crash(self):
+        date_from, date_to = timezone.now() - timedelta(days=1), timezone.now() + timedelta(days=1)
+        full = ''.join(render(export_rows(self.shop.id, date_from, date_to), 'csv'))
+        with tempfile.TemporaryDirectory() as export_dir, self.settings(EXPORT_DIR=export_dir):
+            path = os.path.join(export_dir, f'orders-{self.shop.id}-{date_from:%Y%m%d%H%M}-{date_to:%Y%m%d%H%M}.csv')
+            lines = full.splitlines(keepends=True)
+            with open(path + '.part', 'w', encoding='utf-8') as stream:
+                stream.write(''.join(lines[:3]) + lines[3][:5])  # заголовок, две строки и обрыв третьей
+            self.assertEqual(export_to_file(self.shop.id, date_from, date_to, 'csv'), (path, 3))
+            with open(path, encoding='utf-8') as stream:
+                self.assertEqual(stream.read(), full)
@@ -0,0 +1,112 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from backend.importer import poll_shop
+from backend.models import User, Shop, ProductInfo, OutboxEvent
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data')
+SHOP1 = os.path.join(DATA_DIR, 'shop1.yaml')
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    """
+    Прайс поставщика, отдаваемый с ETag; content и etag задаются тестом
+    """
+    content = b''
+    etag = '"1"'
+    location = None
+    requests = []
+
+    def do_GET(self):
+        FeedHandler.requests.append(dict(self.headers))
+        if self.location:
+            self.send_response(302)
+            self.send_header('Location', self.location)
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(self.content)))
+        self.end_headers()
+        self.wfile.write(self.content)
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(FEED_ALLOW_PRIVATE_HOSTS=True)  # сервер поставщика на 127.0.0.1
+class FeedPollingTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FeedHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}/shop1.yaml'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        with open(SHOP1, 'rb') as stream:
+            FeedHandler.content = stream.read()
+        FeedHandler.etag = '"1"'
+        FeedHandler.location = None
+        FeedHandler.requests = []
+        self.supplier = User.objects.create_user(email='shop1@shop.ru', password='a1d2m3i4n5', type='shop')
+        self.shop = Shop.objects.create(name='Связной', user=self.supplier, url=self.url)
+
+    def poll(self):
+        return poll_shop(Shop.objects.get(id=self.shop.id))
+
+    def test_conditional_fetch(self):
+        self.assertTrue(self.poll())
+        shop = Shop.objects.get(id=self.shop.id)
+        self.assertEqual(shop.feed_etag, '"1"')
+        self.assertEqual(len(shop.feed_hash), 64)
+        self.assertGreater(shop.next_poll_at, timezone.now())
+        self.assertEqual(ProductInfo.objects.filter(shop=shop).count(), 4)
+
+        self.assertFalse(self.poll())  # 304, прайс не загружается
+        self.assertEqual(FeedHandler.requests[-1].get('If-None-Match'), '"1"')
+        self.assertEqual(OutboxEvent.objects.filter(topic='catalog.updated').count(), 1)
+
+    def test_same_content_not_imported(self):
+        self.poll()
+        FeedHandler.etag = '"2"'  # новый ETag без изменения содержимого
+        self.assertFalse(self.poll())
+        self.assertEqual(Shop.objects.get(id=self.shop.id).feed_etag, '"2"')
+        self.assertEqual(OutboxEvent.objects.filter(topic='catalog.updated').count(), 1)
+
+    def test_changed_content_imported(self):
+        self.poll()
+        FeedHandler.etag = '"3"'
+        FeedHandler.content = FeedHandler.content.replace(b'price: 110000', b'price: 100000')
+        self.assertTrue(self.poll())
+        self.assertTrue(ProductInfo.objects.filter(shop=self.shop, price=100000).exists())
+        self.assertEqual(OutboxEvent.objects.filter(topic='catalog.updated').count(), 2)
+
+    def test_unsafe_sources_rejected(self):
+        with self.settings(FEED_ALLOW_PRIVATE_HOSTS=False), self.assertRaisesMessage(ValueError, 'non-public'):
+            self.poll()
+        self.assertEqual(FeedHandler.requests, [])
+
+        FeedHandler.location = 'http://169.254.169.254/latest/meta-data/'
+        with self.assertRaisesMessage(ValueError, 'redirects'):
+            self.poll()
+
+        Shop.objects.filter(id=self.shop.id).update(url=None, filename=os.path.join(DATA_DIR, '..', 'manage.py'))
+        with self.assertRaisesMessage(ValueError, 'Feed file must be inside'):
+            self.poll()
+        self.assertFalse(ProductInfo.objects.exists())
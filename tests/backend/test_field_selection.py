@@ -0,0 +1,73 @@
+import os
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from backend.importer import load_feed, import_shop
+from backend.models import User, Contact, Order, OrderItem, ProductInfo
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data')
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FieldSelectionTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        supplier = User.objects.create_user(email='shop1@shop.ru', password='a1d2m3i4n5', type='shop')
+        import_shop(supplier.id, load_feed(filename=os.path.join(DATA_DIR, 'shop1.yaml')))
+        self.user = User.objects.create_user(email='buyer@buyer.ru', password='a1d2m3i4n5')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.contact = Contact.objects.create(user=self.user, city='Moscow', street='Lenina', phone='7071016933')
+        offers = list(ProductInfo.objects.order_by('id')[:2])
+        for _ in range(3):
+            order = Order.objects.create(user=self.user, contact=self.contact, state='new')
+            OrderItem.objects.bulk_create([OrderItem(order=order, product_info=offer, quantity=2) for offer in offers])
+        self.total = 2 * sum(offer.price for offer in offers)
+
+    def get(self, path, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json(), [query['sql'] for query in queries]
+
+    def test_default_output_unchanged(self):
+        orders, _ = self.get('/api/v1/order/')
+        self.assertEqual(orders[0]['contact']['city'], 'Moscow')
+        self.assertEqual(orders[0]['ordered_items'][0]['product_info']['product']['category'], 'Смартфоны')
+        self.assertEqual(orders[0]['total_sum'], self.total)
+
+    def test_sparse_fields_skip_joins(self):
+        orders, sparse_queries = self.get('/api/v1/order/', fields='id,state')
+        self.assertEqual(orders[0], {'id': orders[0]['id'], 'state': 'new'})
+        _, full_queries = self.get('/api/v1/order/')
+        self.assertLess(len(sparse_queries), len(full_queries))
+        self.assertFalse(any('backend_orderitem' in sql or 'backend_contact' in sql for sql in sparse_queries))
+
+        orders, _ = self.get('/api/v1/order/', fields='id,total_sum')
+        self.assertEqual(orders[0]['total_sum'], self.total)
+
+    def test_expand(self):
+        orders, _ = self.get('/api/v1/order/', expand='contact')
+        self.assertEqual(orders[0]['contact']['city'], 'Moscow')
+        self.assertTrue(all(isinstance(item, int) for item in orders[0]['ordered_items']))
+
+        orders, queries = self.get('/api/v1/order/', fields='id,ordered_items.quantity,ordered_items.product_info.price')
+        self.assertEqual(set(orders[0]['ordered_items'][0]), {'quantity', 'product_info'})
+        self.assertEqual(set(orders[0]['ordered_items'][0]['product_info']), {'price'})
+        self.assertFalse(any('backend_product"' in sql or 'backend_category' in sql for sql in queries))
+
+    def test_user_and_products(self):
+        user, _ = self.get('/api/v1/user/details/', fields='email,contacts')
+        self.assertEqual(user, {'email': 'buyer@buyer.ru', 'contacts': [self.contact.id]})
+
+        products, queries = self.get('/api/v1/products', fields='id,price', memory='256')
+        self.assertEqual(set(products[0]), {'id', 'price'})
+        self.assertFalse(any('backend_category' in sql for sql in queries))
+        products, _ = self.get('/api/v1/products', fields='id,product.name')
+        self.assertEqual(set(products[0]['product']), {'name'})
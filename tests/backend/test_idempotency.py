@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.response import Response
+from rest_framework.test import APITestCase, APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+
+from backend.idempotency import _cache_key, idempotent
+from backend.models import User, Shop, Category, Product, ProductInfo, OrderItem, Contact
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class ContactCountView(APIView):
+    """
+    Представление с побочным эффектом, возвращающее не отрендеренный Response DRF
+    """
+
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        contact = Contact.objects.create(user=request.user, city='Moscow', street='Lenina', phone='+7000')
+        return Response({'id': contact.id}, status=201)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class IdempotencyTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='buyer@buyer.ru', password='a1d2m3i4n5')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        Shop.objects.create(id=1, name='shop', state=True)
+        Category.objects.create(id=1, name='category')
+        Product.objects.create(id=1, name='product', category_id=1)
+        ProductInfo.objects.create(id=1, model='model', product_id=1, shop_id=1, quantity=5, price=1, price_rrc=1)
+
+    def post_basket(self, key, items='[{"quantity": 1, "product_info": 1}]'):
+        return self.client.post('/api/v1/basket/', data={'items': items}, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_first_response(self):
+        first = self.post_basket('key-1')
+        second = self.post_basket('key-1')
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(OrderItem.objects.count(), 1)
+
+    def test_key_reused_with_other_body(self):
+        self.post_basket('key-2')
+        response = self.post_basket('key-2', items='[{"quantity": 2, "product_info": 1}]')
+        self.assertEqual(response.status_code, 422)
+
+    def test_failure_not_replayed(self):
+        with mock.patch('backend.views.OrderItemSerializer.save', side_effect=IntegrityError('database is locked')):
+            self.assertFalse(self.post_basket('key-5').json()['Status'])
+        response = self.post_basket('key-5')  # сбой не сохранен, повтор выполняет запрос
+        self.assertEqual(response.json(), {'Status': True, 'Создано объектов': 1})
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(OrderItem.objects.count(), 1)
+
+    def test_concurrent_duplicate_is_locked_out(self):
+        request = SimpleNamespace(user=self.user, method='POST', path='/api/v1/basket/')
+        cache.add(_cache_key(request, 'key-3') + ':lock', 1)
+        response = self.post_basket('key-3')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(OrderItem.objects.count(), 0)
+
+    def test_drf_response_replayed(self):
+        view, factory = ContactCountView.as_view(), APIRequestFactory()
+        responses = []
+        for _ in range(2):
+            request = factory.post('/contact-count/', {}, format='json', HTTP_IDEMPOTENCY_KEY='key-4')
+            force_authenticate(request, user=self.user)
+            response = view(request)
+            responses.append(response.render() if hasattr(response, 'render') else response)
+        self.assertEqual(responses[1].status_code, 201)
+        self.assertEqual(responses[1]['Idempotent-Replayed'], 'true')
+        self.assertEqual(responses[0].content, responses[1].content)
+        self.assertEqual(Contact.objects.filter(user=self.user).count(), 1)
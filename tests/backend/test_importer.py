@@ -0,0 +1,113 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from backend.importer import load_feed, import_shop
+from backend.models import User, Shop, Category, CategoryShop, ProductInfo, Parameter, ProductParameter, OutboxEvent, \
+    Order, OrderItem
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data')
+SHOP1 = os.path.join(DATA_DIR, 'shop1.yaml')
+SHOP2 = os.path.join(DATA_DIR, 'shop2.yaml')
+
+
+class ImporterTestCase(TestCase):
+
+    def setUp(self):
+        self.supplier1 = User.objects.create_user(email='shop1@shop.ru', password='a1d2m3i4n5', type='shop')
+        self.supplier2 = User.objects.create_user(email='shop2@shop.ru', password='a1d2m3i4n5', type='shop')
+
+    def test_shared_rows_created_once(self):
+        import_shop(self.supplier1.id, load_feed(filename=SHOP1), filename=SHOP1)
+        import_shop(self.supplier2.id, load_feed(filename=SHOP2), filename=SHOP2)
+        import_shop(self.supplier1.id, load_feed(filename=SHOP1), filename=SHOP1)
+        self.assertEqual(Shop.objects.count(), 2)
+        self.assertEqual(Category.objects.filter(id=224).count(), 1)
+        self.assertEqual(CategoryShop.objects.filter(category_id=224).count(), 2)
+        self.assertEqual(ProductInfo.objects.count(), 8)
+        self.assertEqual(Parameter.objects.filter(name='Цвет').count(), 1)
+        self.assertEqual(ProductParameter.objects.filter(product_info__product_id=4216292).get(
+            parameter__name='Диагональ (дюйм)').value, '6.5')
+        self.assertEqual(OutboxEvent.objects.filter(topic='catalog.updated').count(), 3)
+
+    def test_reimport_keeps_ordered_offers(self):
+        data = load_feed(filename=SHOP1)
+        shop = import_shop(self.supplier1.id, data)
+        ordered = ProductInfo.objects.get(shop=shop, product_id=4216292)
+        order = Order.objects.create(user=self.supplier2, state='new')
+        OrderItem.objects.create(order=order, product_info=ordered, quantity=1)
+
+        data['goods'] = [item for item in data['goods'] if item['id'] not in (4216292, 4216313)]
+        data['goods'][0]['price'] += 1
+        import_shop(self.supplier1.id, data)
+        self.assertEqual(order.ordered_items.get().product_info_id, ordered.id)
+        self.assertEqual(ProductInfo.objects.get(id=ordered.id).quantity, 0)
+        self.assertFalse(ProductInfo.objects.filter(shop=shop, product_id=4216313).exists())
+        self.assertEqual(ProductInfo.objects.filter(shop=shop).count(), 3)
+        self.assertEqual(ProductParameter.objects.filter(product_info=ordered).count(), 4)
+        self.assertTrue(ProductInfo.objects.filter(shop=shop, price=data['goods'][0]['price']).exists())
+
+    def test_import_feeds_command(self):
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as manifest_dir:  # рабочее дерево не изменяется
+            manifest = os.path.join(manifest_dir, 'feeds.json')
+            with open(manifest, 'w', encoding='utf-8') as stream:
+                stream.write(f'[{{"user": "shop1@shop.ru", "file": "{SHOP1}"}}, '
+                             f'{{"user": {self.supplier2.id}, "file": "{SHOP2}"}}]')
+            call_command('import_feeds', manifest, workers=0, stdout=out)
+        self.assertEqual(set(Shop.objects.values_list('name', flat=True)), {'Связной', 'DNS'})
+        self.assertIn('товаров 4', out.getvalue())
+
+
+class PartnerUpdateTestCase(APITestCase):
+
+    def test_partner_update_from_file(self):
+        user = User.objects.create_user(email='shop1@shop.ru', password='a1d2m3i4n5', type='shop')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+        response = self.client.post('/api/v1/partner/update', data={'file': SHOP1})
+        self.assertEqual(response.json(), {'Status': True})
+        self.assertEqual(Shop.objects.get(user=user).filename, SHOP1)
+        self.assertEqual(ProductInfo.objects.filter(shop__user=user).count(), 4)
+
+
+class PartnerStockTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='shop1@shop.ru', password='a1d2m3i4n5', type='shop')
+        self.shop = import_shop(self.user.id, load_feed(filename=SHOP1), filename=SHOP1)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+
+    def test_json_deltas(self):
+        response = self.client.post('/api/v1/partner/stock', data=[
+            {'product': 4216292, 'quantity': 3},
+            {'product': 4672670, 'shop': self.shop.id, 'price': 100, 'price_rrc': 120},
+            {'product': 1, 'quantity': 1},
+        ], format='json')
+        self.assertEqual(response.json(), {'Status': True, 'Updated': 2, 'Missing': [1]})
+        product_info = ProductInfo.objects.get(shop=self.shop, product_id=4216292)
+        self.assertEqual((product_info.quantity, product_info.price), (3, 110000))
+        product_info = ProductInfo.objects.get(shop=self.shop, product_id=4672670)
+        self.assertEqual((product_info.price, product_info.price_rrc), (100, 120))
+        self.assertEqual(OutboxEvent.objects.filter(topic='catalog.updated').count(), 2)
+
+    def test_ndjson_deltas(self):
+        body = '{"product": 4216292, "quantity": 7}\n{"product": 4672670, "quantity": 0}\n'
+        response = self.client.generic('POST', '/api/v1/partner/stock', body, content_type='application/x-ndjson')
+        self.assertEqual(response.json()['Updated'], 2)
+        self.assertEqual(ProductInfo.objects.get(shop=self.shop, product_id=4672670).quantity, 0)
+
+    def test_invalid_deltas(self):
+        response = self.client.post('/api/v1/partner/stock', data=[
+            {'product': 4216292, 'quantity': -1},
+            {'product': 4672670, 'shop': self.shop.id + 1, 'price': 1},
+            {'product': 4672670},
+            {'product': True, 'quantity': 1},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.json()['Errors']], [0, 1, 2, 3])
+        self.assertEqual(ProductInfo.objects.get(shop=self.shop, product_id=4216292).quantity, 14)
@@ -0,0 +1,64 @@
+import csv
+import io
+import os
+
+from django.core import mail
+from django.test import TestCase, override_settings
+
+from backend import invoices
+from backend.importer import load_feed, import_shop
+from backend.models import User, Contact, Order, OrderItem, ProductInfo
+from backend.tasks import send_invoice_digest
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data')
+
+
+@override_settings(INVOICE_ADMIN_EMAILS=['admin@shop.ru'])
+class InvoiceTestCase(TestCase):
+
+    def setUp(self):
+        supplier = User.objects.create_user(email='shop1@shop.ru', password='a1d2m3i4n5', type='shop')
+        import_shop(supplier.id, load_feed(filename=os.path.join(DATA_DIR, 'shop1.yaml')))
+        self.user = User.objects.create_user(email='buyer@buyer.ru', password='a1d2m3i4n5')
+        contact = Contact.objects.create(user=self.user, city='Moscow', street='Lenina', phone='7071016933')
+        offers = list(ProductInfo.objects.order_by('id')[:2])
+        self.orders = []
+        for _ in range(30):
+            order = Order.objects.create(user=self.user, contact=contact, state='new')
+            OrderItem.objects.bulk_create([OrderItem(order=order, product_info=offer, quantity=2) for offer in offers])
+            self.orders.append(order)
+        Order.objects.create(user=self.user, state='basket')
+        self.total = 2 * sum(offer.price for offer in offers)
+
+    def test_bounded_queries(self):
+        order_ids = [order.id for order in self.orders]
+        with self.assertNumQueries(2):
+            orders = list(invoices.load_orders(order_ids))
+        with self.assertNumQueries(0):
+            messages = invoices.customer_messages(orders)
+        self.assertEqual(len(messages), 30)
+        with self.assertNumQueries(6):  # по два запроса на пачку
+            self.assertEqual(len(list(invoices.load_orders(order_ids, batch_size=10))), 30)
+
+    def test_customer_invoice(self):
+        order = next(invoices.load_orders([self.orders[0].id]))
+        self.assertEqual(order.total_sum, self.total)
+        message = invoices.customer_messages([order])[0]
+        self.assertIn(f'Your order # {order.id}', message.body)
+        self.assertIn(f'Total sum: {self.total}', message.body)
+        self.assertEqual(message.alternatives[0][1], 'text/html')
+        filename, content, mimetype = message.attachments[0]
+        self.assertEqual((filename, mimetype), (f'invoice-{order.id}.csv', 'text/csv'))
+        rows = list(csv.reader(io.StringIO(content.lstrip('\ufeff'))))
+        self.assertEqual(rows[0], list(invoices.CSV_HEADER))
+        self.assertEqual(len(rows), 3)
+
+    def test_admin_digest(self):
+        self.assertEqual(send_invoice_digest(), 30)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['admin@shop.ru'])
+        rows = list(csv.reader(io.StringIO(mail.outbox[0].attachments[0][1].lstrip('\ufeff'))))
+        self.assertEqual(len(rows), 1 + 30 * 2)
+        self.assertEqual(send_invoice_digest(), 0)  # заказы уже были в сводке
+        self.assertFalse(Order.objects.filter(invoiced_at__isnull=True).exclude(state='basket').exists())
+        self.assertEqual(len(mail.outbox), 1)
@@ -0,0 +1,97 @@
+import os
+from datetime import time, timedelta
+
+from django.core import mail
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from backend.importer import load_feed, import_shop
+from backend.models import User, Contact, Order, OrderItem, OrderTemplate, OrderTemplateItem, ProductInfo, \
+    OutboxEvent
+from backend.order_templates import next_run_at
+from backend.tasks import run_order_templates
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data')
+SHOP1 = os.path.join(DATA_DIR, 'shop1.yaml')
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OrderTemplateTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        supplier = User.objects.create_user(email='shop1@shop.ru', password='a1d2m3i4n5', type='shop')
+        self.shop = import_shop(supplier.id, load_feed(filename=SHOP1))
+        self.user = User.objects.create_user(email='buyer@buyer.ru', password='a1d2m3i4n5')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.contact = Contact.objects.create(user=self.user, city='Moscow', street='Lenina', phone='7071016933')
+        self.order = Order.objects.create(user=self.user, contact=self.contact, state='delivered')
+        self.offers = {product_info.product_id: product_info for product_info in ProductInfo.objects.all()}
+        OrderItem.objects.create(order=self.order, product_info=self.offers[4216292], quantity=2)
+        OrderItem.objects.create(order=self.order, product_info=self.offers[4216313], quantity=1)
+
+    def basket_items(self):
+        return dict(OrderItem.objects.filter(order__user=self.user, order__state='basket').values_list(
+            'product_info__product_id', 'quantity'))
+
+    def test_reorder(self):
+        response = self.client.post('/api/v1/order/reorder/', {'id': self.order.id}, format='json')
+        self.assertEqual(response.json()['Status'], True)
+        self.assertEqual(self.basket_items(), {4216292: 2, 4216313: 1})
+        self.client.post('/api/v1/order/reorder/', {'id': self.order.id}, format='json')
+        self.assertEqual(self.basket_items(), {4216292: 4, 4216313: 2})
+        other = User.objects.create_user(email='other@buyer.ru', password='a1d2m3i4n5')
+        foreign = Order.objects.create(user=other, state='new')
+        response = self.client.post('/api/v1/order/reorder/', {'id': foreign.id}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_template_from_order(self):
+        response = self.client.post('/api/v1/order/templates/', {'name': 'daily', 'contact': self.contact.id,
+                                                                 'order': self.order.id, 'run_time': '09:00'},
+                                    format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        template = OrderTemplate.objects.get()
+        self.assertEqual(set(template.items.values_list('product_id', 'quantity')), {(4216292, 2), (4216313, 1)})
+        self.assertGreater(template.next_run_at, timezone.now())
+        self.assertEqual(len(self.client.get('/api/v1/order/templates/').json()['results'][0]['items']), 2)
+
+        import_shop(self.shop.user_id, load_feed(filename=SHOP1))  # повторный импорт прайса
+        response = self.client.post(f'/api/v1/order/templates/{template.id}/basket/')
+        self.assertEqual(response.json()['Добавлено позиций'], 2)
+        self.assertEqual(self.basket_items(), {4216292: 2, 4216313: 1})
+
+    def test_duplicate_items_merged(self):
+        items = [{'product': 4216292, 'shop': self.shop.id, 'quantity': quantity} for quantity in (1, 2)]
+        response = self.client.post('/api/v1/order/templates/', {'name': 'weekly', 'items': items}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(list(OrderTemplate.objects.get().items.values_list('product_id', 'quantity')),
+                         [(4216292, 3)])
+
+    def test_scheduled_run_with_shortage(self):
+        past = timezone.now() - timedelta(minutes=1)
+        template = OrderTemplate.objects.create(user=self.user, name='daily', contact=self.contact,
+                                                run_time=time(9, 0), next_run_at=past)
+        OrderTemplateItem.objects.create(template=template, product_id=4216292, shop=self.shop, quantity=3)
+        OrderTemplateItem.objects.create(template=template, product_id=4216313, shop=self.shop, quantity=100)
+        no_contact = OrderTemplate.objects.create(user=self.user, name='no contact', next_run_at=past)
+        OrderTemplateItem.objects.create(template=no_contact, product_id=4216292, shop=self.shop, quantity=1)
+
+        self.assertEqual(run_order_templates(), {'templates': 2, 'orders': 1, 'shortages': 1})
+        template.refresh_from_db()
+        order = Order.objects.get(id=template.last_result['order_id'])
+        self.assertEqual(order.state, 'new')
+        self.assertEqual(dict(order.ordered_items.values_list('product_info__product_id', 'quantity')),
+                         {4216292: 3, 4216313: 9})
+        self.assertEqual(template.last_result['shortages'], [{'product': 4216313, 'shop': self.shop.id,
+                                                              'requested': 100, 'available': 9}])
+        self.assertEqual(ProductInfo.objects.get(product_id=4216292).quantity, 11)
+        self.assertEqual(ProductInfo.objects.get(product_id=4216313).quantity, 0)
+        self.assertEqual(template.next_run_at, next_run_at(time(9, 0), after=template.last_run_at))
+        self.assertEqual(OrderTemplate.objects.get(id=no_contact.id).last_result['error'], 'Contact is not specified')
+        self.assertTrue(OutboxEvent.objects.filter(topic='order.new', payload__order_id=order.id).exists())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(run_order_templates()['templates'], 0)
@@ -0,0 +1,88 @@
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from backend import outbox
+from backend.models import User, Shop, Category, Product, ProductInfo, Order, OrderItem, Contact, OutboxEvent
+from backend.tasks import relay_outbox
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def consumer(name, **kwargs):
+    return mock.Mock(__module__='tests', __qualname__=name, **kwargs)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OutboxTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='buyer@buyer.ru', password='a1d2m3i4n5')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        Shop.objects.create(id=1, name='shop', state=True)
+        Category.objects.create(id=1, name='category')
+        Product.objects.create(id=1, name='product', category_id=1)
+        ProductInfo.objects.create(id=1, model='model', product_id=1, shop_id=1, quantity=5, price=10, price_rrc=1)
+        self.contact = Contact.objects.create(user=self.user, city='Moscow', street='Lenina', phone='7071016933')
+        self.order = Order.objects.create(user=self.user, state='basket')
+        OrderItem.objects.create(order=self.order, product_info_id=1, quantity=2)
+
+    def checkout(self):
+        return self.client.post('/api/v1/order/', data={'id': str(self.order.id), 'contact': str(self.contact.id)},
+                                format='multipart')
+
+    def test_checkout_writes_event_and_relay_sends_email(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertTrue(self.checkout().json()['Status'])
+        self.assertEqual(len(callbacks), 3)  # запуск relay_outbox и сброс версий заказов и каталога
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.topic, 'order.new')
+        self.assertEqual(event.payload['shop_ids'], [1])
+
+        self.assertEqual(relay_outbox(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(f'Your order # {self.order.id}', mail.outbox[0].body)
+        self.assertIsNotNone(OutboxEvent.objects.get().processed_at)
+
+    def test_failed_stock_check_rolls_back(self):
+        Product.objects.create(id=2, name='product 2', category_id=1)
+        OrderItem.objects.create(order=self.order, product_info=ProductInfo.objects.create(
+            model='model', product_id=2, shop_id=1, quantity=0, price=10, price_rrc=1), quantity=1)
+        self.assertFalse(self.checkout().json()['Status'])
+        self.assertEqual(ProductInfo.objects.get(id=1).quantity, 5)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_failing_consumer_keeps_event_pending(self):
+        outbox.publish('catalog.updated', shop_ids=[1])
+        with mock.patch.dict(outbox._consumers, {'catalog.updated': [consumer('failing', side_effect=RuntimeError)]}):
+            self.assertEqual(relay_outbox(), 0)
+        event = OutboxEvent.objects.get()
+        self.assertIsNone(event.processed_at)
+        self.assertEqual(event.attempts, 1)
+        self.assertGreater(event.next_attempt_at, timezone.now())
+        self.assertEqual(relay_outbox(), 0)  # повтор отложен
+        OutboxEvent.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(relay_outbox(), 1)
+
+    def test_failed_consumer_retried_alone(self):
+        outbox.publish('catalog.updated', shop_ids=[1])
+        succeeded, failing = consumer('succeeded'), consumer('failing', side_effect=RuntimeError)
+        with mock.patch.dict(outbox._consumers, {'catalog.updated': [succeeded, failing]}), \
+                self.settings(OUTBOX_MAX_ATTEMPTS=2):
+            self.assertEqual(relay_outbox(), 0)
+            OutboxEvent.objects.update(next_attempt_at=timezone.now())
+            with self.assertLogs('backend.outbox', 'ERROR') as logs:
+                self.assertEqual(relay_outbox(), 0)
+            self.assertIn('dropped after 2 attempts', logs.output[-1])
+            OutboxEvent.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(relay_outbox(), 0)  # попытки исчерпаны
+        self.assertEqual(succeeded.call_count, 1)
+        self.assertEqual(failing.call_count, 2)
+        self.assertEqual(OutboxEvent.objects.get().done_consumers, ['tests.succeeded'])
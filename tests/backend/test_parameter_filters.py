@@ -0,0 +1,84 @@
+import os
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from backend.importer import load_feed, import_shop
+from backend.models import User, Parameter, ProductInfo, ProductParameter
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data')
+SHOP1 = os.path.join(DATA_DIR, 'shop1.yaml')
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ParameterFilterTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        supplier = User.objects.create_user(email='shop1@shop.ru', password='a1d2m3i4n5', type='shop')
+        import_shop(supplier.id, load_feed(filename=SHOP1), filename=SHOP1)
+
+    def products(self, query):
+        response = self.client.get(f'/api/v1/products/?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return sorted(item['product']['name'] for item in response.json())
+
+    def test_typed_values_imported(self):
+        self.assertEqual(Parameter.objects.get(name='Встроенная память (Гб)').code, 'memory')
+        diagonal = ProductParameter.objects.filter(parameter__code='diagonal').first()
+        self.assertIsNotNone(diagonal.value_number)
+        self.assertFalse(ProductParameter.objects.filter(parameter__code='resolution',
+                                                         value_number__isnull=False).exists())
+
+    def test_range_filters(self):
+        self.assertEqual(self.products('memory>=512'), ['Смартфон Apple iPhone XS Max 512GB (золотистый)'])
+        self.assertEqual(len(self.products('memory>=256&diagonal<=6.1')), 3)
+        self.assertEqual(len(self.products('memory<512&diagonal>6')), 3)
+        self.assertEqual(self.products('memory>256'), self.products('memory>=512'))
+        self.assertEqual(self.products('memory>=128&memory<128'), [])
+
+    def test_exact_filters(self):
+        self.assertEqual(len(self.products('color=черный&memory=256')), 1)
+        self.assertEqual(self.products('diagonal=6,5'), self.products('memory>=512'))
+
+    def test_invalid_filters(self):
+        self.assertEqual(self.client.get('/api/v1/products/?unknown>=1').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/products/?memory>=many').status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ParameterDocumentTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        supplier = User.objects.create_user(email='shop1@shop.ru', password='a1d2m3i4n5', type='shop')
+        import_shop(supplier.id, load_feed(filename=SHOP1), filename=SHOP1)
+
+    def test_document_imported(self):
+        product_info = ProductInfo.objects.get(product_id=4216292)
+        self.assertEqual(product_info.parameters['Встроенная память (Гб)'], '512')
+        self.assertEqual(product_info.parameters['Цвет'], 'золотистый')
+
+    def test_catalog_reads_single_table(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/products/?shop_id=1')
+        parameters = {item['parameter']: item['value'] for item in response.json()[0]['product_parameters']}
+        self.assertEqual(len(parameters), 4)
+
+    def test_containment_filter(self):
+        response = self.client.get('/api/v1/products/', {'parameters': '{"Цвет": "черный", "Диагональ (дюйм)": 6.1}'})
+        self.assertEqual([item['product']['id'] for item in response.json()], [4216226])
+        response = self.client.get('/api/v1/products/', {'parameters': '["Цвет"]'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rebuild_command(self):
+        call_command('rebuild_parameters', '--check', stdout=StringIO())
+        ProductParameter.objects.filter(product_info__product_id=4216292, parameter__name='Цвет').update(value='белый')
+        with self.assertRaises(CommandError):
+            call_command('rebuild_parameters', '--check', stdout=StringIO())
+        call_command('rebuild_parameters', stdout=StringIO())
+        self.assertEqual(ProductInfo.objects.get(product_id=4216292).parameters['Цвет'], 'белый')
@@ -0,0 +1,78 @@
+import os
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from backend.importer import load_feed, import_shop, apply_stock_updates
+from backend.models import User, PriceHistory
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data')
+SHOP1 = os.path.join(DATA_DIR, 'shop1.yaml')
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PriceHistoryTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.supplier = User.objects.create_user(email='shop1@shop.ru', password='a1d2m3i4n5', type='shop')
+        self.data = load_feed(filename=SHOP1)
+        self.shop = import_shop(self.supplier.id, self.data, filename=SHOP1)
+
+    def test_only_changes_recorded(self):
+        self.assertEqual(PriceHistory.objects.count(), 4)
+        import_shop(self.supplier.id, self.data, filename=SHOP1)
+        self.assertEqual(PriceHistory.objects.count(), 4)
+        self.data['goods'][0]['price'] = 105000
+        import_shop(self.supplier.id, self.data, filename=SHOP1)
+        self.assertEqual(list(PriceHistory.objects.filter(product_id=4216292).values_list('price', flat=True)),
+                         [110000, 105000])
+        apply_stock_updates(self.shop.id, {4216292: {'quantity': 1}, 4216313: {'price': 60000}})
+        self.assertEqual(PriceHistory.objects.count(), 6)
+
+    def test_downsampled_history(self):
+        now = timezone.now()
+        PriceHistory.objects.filter(product_id=4216292).update(changed_at=now - timedelta(days=30))
+        for hours, price in ((50, 100000), (49, 90000), (48, 95000), (1, 99000)):
+            PriceHistory.objects.create(product_id=4216292, shop=self.shop, price=price, price_rrc=116990,
+                                        changed_at=now - timedelta(hours=hours))
+        date_from = (now - timedelta(days=10)).date().isoformat()
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v1/products/4216292/prices', {'date_from': date_from,
+                                                                           'interval': 'month'})
+        points = response.json()
+        self.assertEqual(points[0]['price_max'], 110000)  # цена на начало периода
+        self.assertEqual(points[-1]['price'], 99000)
+        self.assertEqual(min(point['price_min'] for point in points), 90000)
+
+        response = self.client.get('/api/v1/products/4216292/prices', {'interval': 'hour'})
+        self.assertEqual([point['price'] for point in response.json()], [110000, 100000, 90000, 95000, 99000])
+
+    def test_default_window_etag(self):
+        url = '/api/v1/products/4216292/prices'
+        PriceHistory.objects.filter(product_id=4216292).update(changed_at=timezone.now() - timedelta(days=400))
+        response = self.client.get(url)
+        window = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=365)
+        self.assertEqual(response.json()[0]['date'], window.isoformat())
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # на следующие сутки период по умолчанию сдвигается, и прежний ETag уже не подходит
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(days=1)):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        date_to = timezone.now().isoformat()
+        response = self.client.get(url, {'date_to': date_to})
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(days=1)):
+            self.assertEqual(self.client.get(url, {'date_to': date_to}, HTTP_IF_NONE_MATCH=response['ETag'])
+                             .status_code, 304)
+
+    def test_invalid_params(self):
+        self.assertEqual(self.client.get('/api/v1/products/4216292/prices?interval=year').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/products/4216292/prices?date_from=yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/products/4216292/prices?shop_id=abc').status_code, 400)
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import os
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from redis.exceptions import ConnectionError as RedisConnectionError, RedisError
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from backend import push
+from backend.importer import load_feed, import_shop
+from backend.models import User, ProductInfo
+from backend.stream import Hub, StreamApplication, Subscriber
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data')
+
+
+def call(application, path, query_string=b''):
+    """
+    Запрос к ASGI-приложению, возвращает статус и тело ответа
+    """
+    sent = []
+
+    async def receive():
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(application({'type': 'http', 'path': path, 'query_string': query_string, 'headers': []},
+                            receive, send))
+    return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+
+
+class FakePubSub:
+    def __init__(self, fail_subscribe=False, fail_read=False):
+        self.channels, self.fail_subscribe, self.fail_read = set(), fail_subscribe, fail_read
+
+    async def subscribe(self, *channels):
+        if self.fail_subscribe:
+            raise RedisConnectionError('connection refused')
+        self.channels.update(channels)
+
+    async def unsubscribe(self, *channels):
+        self.channels.difference_update(channels)
+
+    async def get_message(self, **kwargs):
+        if self.fail_read:
+            raise RuntimeError('pubsub connection not set')
+        await asyncio.sleep(0.01)
+
+    async def close(self):
+        pass
+
+
+class FakeHub(Hub):
+    def __init__(self, *pubsubs):
+        super().__init__('redis://localhost')
+        self.pubsubs = list(pubsubs)
+
+    def connect(self):
+        return self.pubsubs.pop(0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PushTestCase(TestCase):
+
+    def setUp(self):
+        supplier = User.objects.create_user(email='shop1@shop.ru', password='a1d2m3i4n5', type='shop')
+        self.shop = import_shop(supplier.id, load_feed(filename=os.path.join(DATA_DIR, 'shop1.yaml')))
+
+    def parse(self, message):
+        channel, data = message
+        event, payload = data.decode().rstrip('\n').split('\n')
+        return channel, event[len('event: '):], json.loads(payload[len('data: '):])
+
+    def test_order_messages(self):
+        messages = push.order_messages('order.new', [{'user_id': 7, 'order_id': 3, 'shop_ids': [1]}])
+        self.assertEqual(list(map(self.parse, messages)), [('orders:7', 'order', {'id': 3, 'state': 'new'})])
+        messages = push.order_messages('order.updated', [{'user_id': 7, 'order_id': 3, 'state': 'sent'}])
+        self.assertEqual(self.parse(messages[0])[2]['state'], 'sent')
+
+    def test_stock_messages_only_for_watched_products(self):
+        offer = ProductInfo.objects.get(shop=self.shop, product_id=4216292)
+        messages = push.stock_messages([{'shop_ids': [self.shop.id]}], watched={4216292, 1})
+        self.assertEqual(list(map(self.parse, messages)), [
+            ('products:4216292', 'stock', {'product': 4216292, 'quantity': offer.quantity, 'price': offer.price,
+                                           'offers': 1})])
+        self.assertEqual(push.stock_messages([{'shop_ids': [self.shop.id], 'product_ids': [4216313]}],
+                                             watched={4216292}), [])
+
+    def test_stream_validation(self):
+        async def django_application(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 204, 'headers': []})
+
+        application = StreamApplication(django_application)
+        self.assertEqual(call(application, '/api/v1/stream')[0], 400)
+        self.assertEqual(call(application, '/api/v1/stream', b'products=a')[0], 400)
+        self.assertEqual(call(application, '/api/v1/stream/', b'products=' + b','.join([b'1'] * 101))[0], 400)
+        status, body = call(application, '/api/v1/stream', b'ticket=missing')
+        self.assertEqual(status, 401)
+        self.assertEqual(json.loads(body)['Errors'], 'Invalid ticket')
+        self.assertEqual(call(application, '/api/v1/stream', b'token=key')[0], 400)  # токен только в заголовке
+        self.assertEqual(call(application, '/api/v1/order/')[0], 204)
+
+    def test_stream_ticket_is_single_use(self):
+        cache.clear()
+        user = User.objects.create_user(email='buyer@buyer.ru', password='a1d2m3i4n5')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+        ticket = client.post('/api/v1/stream/ticket').json()['ticket']
+        self.assertEqual(push.redeem_ticket(ticket), user.id)
+        self.assertIsNone(push.redeem_ticket(ticket))
+
+    def test_hub_failed_subscribe_not_registered(self):
+        async def scenario():
+            hub = FakeHub(FakePubSub(fail_subscribe=True))
+            with self.assertRaises(RedisError):
+                await hub.subscribe(['products:1'], Subscriber())
+            self.assertFalse(any(hub.listeners.values()))
+            hub.pubsub.fail_subscribe = False
+            await hub.subscribe(['products:1'], Subscriber())  # канал подписывается заново
+            self.assertEqual(hub.pubsub.channels, {'products:1'})
+            await hub.close()
+
+        asyncio.run(scenario())
+
+    def test_hub_reconnects_after_read_error(self):
+        async def scenario():
+            fresh = FakePubSub()
+            hub = FakeHub(FakePubSub(fail_read=True), fresh)
+            await hub.subscribe(['orders:1'], Subscriber())
+            for _ in range(300):
+                if hub.pubsub is fresh:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(fresh.channels, {'orders:1'})
+            self.assertFalse(hub.reader.done())
+            await hub.close()
+
+        asyncio.run(scenario())
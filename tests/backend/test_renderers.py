@@ -0,0 +1,47 @@
+import gzip
+import json
+
+import msgpack
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from backend.models import Shop, Category, Product, ProductInfo
+from backend.renderers import FastJSONRenderer
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, RESPONSE_COMPRESSION_MIN_SIZE=200)
+class RendererTestCase(APITestCase):
+
+    def setUp(self):
+        Shop.objects.create(id=1, name='shop', state=True)
+        Category.objects.create(id=1, name='Смартфоны')
+        for i in range(1, 6):
+            Product.objects.create(id=i, name=f'Смартфон {i}', category_id=1)
+            ProductInfo.objects.create(id=i, model='apple/iphone/xr', product_id=i, shop_id=1, quantity=i,
+                                       price=65000, price_rrc=69990)
+
+    def test_fast_json_matches_stdlib(self):
+        data = {'name': 'Смартфон', 'items': [1, 2.5, None, True], 'line': 'a b'}
+        rendered = FastJSONRenderer().render(data)
+        self.assertEqual(json.loads(rendered), data)
+        self.assertIn(b'\\u2028', rendered)
+
+    def test_msgpack_negotiation(self):
+        response = self.client.get('/api/v1/products/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        data = msgpack.unpackb(response.content)
+        self.assertEqual(len(data), 5)
+        self.assertEqual(data[0]['price'], 65000)
+
+    def test_gzip_above_threshold(self):
+        response = self.client.get('/api/v1/products/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].startswith('W/'))
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))), 5)
+
+    def test_small_response_not_compressed(self):
+        response = self.client.get('/api/v1/shops/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
@@ -0,0 +1,38 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, RequestFactory
+
+from shopping_service.schema import PrebuiltSchemaView, load_schema, schema_url
+
+
+class PrebuiltSchemaTestCase(SimpleTestCase):
+
+    def get(self, digest=None, **headers):
+        return PrebuiltSchemaView.as_view()(RequestFactory().get('/api/schema/', **headers), digest=digest)
+
+    def test_schema_served_with_etag(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, load_schema()[0])
+        self.assertIn('no-cache', response['Cache-Control'])
+        response = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_hashed_url_is_immutable(self):
+        response = self.get(digest=load_schema()[1])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.get(digest='0123456789abcdef')
+        self.assertRedirects(response, schema_url(), fetch_redirect_response=False)
+
+    def test_schema_is_up_to_date(self):
+        out = StringIO()
+        call_command('spectacular', stdout=out, stderr=StringIO())
+        self.assertEqual(out.getvalue().encode(), load_schema()[0],
+                         'schema.yml is stale, run: python manage.py spectacular --file schema.yml')
+
+    def test_live_schema_in_development(self):
+        response = self.client.get('/api/schema/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
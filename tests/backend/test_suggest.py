@@ -0,0 +1,72 @@
+import copy
+import os
+
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from backend import catalog, outbox, suggest
+from backend.importer import load_feed, import_shop, apply_stock_updates
+from backend.models import User
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data')
+SHOP1 = os.path.join(DATA_DIR, 'shop1.yaml')
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SUGGEST_REBUILD_INTERVAL=0, CATALOG_SNAPSHOT_RELOAD_INTERVAL=0)
+class SuggestTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        suggest.reset_index()
+        catalog.reset_snapshot()
+        supplier = User.objects.create_user(email='shop1@shop.ru', password='a1d2m3i4n5', type='shop')
+        data = load_feed(filename=SHOP1)
+        data['goods'].append(dict(copy.deepcopy(data['goods'][0]), id=1, category=1, model='kingston/datatraveler',
+                                  name='Флешка Kingston DataTraveler 64GB', quantity=0))
+        self.shop = import_shop(supplier.id, data)
+        outbox.relay()
+
+    def tearDown(self):
+        suggest.reset_index()
+        catalog.reset_snapshot()
+
+    def names(self, **params):
+        response = self.client.get('/api/v1/products/suggest', params)
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.json()]
+
+    def test_prefixes(self):
+        self.assertEqual(self.names(q='iph XS'), ['Смартфон Apple iPhone XS Max 512GB (золотистый)'])
+        self.assertEqual(len(self.names(q='apple/iph')), 4)  # модель целиком
+        self.assertEqual(len(self.names(q='xs-m')), 1)  # сегмент модели
+        self.assertEqual(self.names(q='king'), ['Флешка Kingston DataTraveler 64GB'])
+        self.assertEqual(self.names(q='phone'), [])  # только начало слова
+        self.assertEqual(self.names(q=' '), [])
+
+    def test_filters_and_order(self):
+        self.assertEqual(len(self.names(q='256', limit=1)), 1)
+        self.assertEqual(self.names(q='dat', in_stock='true'), [])
+        self.assertEqual(self.names(q='64gb', category_id=224), [])
+        response = self.client.get('/api/v1/products/suggest', {'q': 'a'})
+        self.assertEqual([item['offers'] for item in response.json()], [1, 1, 1, 1])
+        self.assertEqual(self.client.get('/api/v1/products/suggest', {'q': 'a', 'limit': 'x'}).status_code, 400)
+
+    def test_rebuilt_after_catalog_change(self):
+        self.assertEqual(self.names(q='king')[0], 'Флешка Kingston DataTraveler 64GB')
+        apply_stock_updates(self.shop.id, {1: {'quantity': 3}})
+        outbox.relay()
+        self.assertEqual(self.names(q='king', in_stock='1'), ['Флешка Kingston DataTraveler 64GB'])
+        with self.settings(CATALOG_SNAPSHOT_ENABLED=True):  # построение по снимку каталога
+            suggest.reset_index()
+            self.assertEqual(self.names(q='king', in_stock='1'), ['Флешка Kingston DataTraveler 64GB'])
+
+    def test_cached_prefix_top(self):
+        with self.settings(SUGGEST_CACHED_TOP=2, SUGGEST_CACHED_PREFIX_ENTRIES=2):
+            suggest.reset_index()
+            self.assertIn('x', suggest.get_index().top)
+            self.assertEqual(len(self.names(q='x')), 4)  # лучших двух не хватило - полный диапазон
+            self.assertEqual(len(self.names(q='x', category_id=224)), 4)  # товары категории
+            self.assertEqual(self.names(q='d', category_id=1), ['Флешка Kingston DataTraveler 64GB'])
+            self.assertEqual(len(self.names(q='ф')), 1)
@@ -0,0 +1,140 @@
+import hashlib
+import hmac
+import json
+import os
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from backend import outbox
+from backend.importer import load_feed, import_shop
+from backend.models import User, Contact, Order, OrderItem, ProductInfo, ShopWebhook, WebhookDelivery
+from backend.webhooks import deliver
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data')
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """
+    Сервер поставщика: запоминает полученные запросы и отвечает статусами из statuses
+    """
+    statuses = []
+    requests = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        WebhookHandler.requests.append((dict(self.headers), body))
+        self.send_response(WebhookHandler.statuses.pop(0) if WebhookHandler.statuses else 200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(CACHES=LOCMEM_CACHES, WEBHOOK_ALLOW_PRIVATE_HOSTS=True)  # сервер поставщика на 127.0.0.1
+class WebhookTestCase(APITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), WebhookHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}/orders'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        WebhookHandler.statuses, WebhookHandler.requests = [], []
+        self.supplier = User.objects.create_user(email='shop1@shop.ru', password='a1d2m3i4n5', type='shop')
+        self.shop = import_shop(self.supplier.id, load_feed(filename=os.path.join(DATA_DIR, 'shop1.yaml')))
+        other = User.objects.create_user(email='shop2@shop.ru', password='a1d2m3i4n5', type='shop')
+        self.other_shop = import_shop(other.id, load_feed(filename=os.path.join(DATA_DIR, 'shop2.yaml')))
+        self.buyer = User.objects.create_user(email='buyer@buyer.ru', password='a1d2m3i4n5')
+        self.contact = Contact.objects.create(user=self.buyer, city='Moscow', street='Lenina', phone='7071016933')
+
+    def place_order(self):
+        order = Order.objects.create(user=self.buyer, contact=self.contact, state='new')
+        for shop in (self.shop, self.other_shop):
+            OrderItem.objects.create(order=order, product_info=ProductInfo.objects.filter(shop=shop).first(),
+                                     quantity=2)
+        outbox.publish('order.new', user_id=self.buyer.id, order_id=order.id,
+                       shop_ids=[self.shop.id, self.other_shop.id], product_ids=[])
+        return order
+
+    def test_partner_subscription(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.supplier).key)
+        response = self.client.post('/api/v1/partner/webhooks/', {'url': self.url}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(len(response.json()['secret']), 64)
+        self.assertEqual(ShopWebhook.objects.get().shop, self.shop)
+        self.assertEqual(self.client.get('/api/v1/partner/webhooks/').json()['results'][0]['url'], self.url)
+
+        shopless = User.objects.create_user(email='shop3@shop.ru', password='a1d2m3i4n5', type='shop')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=shopless).key)
+        response = self.client.post('/api/v1/partner/webhooks/', {'url': self.url}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(WEBHOOK_ALLOW_PRIVATE_HOSTS=False)
+    def test_private_hosts_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.supplier).key)
+        for url in (self.url, 'http://localhost/hook', 'http://10.0.0.5/hook', 'http://169.254.169.254/latest'):
+            response = self.client.post('/api/v1/partner/webhooks/', {'url': url}, format='json')
+            self.assertEqual(response.status_code, 400, url)
+            self.assertIn('url', response.json())
+
+        webhook = ShopWebhook.objects.create(shop=self.shop, url=self.url, secret='s' * 64)  # создана до проверки
+        delivery = WebhookDelivery.objects.create(webhook=webhook, order_ids=[], next_attempt_at=timezone.now())
+        self.assertIsNone(deliver(delivery.id))
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.state, 'failed')
+        self.assertIn('non-public address', delivery.last_error)
+        self.assertEqual(WebhookHandler.requests, [])
+
+    def test_batched_signed_delivery_with_retry(self):
+        webhook = ShopWebhook.objects.create(shop=self.shop, url=self.url, secret='s' * 64)
+        orders = [self.place_order(), self.place_order()]
+        outbox.relay()
+        delivery = WebhookDelivery.objects.get()  # оба заказа в одной пачке, у второго магазина подписки нет
+        self.assertEqual(delivery.order_ids, [order.id for order in orders])
+        self.assertGreater(delivery.next_attempt_at, timezone.now())
+        self.assertIsNone(deliver(delivery.id))  # окно пачки еще открыто
+        self.assertEqual(WebhookHandler.requests, [])
+
+        WebhookDelivery.objects.filter(id=delivery.id).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        WebhookHandler.statuses = [500]
+        self.assertGreater(deliver(delivery.id), 0)
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.state, delivery.attempts), ('pending', 1))
+        self.assertTrue(delivery.last_error.startswith('HTTP 500'))
+
+        WebhookDelivery.objects.filter(id=delivery.id).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(deliver(delivery.id))
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.state, delivery.attempts), ('delivered', 2))
+
+        (first_headers, first_body), (headers, body) = WebhookHandler.requests
+        self.assertEqual(first_body, body)  # повтор отправляет то же тело
+        expected = hmac.new(webhook.secret.encode(), f'{headers["X-Shop-Timestamp"]}.'.encode() + body,
+                            hashlib.sha256).hexdigest()
+        self.assertEqual(headers['X-Shop-Signature'], 'sha256=' + expected)
+        self.assertEqual(headers['X-Shop-Delivery'], str(delivery.id))
+        payload = json.loads(body)
+        self.assertEqual([order['id'] for order in payload['orders']], [order.id for order in orders])
+        shop_offers = set(ProductInfo.objects.filter(shop=self.shop).values_list('id', flat=True))
+        for order in payload['orders']:
+            self.assertEqual(len(order['items']), 1)  # только позиции магазина подписки
+            self.assertIn(order['items'][0]['product_info'], shop_offers)
+            self.assertEqual(order['contact']['city'], 'Moscow')